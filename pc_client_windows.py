@@ -4,8 +4,11 @@ H5 Barcode Gun - Windows PC客户端
 图形界面
 """
 
+import os
 import sys
 import logging
+from array import array
+from collections import deque
 from datetime import datetime
 from pathlib import Path
 import ctypes
@@ -44,10 +47,11 @@ def check_single_instance():
 from PyQt5.QtWidgets import (
     QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout,
     QLabel, QPushButton, QTextEdit, QMessageBox, QGroupBox,
-    QStatusBar, QSystemTrayIcon, QMenu, QAction, QStyle
+    QStatusBar, QSystemTrayIcon, QMenu, QAction, QStyle,
+    QTableView, QHeaderView, QLineEdit, QComboBox, QAbstractItemView
 )
-from PyQt5.QtCore import Qt, QTimer, pyqtSignal, QObject, pyqtSlot
-from PyQt5.QtGui import QIcon, QPixmap, QTextCursor
+from PyQt5.QtCore import Qt, QTimer, pyqtSignal, QObject, pyqtSlot, QAbstractTableModel, QModelIndex
+from PyQt5.QtGui import QIcon, QPixmap, QTextCursor, QColor
 
 # 导入二维码库
 import qrcode
@@ -57,6 +61,7 @@ project_dir = Path(__file__).parent
 sys.path.insert(0, str(project_dir))
 
 from utils.dual_server import BarcodeGunServer
+from utils.scan_store import COLUMNS, RecentScanStore
 
 # 配置日志
 logging.basicConfig(
@@ -69,6 +74,9 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# 在PC端提交盘点后，开始键盘输入前等待的秒数（切换到要填写的表格）
+COUNT_KEYBOARD_DELAY = 3
+
 
 class ServerThread(QObject):
     """服务器线程，管理服务器生命周期"""
@@ -130,6 +138,195 @@ class ServerThread(QObject):
             logger.debug(f"更新状态失败: {e}")
 
 
+class RecentScansModel(QAbstractTableModel):
+    """
+    最近扫码表格模型
+    只按可见行从RecentScanStore读取数据（QTableView只请求可见行），百万行也能流畅滚动。
+    扫码记录由服务器线程通过push()入队，界面定时器调用flush()批量插入。
+    排序和过滤在模型内完成：默认按时间倒序时不需要行映射，其他情况保存按显示顺序排列的序号。
+    """
+
+    HEADERS = ('时间', '手机', '条码', '状态', '延迟(ms)', '说明')
+    STATUS_LABELS = {
+        'success': '成功',
+        'counted': '盘点',
+        'duplicate': '重复',
+        'throttled': '限流',
+        'rejected': '拒绝',
+        'input_failed': '输入失败',
+        'other': '其他'
+    }
+    STATUS_COLORS = {
+        'success': QColor('#4CAF50'),
+        'counted': QColor('#2196F3'),
+        'duplicate': QColor('#FF9800'),
+        'throttled': QColor('#FF9800'),
+        'rejected': QColor('#F44336'),
+        'input_failed': QColor('#F44336')
+    }
+
+    def __init__(self, store, parent=None):
+        super().__init__(parent)
+        self.store = store
+        self._order = None            # None表示按时间倒序（最新在上），否则为显示顺序的序号
+        self._sort_column = 0
+        self._descending = True
+        self._filter_text = ''
+        self._filter_status = None
+        self._pending = deque()
+        self._cached = (None, None)   # 同一行的各列连续请求，缓存最近一行
+
+    def push(self, record):
+        """扫码记录入队（可在任意线程调用）"""
+        self._pending.append(record)
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self._order) if self._order is not None else len(self.store)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.HEADERS)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if orientation == Qt.Horizontal and role == Qt.DisplayRole:
+            return self.HEADERS[section]
+        return None
+
+    def _seq(self, row):
+        if self._order is None:
+            return self.store.next_seq - 1 - row
+        return self._order[row]
+
+    def _row(self, seq):
+        if self._cached[0] != seq:
+            self._cached = (seq, self.store.row(seq))
+        return self._cached[1]
+
+    def data(self, index, role=Qt.DisplayRole):
+        if role not in (Qt.DisplayRole, Qt.ForegroundRole, Qt.TextAlignmentRole):
+            return None
+        column = index.column()
+        if role == Qt.TextAlignmentRole:
+            return int(Qt.AlignRight | Qt.AlignVCenter) if column == 4 else None
+        row = self._row(self._seq(index.row()))
+        if role == Qt.ForegroundRole:
+            return self.STATUS_COLORS.get(row[3]) if column == 3 else None
+        value = row[column]
+        if column == 0:
+            return datetime.fromtimestamp(value).strftime('%m-%d %H:%M:%S.%f')[:-3]
+        if column == 3:
+            return self.STATUS_LABELS.get(value, value)
+        if column == 4:
+            return '' if value is None else f"{value:.0f}"
+        return value
+
+    def _filtering(self):
+        return bool(self._filter_text or self._filter_status)
+
+    def _sort_key(self, seq):
+        # 与store.sort_keys一致：未知延迟为-1
+        value = self.store.row(seq)[self._sort_column]
+        return -1 if value is None and self._sort_column == 4 else value
+
+    def sort(self, column, order=Qt.AscendingOrder):
+        self._sort_column = column
+        self._descending = order == Qt.DescendingOrder
+        self._rebuild()
+
+    def set_filter(self, text, status):
+        self._filter_text = text.strip()
+        self._filter_status = status or None
+        self._rebuild()
+
+    def _rebuild(self):
+        """重新计算显示顺序（排序或过滤条件变化时）"""
+        self.beginResetModel()
+        store = self.store
+        if not self._filtering() and self._sort_column == 0 and self._descending:
+            self._order = None
+        else:
+            if self._filtering():
+                seqs = store.filter(self._filter_text, self._filter_status)
+            else:
+                seqs = array('Q', range(store.base, store.next_seq))
+            if self._sort_column != 0:
+                keys = store.sort_keys(COLUMNS[self._sort_column])
+                base = store.base
+                seqs = array('Q', sorted(seqs, key=lambda seq: keys[seq - base], reverse=self._descending))
+            elif self._descending:
+                seqs.reverse()
+            self._order = seqs
+        self._cached = (None, None)
+        self.endResetModel()
+
+    def _insert_position(self, seq):
+        """按当前排序列二分查找新行的位置（相同值排在已有行之后）"""
+        key = self._sort_key(seq)
+        low, high = 0, len(self._order)
+        while low < high:
+            middle = (low + high) // 2
+            other = self._sort_key(self._order[middle])
+            if (other >= key) if self._descending else (other <= key):
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def flush(self):
+        """
+        把入队的扫码记录插入表格（界面线程调用）
+
+        Returns:
+            int: 插入的记录数
+        """
+        records = []
+        while self._pending:
+            records.append(self._pending.popleft())
+        if not records:
+            return 0
+
+        store = self.store
+        if self._order is None:
+            self.beginInsertRows(QModelIndex(), 0, len(records) - 1)
+            store.extend(records)
+            self.endInsertRows()
+        else:
+            first = store.next_seq
+            store.extend(records)
+            seqs = [seq for seq in range(first, store.next_seq)
+                    if not self._filtering() or store.matches(seq, self._filter_text, self._filter_status)]
+            if seqs and self._sort_column == 0:
+                if self._descending:
+                    self.beginInsertRows(QModelIndex(), 0, len(seqs) - 1)
+                    self._order[0:0] = array('Q', reversed(seqs))
+                else:
+                    self.beginInsertRows(QModelIndex(), len(self._order), len(self._order) + len(seqs) - 1)
+                    self._order.extend(seqs)
+                self.endInsertRows()
+            else:
+                for seq in seqs:
+                    position = self._insert_position(seq)
+                    self.beginInsertRows(QModelIndex(), position, position)
+                    self._order.insert(position, seq)
+                    self.endInsertRows()
+
+        # 超过上限时丢弃最早的记录：按时间排序时它们是连续的行，其他排序下重建映射
+        while store.excess():
+            if self._order is None:
+                count = len(store)
+                self.beginRemoveRows(QModelIndex(), count - store.excess(), count - 1)
+                store.trim()
+                self.endRemoveRows()
+            else:
+                self.beginResetModel()
+                store.trim()
+                self._order = array('Q', (seq for seq in self._order if seq >= store.base))
+                self._cached = (None, None)
+                self.endResetModel()
+        return len(records)
+
+
 class PCClientWindow(QMainWindow):
     """主窗口类"""
 
@@ -162,7 +359,9 @@ class PCClientWindow(QMainWindow):
         self.show()
         self.log("H5 扫码枪客户端已启动", "info")
         self.log("请点击\"启动服务器\"按钮开始\n", "info")
-        self.log("请记得切换英文输入法，否则扫码后自动回车效果无效！！！", "warning")
+        # keymap输入后端在输入法处于中文模式时使用Unicode直接输入，不需要切换输入法
+        if os.getenv('KEYBOARD_BACKEND', 'auto') not in ('auto', 'keymap'):
+            self.log("请记得切换英文输入法，否则扫码后自动回车效果无效！！！", "warning")
 
     def init_ui(self):
         """初始化UI"""
@@ -223,6 +422,25 @@ class PCClientWindow(QMainWindow):
         server_group.setLayout(server_layout)
         left_layout.addWidget(server_group)
 
+        # 盘点模式：扫码只计数，提交时每个条码输入一行数量
+        count_group = QGroupBox("盘点模式")
+        count_layout = QVBoxLayout()
+        self.lbl_count_state = QLabel("未开启")
+        count_layout.addWidget(self.lbl_count_state)
+        count_button_layout = QHBoxLayout()
+        self.btn_count_start = QPushButton("开始盘点")
+        self.btn_count_start.clicked.connect(self.on_count_start_clicked)
+        self.btn_count_commit = QPushButton("提交")
+        self.btn_count_commit.clicked.connect(self.on_count_commit_clicked)
+        self.btn_count_discard = QPushButton("放弃")
+        self.btn_count_discard.clicked.connect(self.on_count_discard_clicked)
+        for button in (self.btn_count_start, self.btn_count_commit, self.btn_count_discard):
+            button.setEnabled(False)
+            count_button_layout.addWidget(button)
+        count_layout.addLayout(count_button_layout)
+        count_group.setLayout(count_layout)
+        left_layout.addWidget(count_group)
+
         # 二维码显示区域
         qr_group = QGroupBox("手机端访问二维码")
         qr_layout = QVBoxLayout()
@@ -248,10 +466,70 @@ class PCClientWindow(QMainWindow):
         # 添加拉伸区域
         left_layout.addStretch()
 
-        # 右侧：日志面板
+        # 右侧：最近扫码表格 + 日志面板
         right_panel = QWidget()
         right_layout = QVBoxLayout(right_panel)
 
+        scans_group = QGroupBox("最近扫码")
+        scans_layout = QVBoxLayout()
+
+        filter_layout = QHBoxLayout()
+        self.scan_filter_edit = QLineEdit()
+        self.scan_filter_edit.setPlaceholderText("搜索条码 / 手机 / 说明")
+        self.scan_filter_edit.setClearButtonEnabled(True)
+        filter_layout.addWidget(self.scan_filter_edit, 1)
+        self.scan_status_combo = QComboBox()
+        self.scan_status_combo.addItem("全部状态", None)
+        for status, label in RecentScansModel.STATUS_LABELS.items():
+            self.scan_status_combo.addItem(label, status)
+        filter_layout.addWidget(self.scan_status_combo)
+        self.lbl_scan_count = QLabel("共 0 条")
+        filter_layout.addWidget(self.lbl_scan_count)
+        scans_layout.addLayout(filter_layout)
+
+        # 较早的扫码暂存到磁盘，内存中只保留最近 RECENT_SCANS_MEMORY_ROWS 行的条码文本
+        self.scan_store = RecentScanStore(
+            max_rows=int(os.getenv('RECENT_SCANS_MAX_ROWS', '1000000')),
+            memory_rows=int(os.getenv('RECENT_SCANS_MEMORY_ROWS', '100000')),
+            spill=os.getenv('RECENT_SCANS_SPILL', 'true').lower() == 'true'
+        )
+        self.scan_model = RecentScansModel(self.scan_store, self)
+
+        self.scan_table = QTableView()
+        self.scan_table.setModel(self.scan_model)
+        self.scan_table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.scan_table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.scan_table.setAlternatingRowColors(True)
+        self.scan_table.setWordWrap(False)
+        # 固定行高、不按内容调整列宽，避免视图遍历全部行
+        vertical_header = self.scan_table.verticalHeader()
+        vertical_header.setVisible(False)
+        vertical_header.setSectionResizeMode(QHeaderView.Fixed)
+        vertical_header.setDefaultSectionSize(22)
+        horizontal_header = self.scan_table.horizontalHeader()
+        horizontal_header.setStretchLastSection(True)
+        for column, width in enumerate((130, 110, 150, 70, 70)):
+            self.scan_table.setColumnWidth(column, width)
+        horizontal_header.setSortIndicator(0, Qt.DescendingOrder)
+        self.scan_table.setSortingEnabled(True)
+        scans_layout.addWidget(self.scan_table)
+
+        scans_group.setLayout(scans_layout)
+        right_layout.addWidget(scans_group, 3)
+
+        # 输入停顿后再过滤，百万行时过滤需要几百毫秒
+        self.scan_filter_timer = QTimer(self)
+        self.scan_filter_timer.setSingleShot(True)
+        self.scan_filter_timer.setInterval(300)
+        self.scan_filter_timer.timeout.connect(self.apply_scan_filter)
+        self.scan_filter_edit.textChanged.connect(self.scan_filter_timer.start)
+        self.scan_status_combo.currentIndexChanged.connect(self.apply_scan_filter)
+
+        # 定时把服务器线程送来的扫码记录批量插入表格
+        self.scan_flush_timer = QTimer(self)
+        self.scan_flush_timer.timeout.connect(self.flush_scans)
+        self.scan_flush_timer.start(250)
+
         log_group = QGroupBox("系统日志")
         log_layout = QVBoxLayout()
 
@@ -260,7 +538,7 @@ class PCClientWindow(QMainWindow):
         log_layout.addWidget(self.log_text)
 
         log_group.setLayout(log_layout)
-        right_layout.addWidget(log_group)
+        right_layout.addWidget(log_group, 2)
 
         # 添加状态栏
         self.status_bar = QStatusBar()
@@ -269,7 +547,7 @@ class PCClientWindow(QMainWindow):
 
         # 将面板添加到主布局
         self.main_layout.addWidget(left_panel, 1)
-        self.main_layout.addWidget(right_panel, 1)
+        self.main_layout.addWidget(right_panel, 2)
 
     def init_server_thread(self):
         """初始化服务器线程"""
@@ -346,6 +624,21 @@ class PCClientWindow(QMainWindow):
         cursor.movePosition(QTextCursor.End)
         self.log_text.setTextCursor(cursor)
 
+    def apply_scan_filter(self):
+        """按搜索文字和状态过滤最近扫码"""
+        self.scan_model.set_filter(self.scan_filter_edit.text(), self.scan_status_combo.currentData())
+        self.update_scan_count()
+
+    def flush_scans(self):
+        """把新的扫码记录插入表格"""
+        if self.scan_model.flush():
+            self.update_scan_count()
+
+    def update_scan_count(self):
+        shown = self.scan_model.rowCount()
+        total = len(self.scan_store)
+        self.lbl_scan_count.setText(f"共 {total} 条" if shown == total else f"{shown} / {total} 条")
+
     def on_start_server_clicked(self):
         """点击启动服务器按钮"""
         self.btn_start_server.setEnabled(False)
@@ -383,6 +676,7 @@ class PCClientWindow(QMainWindow):
                 port=port,
                 barcode_callback=self.on_barcode_received
             )
+            self.server_thread.server.add_scan_listener(self.scan_model.push)
             self.server_thread.running = True
 
             # 启动定时器
@@ -416,6 +710,49 @@ class PCClientWindow(QMainWindow):
         """点击停止服务器按钮"""
         self.server_thread.stop_server()
 
+    def on_count_start_clicked(self):
+        """开始盘点"""
+        self.update_count_state(self.server_thread.server.start_count())
+        self.log("盘点模式已开启，扫码只计数，提交后输入各条码数量", "info")
+
+    def on_count_commit_clicked(self):
+        """提交盘点"""
+        state = self.server_thread.server.inventory.state()
+        reply = QMessageBox.question(self, "提交盘点", f"提交 {state['skus']} 种商品，共 {state['total']} 件？\n"
+                                     f"确认后窗口将最小化，{COUNT_KEYBOARD_DELAY}秒后开始输入，请切换到要填写的表格。")
+        if reply != QMessageBox.Yes:
+            return
+        result = self.server_thread.server.commit_count(keyboard_delay=COUNT_KEYBOARD_DELAY)
+        if result:
+            self.log(f"盘点已提交: {result['skus']} 种，共 {result['total']} 件"
+                     + (f"，已保存到 {result['file']}" if result.get('file') else ""), "success")
+            if result.get('error'):
+                self.log(result['error'], "error")
+            # 最小化后焦点回到之前的程序
+            self.showMinimized()
+        self.update_count_state(self.server_thread.server.inventory.state())
+
+    def on_count_discard_clicked(self):
+        """放弃盘点"""
+        reply = QMessageBox.question(self, "放弃盘点", "放弃本次盘点？已计数的结果将被清除。")
+        if reply != QMessageBox.Yes:
+            return
+        self.server_thread.server.discard_count()
+        self.log("盘点已放弃", "warning")
+        self.update_count_state(self.server_thread.server.inventory.state())
+
+    def update_count_state(self, state):
+        """刷新盘点状态显示；state为None表示服务器未运行"""
+        active = bool(state and state.get('active'))
+        if active:
+            self.lbl_count_state.setText(f"<span style='color: #2196F3;'>盘点中</span>: "
+                                         f"{state['skus']} 种，共 {state['total']} 件")
+        else:
+            self.lbl_count_state.setText("未开启")
+        self.btn_count_start.setEnabled(state is not None and not active)
+        self.btn_count_commit.setEnabled(active)
+        self.btn_count_discard.setEnabled(active)
+
     @pyqtSlot(str, int)
     def on_server_started(self, host, port):
         """服务器已启动"""
@@ -437,6 +774,7 @@ class PCClientWindow(QMainWindow):
 
         # 生成并显示二维码
         self.generate_qr_code(server_url)
+        self.update_count_state(info.get('inventory'))
 
         # # 自动连接客户端
 
@@ -452,6 +790,7 @@ class PCClientWindow(QMainWindow):
         self.lbl_server_url.setText("HTTP地址: -")
         self.lbl_ws_url.setText("WebSocket地址：-")
         self.lbl_mobile_clients.setText("H5连接数: 0")
+        self.update_count_state(None)
         self.status_bar.showMessage("服务器已停止")
         self.log("服务器已停止", 'warning')
 
@@ -466,7 +805,7 @@ class PCClientWindow(QMainWindow):
             self.lbl_server_url.setText(f"HTTP地址：https://{local_ip}:{port}")
             self.lbl_ws_url.setText(f"WebSocket地址: wss://{local_ip}:{port}")
             self.lbl_mobile_clients.setText(f"H5连接数: {info.get('mobile_clients', 0)}")
-
+            self.update_count_state(info.get('inventory'))
 
     @pyqtSlot(str)
     def on_barcode_received(self, barcode):
@@ -553,6 +892,8 @@ class PCClientWindow(QMainWindow):
 
         # 明确处理每个返回值
         if reply == QMessageBox.Yes:
+            # 删除最近扫码的磁盘暂存文件
+            self.scan_store.close()
             # 停止服务器（安全方式，避免立即终止导致卡死）
             if self.server_thread.running:
                 logger.info("用户确认退出应用程序，正在安全关闭...")
@@ -594,6 +935,9 @@ def main():
 
 
 if __name__ == '__main__':
+    # 打包后服务器端帧解码的进程池需要
+    import multiprocessing
+    multiprocessing.freeze_support()
     try:
         main()
     except Exception as e:
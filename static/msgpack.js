@@ -0,0 +1,206 @@
+/*!
+ * H5 扫码枪 - 精简 MessagePack 编解码
+ * 支持 nil / bool / 整数(53位以内) / float64 / str / bin / array / map，
+ * 用于Socket.IO二进制附件消息。
+ */
+(function (root) {
+    'use strict';
+
+    const textEncoder = new TextEncoder();
+    const textDecoder = new TextDecoder();
+
+    function encode(value) {
+        const bytes = [];
+        write(bytes, value);
+        return new Uint8Array(bytes);
+    }
+
+    function pushUint(bytes, value, size) {
+        for (let i = size - 1; i >= 0; i--) {
+            bytes.push(Math.floor(value / Math.pow(256, i)) & 0xff);
+        }
+    }
+
+    function writeFloat64(bytes, value) {
+        const view = new DataView(new ArrayBuffer(8));
+        view.setFloat64(0, value);
+        bytes.push(0xcb);
+        for (let i = 0; i < 8; i++) {
+            bytes.push(view.getUint8(i));
+        }
+    }
+
+    function writeInt(bytes, value) {
+        if (value >= 0) {
+            if (value < 0x80) {
+                bytes.push(value);
+            } else if (value < 0x100) {
+                bytes.push(0xcc, value);
+            } else if (value < 0x10000) {
+                bytes.push(0xcd);
+                pushUint(bytes, value, 2);
+            } else if (value < 0x100000000) {
+                bytes.push(0xce);
+                pushUint(bytes, value, 4);
+            } else {
+                bytes.push(0xcf);
+                pushUint(bytes, value, 8);
+            }
+        } else if (value >= -32) {
+            bytes.push(value & 0xff);
+        } else if (value >= -0x80) {
+            bytes.push(0xd0, value & 0xff);
+        } else if (value >= -0x8000) {
+            bytes.push(0xd1);
+            pushUint(bytes, value & 0xffff, 2);
+        } else if (value >= -0x80000000) {
+            bytes.push(0xd2);
+            pushUint(bytes, value >>> 0, 4);
+        } else {
+            // 超出32位的负数按float64编码
+            writeFloat64(bytes, value);
+        }
+    }
+
+    function writeLength(bytes, length, fix, fixMax, codes) {
+        if (fix !== null && length <= fixMax) {
+            bytes.push(fix | length);
+        } else if (codes[0] !== null && length < 0x100) {
+            bytes.push(codes[0], length);
+        } else if (length < 0x10000) {
+            bytes.push(codes[1]);
+            pushUint(bytes, length, 2);
+        } else {
+            bytes.push(codes[2]);
+            pushUint(bytes, length, 4);
+        }
+    }
+
+    function write(bytes, value) {
+        if (value === null || value === undefined) {
+            bytes.push(0xc0);
+        } else if (value === true) {
+            bytes.push(0xc3);
+        } else if (value === false) {
+            bytes.push(0xc2);
+        } else if (typeof value === 'number') {
+            if (Number.isSafeInteger(value)) {
+                writeInt(bytes, value);
+            } else {
+                writeFloat64(bytes, value);
+            }
+        } else if (typeof value === 'string') {
+            const data = textEncoder.encode(value);
+            writeLength(bytes, data.length, 0xa0, 31, [0xd9, 0xda, 0xdb]);
+            for (let i = 0; i < data.length; i++) {
+                bytes.push(data[i]);
+            }
+        } else if (value instanceof Uint8Array || value instanceof ArrayBuffer) {
+            const data = value instanceof ArrayBuffer ? new Uint8Array(value) : value;
+            writeLength(bytes, data.length, null, 0, [0xc4, 0xc5, 0xc6]);
+            for (let i = 0; i < data.length; i++) {
+                bytes.push(data[i]);
+            }
+        } else if (Array.isArray(value)) {
+            writeLength(bytes, value.length, 0x90, 15, [null, 0xdc, 0xdd]);
+            value.forEach(item => write(bytes, item));
+        } else if (typeof value === 'object') {
+            const keys = Object.keys(value).filter(key => value[key] !== undefined);
+            writeLength(bytes, keys.length, 0x80, 15, [null, 0xde, 0xdf]);
+            keys.forEach(key => {
+                write(bytes, key);
+                write(bytes, value[key]);
+            });
+        } else {
+            throw new Error('msgpack: 不支持的类型 ' + typeof value);
+        }
+    }
+
+    function decode(buffer) {
+        const data = buffer instanceof Uint8Array ? buffer : new Uint8Array(buffer);
+        const view = new DataView(data.buffer, data.byteOffset, data.byteLength);
+        let offset = 0;
+
+        function readUint(size) {
+            let value = 0;
+            for (let i = 0; i < size; i++) {
+                value = value * 256 + data[offset++];
+            }
+            return value;
+        }
+
+        function readStr(length) {
+            const value = textDecoder.decode(data.subarray(offset, offset + length));
+            offset += length;
+            return value;
+        }
+
+        function readBin(length) {
+            const value = data.slice(offset, offset + length);
+            offset += length;
+            return value;
+        }
+
+        function readArray(length) {
+            const value = new Array(length);
+            for (let i = 0; i < length; i++) {
+                value[i] = read();
+            }
+            return value;
+        }
+
+        function readMap(length) {
+            const value = {};
+            for (let i = 0; i < length; i++) {
+                const key = read();
+                value[key] = read();
+            }
+            return value;
+        }
+
+        function read() {
+            const type = data[offset++];
+            if (type < 0x80) return type;
+            if (type < 0x90) return readMap(type & 0x0f);
+            if (type < 0xa0) return readArray(type & 0x0f);
+            if (type < 0xc0) return readStr(type & 0x1f);
+            if (type >= 0xe0) return type - 0x100;
+
+            let value;
+            switch (type) {
+                case 0xc0: return null;
+                case 0xc2: return false;
+                case 0xc3: return true;
+                case 0xc4: return readBin(readUint(1));
+                case 0xc5: return readBin(readUint(2));
+                case 0xc6: return readBin(readUint(4));
+                case 0xca: value = view.getFloat32(offset); offset += 4; return value;
+                case 0xcb: value = view.getFloat64(offset); offset += 8; return value;
+                case 0xcc: return readUint(1);
+                case 0xcd: return readUint(2);
+                case 0xce: return readUint(4);
+                case 0xcf: return readUint(8);
+                case 0xd0: value = view.getInt8(offset); offset += 1; return value;
+                case 0xd1: value = view.getInt16(offset); offset += 2; return value;
+                case 0xd2: value = view.getInt32(offset); offset += 4; return value;
+                case 0xd3:
+                    value = view.getInt32(offset) * 4294967296 + view.getUint32(offset + 4);
+                    offset += 8;
+                    return value;
+                case 0xd9: return readStr(readUint(1));
+                case 0xda: return readStr(readUint(2));
+                case 0xdb: return readStr(readUint(4));
+                case 0xdc: return readArray(readUint(2));
+                case 0xdd: return readArray(readUint(4));
+                case 0xde: return readMap(readUint(2));
+                case 0xdf: return readMap(readUint(4));
+                default:
+                    throw new Error('msgpack: 不支持的类型 0x' + type.toString(16));
+            }
+        }
+
+        return read();
+    }
+
+    root.msgpack = { encode: encode, decode: decode };
+})(typeof window !== 'undefined' ? window : this);
@@ -0,0 +1,550 @@
+#!/usr/bin/env python3
+"""
+条码校验与转换规则引擎
+支持EAN-8/13、UPC-A、ITF-14校验位验证，GS1应用标识符(AI)解析，
+以及前缀/后缀的去除与添加。规则从JSON文件加载，启动时编译为分发表。
+"""
+
+import json
+import logging
+import re
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# 纯数字条码长度 -> 码制
+SYMBOLOGY_BY_LENGTH = {
+    8: 'ean8',
+    12: 'upca',
+    13: 'ean13',
+    14: 'itf14',
+}
+
+# GS1分隔符（FNC1在扫码结果中通常表现为GS字符）
+GS1_GROUP_SEPARATOR = '\x1d'
+
+# GS1符号标识符前缀（AIM ID）
+GS1_AIM_PREFIXES = (']C1', ']e0', ']d2', ']Q3', ']J1')
+
+# 常用GS1应用标识符: AI -> (名称, 定长长度, 最大长度)
+# 定长AI的定长长度为数据部分长度；变长AI的定长长度为None
+GS1_AI_TABLE = {
+    '00': ('SSCC', 18, 18),
+    '01': ('GTIN', 14, 14),
+    '02': ('CONTENT', 14, 14),
+    '10': ('BATCH/LOT', None, 20),
+    '11': ('PROD DATE', 6, 6),
+    '12': ('DUE DATE', 6, 6),
+    '13': ('PACK DATE', 6, 6),
+    '15': ('BEST BEFORE', 6, 6),
+    '16': ('SELL BY', 6, 6),
+    '17': ('USE BY', 6, 6),
+    '20': ('VARIANT', 2, 2),
+    '21': ('SERIAL', None, 20),
+    '22': ('CPV', None, 20),
+    '240': ('ADDITIONAL ID', None, 30),
+    '241': ('CUST. PART No.', None, 30),
+    '250': ('SECONDARY SERIAL', None, 30),
+    '251': ('REF. TO SOURCE', None, 30),
+    '30': ('VAR. COUNT', None, 8),
+    '37': ('COUNT', None, 8),
+    '400': ('ORDER NUMBER', None, 30),
+    '410': ('SHIP TO LOC', 13, 13),
+    '411': ('BILL TO', 13, 13),
+    '412': ('PURCHASE FROM', 13, 13),
+    '413': ('SHIP FOR LOC', 13, 13),
+    '414': ('LOC No.', 13, 13),
+    '415': ('PAY TO', 13, 13),
+    '420': ('SHIP TO POST', None, 20),
+}
+
+# 31xx-36xx 计量类AI（4位AI，6位定长数据）
+_GS1_MEASURE_AI = re.compile(r'^3[1-6]\d\d$')
+
+# 90-99 企业内部AI（变长，最多30位）
+_GS1_INTERNAL_AI = re.compile(r'^9\d$')
+
+_PAREN_AI_PATTERN = re.compile(r'\((\d{2,4})\)([^(]*)')
+
+
+class RuleRejected(Exception):
+    """条码未通过规则校验"""
+
+    def __init__(self, rule_name, message):
+        super().__init__(message)
+        self.rule_name = rule_name
+        self.message = message
+
+
+def gtin_check_digit(digits):
+    """
+    计算GTIN系列（EAN-8/13、UPC-A、ITF-14）的校验位
+
+    Args:
+        digits: 不含校验位的数字字符串
+
+    Returns:
+        int: 校验位
+    """
+    total = 0
+    # 从最右侧数据位开始，权重依次为3、1、3、1...
+    for i, ch in enumerate(reversed(digits)):
+        total += (ord(ch) - 48) * (3 if i % 2 == 0 else 1)
+    return (10 - total % 10) % 10
+
+
+def validate_gtin(code):
+    """
+    验证GTIN系列条码的校验位
+
+    Args:
+        code: 完整的数字条码（包含校验位）
+
+    Returns:
+        bool: 校验位是否正确
+    """
+    if not code.isdigit() or len(code) not in SYMBOLOGY_BY_LENGTH:
+        return False
+    return gtin_check_digit(code[:-1]) == ord(code[-1]) - 48
+
+
+def detect_symbology(code):
+    """
+    根据内容推断码制
+
+    Returns:
+        str: 码制名称（ean8/upca/ean13/itf14/gs1），无法识别时返回None
+    """
+    if code.isdigit():
+        return SYMBOLOGY_BY_LENGTH.get(len(code))
+    if code.startswith(GS1_AIM_PREFIXES) or GS1_GROUP_SEPARATOR in code or code.startswith('('):
+        return 'gs1'
+    return None
+
+
+def _lookup_ai(data, pos):
+    """在pos位置匹配GS1应用标识符，返回(ai, 名称, 定长, 最大长度)"""
+    for size in (2, 3, 4):
+        ai = data[pos:pos + size]
+        if len(ai) < size:
+            break
+        if ai in GS1_AI_TABLE:
+            name, fixed, maximum = GS1_AI_TABLE[ai]
+            return ai, name, fixed, maximum
+        if size == 4 and _GS1_MEASURE_AI.match(ai):
+            return ai, 'MEASURE', 6, 6
+        if size == 2 and _GS1_INTERNAL_AI.match(ai):
+            return ai, 'INTERNAL', None, 30
+    return None
+
+
+def parse_gs1(code):
+    """
+    解析GS1元素串
+
+    支持以下形式：
+    - 带AIM前缀的原始数据，如 ']C10109501101530003\\x1d10ABC'
+    - 以GS字符分隔变长字段的原始数据
+    - 括号形式，如 '(01)09501101530003(10)ABC'
+
+    Args:
+        code: 扫码得到的GS1元素串
+
+    Returns:
+        dict: AI -> 数据
+
+    Raises:
+        ValueError: 元素串格式错误
+    """
+    for prefix in GS1_AIM_PREFIXES:
+        if code.startswith(prefix):
+            code = code[len(prefix):]
+            break
+
+    fields = {}
+
+    if code.startswith('('):
+        for ai, value in _PAREN_AI_PATTERN.findall(code):
+            fields[ai] = value
+        if not fields:
+            raise ValueError('无法解析括号形式的GS1元素串')
+    else:
+        data = code.lstrip(GS1_GROUP_SEPARATOR)
+        pos = 0
+        length = len(data)
+        while pos < length:
+            match = _lookup_ai(data, pos)
+            if not match:
+                raise ValueError(f"未知的GS1应用标识符 (位置 {pos})")
+            ai, _name, fixed, maximum = match
+            pos += len(ai)
+            if fixed is not None:
+                value = data[pos:pos + fixed]
+                if len(value) != fixed:
+                    raise ValueError(f"AI({ai}) 数据长度不足")
+                pos += fixed
+            else:
+                end = data.find(GS1_GROUP_SEPARATOR, pos)
+                if end < 0:
+                    end = length
+                value = data[pos:end]
+                if len(value) > maximum:
+                    raise ValueError(f"AI({ai}) 数据超过最大长度 {maximum}")
+                pos = end
+            if pos < length and data[pos] == GS1_GROUP_SEPARATOR:
+                pos += 1
+            fields[ai] = value
+
+    gtin = fields.get('01')
+    if gtin is not None and not validate_gtin(gtin):
+        raise ValueError(f"AI(01) GTIN校验位错误: {gtin}")
+
+    return fields
+
+
+class CompiledRule:
+    """编译后的单条规则"""
+
+    __slots__ = ('name', 'type', 'match', 'func', 'hits', 'rejects', 'total_ns')
+
+    def __init__(self, name, rule_type, match, func):
+        self.name = name
+        self.type = rule_type
+        self.match = match
+        self.func = func
+        self.hits = 0
+        self.rejects = 0
+        self.total_ns = 0
+
+    def get_stats(self):
+        """获取规则统计"""
+        return {
+            'name': self.name,
+            'type': self.type,
+            'hits': self.hits,
+            'rejects': self.rejects,
+            'avg_us': round(self.total_ns / self.hits / 1000, 2) if self.hits else 0
+        }
+
+
+def _compile_checksum(rule):
+    symbologies = set(rule.get('symbologies') or SYMBOLOGY_BY_LENGTH.values())
+    lengths = frozenset(n for n, s in SYMBOLOGY_BY_LENGTH.items() if s in symbologies)
+    name = rule['name']
+
+    def apply(code, context):
+        if len(code) in lengths and code.isdigit():
+            context['symbology'] = SYMBOLOGY_BY_LENGTH[len(code)]
+            if gtin_check_digit(code[:-1]) != ord(code[-1]) - 48:
+                raise RuleRejected(name, f"{context['symbology'].upper()} 校验位错误")
+        return code
+
+    return apply
+
+
+def _compile_gs1(rule):
+    name = rule['name']
+    output_ai = rule.get('output_ai')
+    required = tuple(rule.get('required', ()))
+
+    def apply(code, context):
+        if detect_symbology(code) != 'gs1':
+            return code
+        try:
+            fields = parse_gs1(code)
+        except ValueError as e:
+            raise RuleRejected(name, str(e))
+        for ai in required:
+            if ai not in fields:
+                raise RuleRejected(name, f"缺少必需的AI({ai})")
+        context['symbology'] = 'gs1'
+        context['gs1'] = fields
+        # 可选：只输出某个AI的数据（例如只输入GTIN）
+        if output_ai and output_ai in fields:
+            return fields[output_ai]
+        return code
+
+    return apply
+
+
+def _compile_strip_prefix(rule):
+    value = rule['value']
+    size = len(value)
+
+    def apply(code, context):
+        return code[size:] if code.startswith(value) else code
+
+    return apply
+
+
+def _compile_strip_suffix(rule):
+    value = rule['value']
+    size = len(value)
+
+    def apply(code, context):
+        return code[:-size] if size and code.endswith(value) else code
+
+    return apply
+
+
+def _compile_add_prefix(rule):
+    value = rule['value']
+
+    def apply(code, context):
+        return code if code.startswith(value) else value + code
+
+    return apply
+
+
+def _compile_add_suffix(rule):
+    value = rule['value']
+
+    def apply(code, context):
+        return code if code.endswith(value) else code + value
+
+    return apply
+
+
+def _compile_regex(rule):
+    name = rule['name']
+    pattern = re.compile(rule['pattern'])
+    message = rule.get('message', '条码格式不匹配')
+
+    def apply(code, context):
+        if not pattern.fullmatch(code):
+            raise RuleRejected(name, message)
+        return code
+
+    return apply
+
+
+# 规则类型 -> 编译函数
+RULE_COMPILERS = {
+    'checksum': _compile_checksum,
+    'gs1': _compile_gs1,
+    'strip_prefix': _compile_strip_prefix,
+    'strip_suffix': _compile_strip_suffix,
+    'add_prefix': _compile_add_prefix,
+    'add_suffix': _compile_add_suffix,
+    'regex': _compile_regex,
+}
+
+
+class BarcodeRuleEngine:
+    """
+    条码规则引擎
+
+    规则文件格式(JSON):
+        {
+            "rules": [
+                {"name": "去除AIM前缀", "type": "strip_prefix", "value": "]E0"},
+                {"name": "EAN/UPC校验", "type": "checksum", "symbologies": ["ean13", "upca"]},
+                {"name": "GS1解析", "type": "gs1", "required": ["01"]},
+                {"name": "仓库前缀", "type": "add_prefix", "value": "WH-", "match": "^\\\\d+$"}
+            ]
+        }
+
+    每条规则可以指定 match（正则），只对匹配的条码生效。
+    规则按顺序执行，任意规则拒绝则整个条码被拒绝。
+    """
+
+    def __init__(self, rules=None):
+        self._rules = ()
+        self._lock = threading.Lock()
+        self.compile(rules or [])
+
+    @classmethod
+    def from_file(cls, path):
+        """
+        从JSON规则文件创建引擎
+
+        Args:
+            path: 规则文件路径
+
+        Returns:
+            BarcodeRuleEngine: 规则引擎实例
+        """
+        with open(path, 'r', encoding='utf-8') as f:
+            config = json.load(f)
+        rules = config.get('rules', []) if isinstance(config, dict) else config
+        engine = cls(rules)
+        logger.info(f"已加载条码规则 {len(engine._rules)} 条: {path}")
+        return engine
+
+    def compile(self, rules):
+        """
+        将规则配置编译为分发表
+
+        Args:
+            rules: 规则配置列表
+
+        Raises:
+            ValueError: 规则类型未知或配置缺失
+        """
+        compiled = []
+        for index, rule in enumerate(rules):
+            rule = dict(rule)
+            rule_type = rule.get('type')
+            rule.setdefault('name', f"{rule_type}#{index}")
+            compiler = RULE_COMPILERS.get(rule_type)
+            if compiler is None:
+                raise ValueError(f"未知的规则类型: {rule_type}")
+            try:
+                func = compiler(rule)
+            except KeyError as e:
+                raise ValueError(f"规则 {rule['name']} 缺少配置项: {e}")
+            match = re.compile(rule['match']).search if rule.get('match') else None
+            compiled.append(CompiledRule(rule['name'], rule_type, match, func))
+        self._rules = tuple(compiled)
+
+    def apply(self, barcode):
+        """
+        对条码依次执行所有规则
+
+        Args:
+            barcode: 原始条码
+
+        Returns:
+            tuple: (转换后的条码, 上下文信息dict)
+
+        Raises:
+            RuleRejected: 条码被某条规则拒绝
+        """
+        context = {}
+        code = barcode
+        perf_counter_ns = time.perf_counter_ns
+        for rule in self._rules:
+            if rule.match is not None and not rule.match(code):
+                continue
+            start = perf_counter_ns()
+            rejected = False
+            try:
+                code = rule.func(code, context)
+            except RuleRejected:
+                rejected = True
+                raise
+            finally:
+                elapsed = perf_counter_ns() - start
+                # 多个处理线程同时执行规则，只在更新统计时加锁（规则本身不持锁执行）
+                with self._lock:
+                    rule.hits += 1
+                    rule.total_ns += elapsed
+                    if rejected:
+                        rule.rejects += 1
+        return code, context
+
+    def get_stats(self):
+        """获取所有规则的命中次数与平均耗时"""
+        with self._lock:
+            return [rule.get_stats() for rule in self._rules]
+
+    def __len__(self):
+        return len(self._rules)
+
+
+def _require_numpy():
+    try:
+        import numpy
+        return numpy
+    except ImportError as e:
+        logger.error(f"无法导入numpy: {e}")
+        raise ImportError(
+            "批量校验需要numpy。请使用: pip install numpy"
+        )
+
+
+def bulk_validate_gtin(codes):
+    """
+    批量验证GTIN校验位（向量化实现，适用于百万级条码列表）
+
+    相同长度的条码被分组为二维数字矩阵，一次完成加权求和与校验。
+
+    Args:
+        codes: 条码字符串序列
+
+    Returns:
+        numpy.ndarray: 与输入等长的布尔数组，True表示校验通过
+    """
+    np = _require_numpy()
+
+    codes = list(codes)
+    result = np.zeros(len(codes), dtype=bool)
+    if not codes:
+        return result
+
+    # 按长度分组
+    groups = {}
+    for index, code in enumerate(codes):
+        if len(code) in SYMBOLOGY_BY_LENGTH:
+            groups.setdefault(len(code), []).append(index)
+
+    for length, indices in groups.items():
+        indices = np.asarray(indices, dtype=np.int64)
+        joined = ''.join(codes[i] for i in indices).encode('ascii', 'replace')
+        digits = np.frombuffer(joined, dtype=np.uint8).reshape(-1, length).astype(np.int16) - 48
+
+        # 非数字字符所在行直接判定失败
+        is_digit = ((digits >= 0) & (digits <= 9)).all(axis=1)
+
+        # 权重：从校验位左侧开始依次为3、1、3、1...
+        weights = np.where(np.arange(length - 1)[::-1] % 2 == 0, 3, 1).astype(np.int16)
+        expected = (10 - (digits[:, :-1] @ weights) % 10) % 10
+
+        result[indices] = is_digit & (expected == digits[:, -1])
+
+    return result
+
+
+def bulk_validate_file(path):
+    """
+    批量验证文件中的条码（每行一个）
+
+    Args:
+        path: 条码列表文件路径
+
+    Returns:
+        dict: 统计结果（total/valid/invalid）与前若干个无效条码
+    """
+    np = _require_numpy()
+    with open(path, 'r', encoding='utf-8') as f:
+        codes = [line.strip() for line in f if line.strip()]
+    valid = bulk_validate_gtin(codes)
+    invalid_indices = np.flatnonzero(~valid)
+    return {
+        'total': len(codes),
+        'valid': int(valid.sum()),
+        'invalid': int(len(invalid_indices)),
+        'invalid_samples': [codes[i] for i in invalid_indices[:20]]
+    }
+
+
+if __name__ == '__main__':
+    import argparse
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s'
+    )
+
+    parser = argparse.ArgumentParser(description='条码规则引擎')
+    parser.add_argument('--rules', help='规则文件路径(JSON)')
+    parser.add_argument('--bulk', help='批量校验条码列表文件（每行一个）')
+    parser.add_argument('codes', nargs='*', help='要测试的条码')
+
+    args = parser.parse_args()
+
+    if args.bulk:
+        print(json.dumps(bulk_validate_file(args.bulk), ensure_ascii=False, indent=2))
+
+    if args.codes:
+        engine = BarcodeRuleEngine.from_file(args.rules) if args.rules else BarcodeRuleEngine(
+            [{'type': 'checksum'}, {'type': 'gs1'}]
+        )
+        for code in args.codes:
+            try:
+                output, context = engine.apply(code)
+                print(f"✓ {code} -> {output} {context}")
+            except RuleRejected as e:
+                print(f"✗ {code}: [{e.rule_name}] {e.message}")
+        print(json.dumps(engine.get_stats(), ensure_ascii=False, indent=2))
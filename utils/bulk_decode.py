@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+"""
+批量离线解码
+识别文件夹、ZIP压缩包或上传文件中的图片（送货单、标签页照片等）里的全部条码。
+- 各图片在进程池中并行解码，按完成顺序逐条输出结果
+- 任务只携带文件路径（ZIP为包路径+成员名），由工作进程逐个流式读取，不一次性载入全部图片
+- 识别到的条码可发送到运行中的服务器，走与手机扫码相同的处理流程
+
+用法:
+    python -m utils.bulk_decode 照片目录/ 标签.zip > results.ndjson
+    python -m utils.bulk_decode 照片目录/ --send https://127.0.0.1:5100
+"""
+
+import concurrent.futures
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import time
+import zipfile
+
+from utils.frame_decoder import decode_image, init_worker, resolve_decoder
+
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.gif', '.tif', '.tiff', '.webp')
+
+
+def _is_image(name):
+    return name.lower().endswith(IMAGE_EXTENSIONS)
+
+
+def iter_tasks(paths):
+    """
+    展开输入路径为解码任务
+
+    Args:
+        paths: 图片文件、目录或ZIP文件路径
+
+    Yields:
+        tuple: (显示名称, 文件路径, ZIP成员名或None)
+    """
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, files in os.walk(path):
+                for name in sorted(files):
+                    full = os.path.join(root, name)
+                    if _is_image(name):
+                        yield os.path.relpath(full, path), full, None
+                    elif name.lower().endswith('.zip'):
+                        yield from iter_tasks([full])
+        elif zipfile.is_zipfile(path):
+            with zipfile.ZipFile(path) as archive:
+                members = [info.filename for info in archive.infolist()
+                           if not info.is_dir() and _is_image(info.filename)]
+            for member in members:
+                yield f"{os.path.basename(path)}/{member}", path, member
+        elif _is_image(path):
+            yield os.path.basename(path), path, None
+        else:
+            logger.warning(f"跳过不支持的文件: {path}")
+
+
+def decode_task(task):
+    """
+    解码一个任务（在工作进程中执行）
+
+    Returns:
+        dict: {'name', 'codes': [[文本, 码制], ...], 'decode_ms', 'error'}
+    """
+    from PIL import Image
+
+    name, path, member = task
+    start = time.perf_counter()
+    try:
+        if member is None:
+            with Image.open(path) as image:
+                codes = decode_image(image.convert('L'))
+        else:
+            with zipfile.ZipFile(path) as archive, archive.open(member) as stream, Image.open(stream) as image:
+                codes = decode_image(image.convert('L'))
+        error = None
+    except Exception as e:
+        codes, error = [], str(e)
+    return {
+        'name': name,
+        'codes': [list(code) for code in codes],
+        'decode_ms': round((time.perf_counter() - start) * 1000, 1),
+        'error': error
+    }
+
+
+class BulkDecoder:
+    """
+    批量解码进程池
+
+    Args:
+        workers: 进程数，默认CPU核数
+        decoder: 解码库 auto/zxingcpp/pyzbar
+    """
+
+    def __init__(self, workers=None, decoder='auto'):
+        self.decoder = resolve_decoder(decoder)
+        self.workers = workers or os.cpu_count() or 1
+
+    def run(self, tasks):
+        """
+        并行解码，按完成顺序逐条产出结果；同时在途的任务数有上限，内存占用与任务总数无关
+
+        Yields:
+            dict: decode_task的结果
+        """
+        max_pending = self.workers * 2
+        with concurrent.futures.ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=init_worker,
+            initargs=(self.decoder,)
+        ) as pool:
+            tasks = iter(tasks)
+            pending = set()
+            exhausted = False
+            while pending or not exhausted:
+                while not exhausted and len(pending) < max_pending:
+                    task = next(tasks, None)
+                    if task is None:
+                        exhausted = True
+                        break
+                    pending.add(pool.submit(decode_task, task))
+                if not pending:
+                    break
+                done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+
+
+def send_to_server(url, results, timeout=10):
+    """
+    把识别到的条码逐条发送到服务器（作为一个手机端），走与实时扫码相同的处理流程
+
+    Yields:
+        dict: 每个条码的确认消息（附带来源图片名）
+    """
+    import queue
+    import socketio
+
+    confirms = queue.Queue()
+    registered = queue.Queue()
+    client = socketio.Client(ssl_verify=False)
+
+    @client.on('server_response')
+    def on_response(data):
+        if data.get('status') == 'registered':
+            registered.put(data)
+
+    @client.on('scan_confirm')
+    def on_confirm(data):
+        confirms.put(data)
+
+    client.connect(url, transports=['websocket'], wait_timeout=timeout)
+    try:
+        # 只使用JSON编码，确认消息不需要解码
+        client.emit('client_info', {'type': 'mobile_client', 'platform': 'bulk_decode', 'version': 'bulk'})
+        registered.get(timeout=timeout)
+
+        for result in results:
+            for barcode, symbology in result['codes']:
+                while True:
+                    client.emit('scan_result', {'barcode': barcode, 'format': symbology,
+                                                'timestamp': int(time.time() * 1000)})
+                    confirm = confirms.get(timeout=timeout)
+                    if confirm.get('status') != 'throttled':
+                        break
+                    # 被限流时按服务器建议的时间等待后重发
+                    time.sleep(confirm.get('retry_after_ms', 1000) / 1000)
+                yield dict(confirm, source=result['name'])
+    finally:
+        client.disconnect()
+
+
+if __name__ == '__main__':
+    import argparse
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        stream=sys.stderr
+    )
+
+    parser = argparse.ArgumentParser(description='批量识别图片中的条码')
+    parser.add_argument('paths', nargs='+', help='图片文件、目录或ZIP压缩包')
+    parser.add_argument('-j', '--workers', type=int, default=None, help='解码进程数（默认CPU核数）')
+    parser.add_argument('--decoder', default='auto', help='解码库 auto/zxingcpp/pyzbar')
+    parser.add_argument('--send', metavar='URL', help='发送到服务器，如 https://127.0.0.1:5100')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    images = codes = 0
+    results = BulkDecoder(args.workers, args.decoder).run(iter_tasks(args.paths))
+
+    def counted(results):
+        global images, codes
+        for result in results:
+            images += 1
+            codes += len(result['codes'])
+            if result['error']:
+                logger.warning(f"{result['name']}: {result['error']}")
+            yield result
+
+    output = send_to_server(args.send, counted(results)) if args.send else counted(results)
+    for line in output:
+        sys.stdout.write(json.dumps(line, ensure_ascii=False) + '\n')
+        sys.stdout.flush()
+
+    logger.info(f"完成: {images} 张图片, {codes} 个条码, 耗时 {time.perf_counter() - start:.1f}s")
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+连接就绪耗时测量
+分别以 默认(长轮询后升级) / 仅WebSocket / 原生WebSocket 方式连接服务器，
+测量从发起连接到收到注册确认的耗时。
+"""
+
+import json
+import logging
+import ssl
+import statistics
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+CLIENT_INFO = {
+    'type': 'mobile_client',
+    'platform': 'bench',
+    'version': 'bench'
+}
+
+
+def measure_socketio(url, transports, timeout=10):
+    """
+    测量一次Socket.IO连接的就绪耗时
+
+    Args:
+        url: 服务器地址，如 https://127.0.0.1:5100
+        transports: Engine.IO传输方式列表
+
+    Returns:
+        float: 耗时（毫秒）
+    """
+    import socketio
+
+    ready = threading.Event()
+    client = socketio.Client(ssl_verify=False, reconnection=False)
+
+    @client.on('server_response')
+    def on_response(data):
+        if data.get('status') == 'registered':
+            ready.set()
+
+    start = time.perf_counter()
+    client.connect(url, transports=transports, wait_timeout=timeout)
+    client.emit('client_info', CLIENT_INFO)
+    if not ready.wait(timeout):
+        client.disconnect()
+        raise TimeoutError('等待注册确认超时')
+    elapsed = (time.perf_counter() - start) * 1000
+    client.disconnect()
+    return elapsed
+
+
+def measure_raw(url, path='/ws/scan', timeout=10):
+    """测量一次原生WebSocket连接的就绪耗时（毫秒）"""
+    import simple_websocket
+
+    ws_url = url.replace('https://', 'wss://').replace('http://', 'ws://') + path
+    context = ssl.create_default_context()
+    context.check_hostname = False
+    context.verify_mode = ssl.CERT_NONE
+
+    start = time.perf_counter()
+    ws = simple_websocket.Client(ws_url, ssl_context=context)
+    try:
+        ws.send('H' + json.dumps(CLIENT_INFO))
+        while True:
+            frame = ws.receive(timeout)
+            if frame is None:
+                raise TimeoutError('等待注册确认超时')
+            if frame.startswith('R'):
+                return (time.perf_counter() - start) * 1000
+    finally:
+        ws.close()
+
+
+MODES = {
+    'default': lambda url: measure_socketio(url, ['polling', 'websocket']),
+    'websocket': lambda url: measure_socketio(url, ['websocket']),
+    'raw': measure_raw,
+}
+
+
+def run(url, modes, count):
+    """
+    对每种传输方式重复测量
+
+    Returns:
+        dict: 传输方式 -> 统计结果（毫秒）
+    """
+    results = {}
+    for mode in modes:
+        samples = []
+        for _ in range(count):
+            try:
+                samples.append(MODES[mode](url))
+            except Exception as e:
+                logger.error(f"{mode} 连接失败: {e}")
+                break
+        if samples:
+            results[mode] = {
+                'count': len(samples),
+                'min': round(min(samples), 1),
+                'median': round(statistics.median(samples), 1),
+                'max': round(max(samples), 1)
+            }
+    return results
+
+
+if __name__ == '__main__':
+    import argparse
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s'
+    )
+
+    parser = argparse.ArgumentParser(description='测量各传输方式的连接就绪耗时')
+    parser.add_argument('--url', default='https://127.0.0.1:5100', help='服务器地址')
+    parser.add_argument('--modes', default='default,websocket,raw', help='要测量的传输方式')
+    parser.add_argument('-n', '--count', type=int, default=20, help='每种方式的测量次数')
+    args = parser.parse_args()
+
+    print(json.dumps(run(args.url, args.modes.split(','), args.count), indent=2))
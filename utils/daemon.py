@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+无界面守护进程入口（Linux工位/集线器）
+不导入PyQt，只在 --qr 时导入qrcode并在终端打印访问二维码。
+
+信号:
+    SIGTERM/SIGINT  排空后停止
+    SIGHUP          平滑重启（移交监听socket，见 BarcodeGunServer.restart）
+    SIGUSR1         重新加载.env中可在运行时调整的配置
+
+就绪通知:
+    systemd Type=notify 时通过 NOTIFY_SOCKET 发送 READY=1，
+    也可用 --ready-file 在开始监听后写入文件（内容为PID）。
+
+用法:
+    python -m utils.daemon --port 5100 --qr
+"""
+
+import argparse
+import logging
+import os
+import signal
+import socket
+import sys
+import threading
+
+from utils.dual_server import BarcodeGunServer
+from utils.profiling import current_rss_kb
+
+logger = logging.getLogger(__name__)
+
+
+def sd_notify(state):
+    """
+    向systemd发送状态通知（未在systemd下运行时忽略）
+
+    Args:
+        state: 如 'READY=1'、'RELOADING=1'、'STOPPING=1'、'STATUS=...'
+    """
+    address = os.getenv('NOTIFY_SOCKET')
+    if not address:
+        return False
+    if address.startswith('@'):
+        # 抽象命名空间socket
+        address = '\0' + address[1:]
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as sock:
+            sock.connect(address)
+            sock.sendall(state.encode('utf-8'))
+        return True
+    except OSError as e:
+        logger.warning(f"systemd通知失败: {e}")
+        return False
+
+
+def print_terminal_qr(url, out=sys.stdout):
+    """在终端打印访问地址二维码（需要qrcode）"""
+    try:
+        import qrcode
+    except ImportError:
+        logger.error("打印二维码需要qrcode。请使用: pip install qrcode")
+        return
+    qr = qrcode.QRCode(border=1, error_correction=qrcode.constants.ERROR_CORRECT_L)
+    qr.add_data(url)
+    qr.make(fit=True)
+    qr.print_ascii(out=out, invert=True)
+
+
+class BarcodeDaemon:
+    """
+    守护进程包装
+
+    Args:
+        server: BarcodeGunServer实例
+        show_qr: 就绪后是否在终端打印二维码
+        ready_file: 就绪后写入PID的文件路径
+    """
+
+    def __init__(self, server, show_qr=False, ready_file=None):
+        self.server = server
+        self.show_qr = show_qr
+        self.ready_file = ready_file
+        self.baseline_rss_kb = None
+
+        server.on_ready = self._on_ready
+        # 在服务器的信号处理之外补充systemd状态通知
+        signal.signal(signal.SIGTERM, self._on_stop_signal)
+        signal.signal(signal.SIGINT, self._on_stop_signal)
+        if hasattr(signal, 'SIGUSR1'):
+            signal.signal(signal.SIGUSR1, self._on_reload_signal)
+
+    def _on_ready(self, server):
+        url = f"https://{server.get_local_ip()}:{server.port}"
+        self.baseline_rss_kb = current_rss_kb()
+        rss = f"{self.baseline_rss_kb / 1024:.1f}MB" if self.baseline_rss_kb else '未知'
+        logger.info(f"守护进程已就绪: {url} (PID: {os.getpid()}, RSS: {rss})")
+
+        if self.show_qr:
+            print_terminal_qr(url)
+        if self.ready_file:
+            with open(self.ready_file, 'w') as f:
+                f.write(f"{os.getpid()}\n")
+        sd_notify(f"READY=1\nSTATUS=监听 {url}\nMAINPID={os.getpid()}")
+
+    def _on_stop_signal(self, signum, frame):
+        sd_notify('STOPPING=1')
+        if self.ready_file:
+            try:
+                os.remove(self.ready_file)
+            except OSError:
+                pass
+        self.server._signal_handler(signum, frame)
+
+    def _on_reload_signal(self, signum, frame):
+        def reload():
+            sd_notify('RELOADING=1')
+            try:
+                self.server.reload_config()
+            finally:
+                sd_notify('READY=1')
+        threading.Thread(target=reload, name='ConfigReload', daemon=True).start()
+
+    def run(self):
+        """启动服务器（阻塞直到停止）"""
+        self.server.start()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='H5扫码枪无界面守护进程')
+    parser.add_argument('--host', default=os.getenv('HOST', '0.0.0.0'), help='监听地址')
+    parser.add_argument('--port', type=int, default=int(os.getenv('PORT', '5100')), help='监听端口')
+    parser.add_argument('--rules', default=None, help='条码规则文件（默认读取BARCODE_RULES_FILE）')
+    parser.add_argument('--qr', action='store_true', help='就绪后在终端打印访问二维码（需要qrcode）')
+    parser.add_argument('--ready-file', default=None, help='就绪后写入PID的文件')
+    args = parser.parse_args(argv)
+
+    server = BarcodeGunServer(host=args.host, port=args.port, rules_file=args.rules)
+    BarcodeDaemon(server, show_qr=args.qr, ready_file=args.ready_file).run()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,302 @@
+#!/usr/bin/env python3
+"""
+实时看板
+扫码统计保存在按秒分桶的固定大小环形缓冲区中（每台手机一个，最近一分钟），
+延迟保存在固定大小的样本环中；后台线程每秒计算一次看板状态，与上次比较后只把变化的部分
+推送给所有订阅者（SSE），看板数量增加时服务器只多一次队列写入。
+
+推送格式:
+    event: snapshot   完整状态（订阅时、订阅者跟不上被重置时）
+    event: delta      只含变化的键；dict类型的值按子键合并，子键为null表示删除
+                      timeline_append为新增的 [秒, 扫码数] 列表
+"""
+
+import json
+import logging
+import queue
+import threading
+import time
+from array import array
+
+logger = logging.getLogger(__name__)
+
+# 统计窗口（秒）：每分钟扫码数、延迟分位数均按最近一分钟计算
+WINDOW_SECONDS = 60
+
+# 扫码数时间线长度（秒）
+TIMELINE_SECONDS = 300
+
+# 延迟样本环大小
+LATENCY_SAMPLES = 4096
+
+# 每个订阅者最多积压的消息数，超过时丢弃积压并重新发送完整状态
+SUBSCRIBER_QUEUE = 30
+
+# 没有变化时发送SSE注释保持连接（秒）
+HEARTBEAT_SECONDS = 15
+
+_RESYNC = object()
+
+
+class SecondRing:
+    """按秒分桶的计数环形缓冲区"""
+
+    __slots__ = ('size', 'stamps', 'counts')
+
+    def __init__(self, size):
+        self.size = size
+        self.stamps = array('q', [-1]) * size
+        self.counts = array('I', [0]) * size
+
+    def add(self, second, count=1):
+        index = second % self.size
+        if self.stamps[index] != second:
+            self.stamps[index] = second
+            self.counts[index] = 0
+        self.counts[index] += count
+
+    def get(self, second):
+        index = second % self.size
+        return self.counts[index] if self.stamps[index] == second else 0
+
+    def total(self, now, window):
+        """(now-window, now] 内的合计"""
+        start = now - window
+        return sum(count for stamp, count in zip(self.stamps, self.counts) if start < stamp <= now)
+
+    def last_seen(self):
+        return max(self.stamps)
+
+
+def _percentile(ordered, fraction):
+    return round(ordered[min(len(ordered) - 1, int(len(ordered) * fraction))], 1)
+
+
+def diff_state(previous, current):
+    """
+    计算两次状态之间的变化
+
+    Returns:
+        dict: 变化的键；dict类型的值只含变化的子键，删除的子键为None
+    """
+    delta = {}
+    for key, value in current.items():
+        old = previous.get(key)
+        if value == old:
+            continue
+        if isinstance(value, dict) and isinstance(old, dict):
+            changes = {name: item for name, item in value.items() if old.get(name) != item}
+            changes.update({name: None for name in old if name not in value})
+            delta[key] = changes
+        else:
+            delta[key] = value
+    for key in previous:
+        if key not in current:
+            delta[key] = None
+    return delta
+
+
+class DashboardMetrics:
+    """
+    看板统计与推送
+
+    Args:
+        state_fn: 返回服务器当前状态的函数（输入队列、在线设备等），每秒调用一次
+        interval: 推送间隔（秒）
+    """
+
+    def __init__(self, state_fn=None, interval=1.0):
+        self.state_fn = state_fn
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._timeline = SecondRing(TIMELINE_SECONDS)
+        self._phones = {}
+        self._statuses = {}
+        self._latency = array('f', [0]) * LATENCY_SAMPLES
+        self._latency_at = array('q', [-1]) * LATENCY_SAMPLES
+        self._latency_next = 0
+
+        self._subscribers = set()
+        self._subscribers_lock = threading.Lock()
+        self._tick_lock = threading.Lock()
+        self._state = None
+        self._timeline_end = None
+        self.ticks = 0
+        self.deltas = 0
+        self.resyncs = 0
+
+        self._stop_event = threading.Event()
+        self._publisher = threading.Thread(target=self._publish_loop, name='Dashboard', daemon=True)
+        self._publisher.start()
+
+    def record(self, record):
+        """扫码记录监听（BarcodeGunServer.add_scan_listener），只更新计数"""
+        second = int(record.get('ts', time.time() * 1000) // 1000)
+        device = str(record.get('device_id') or record.get('ip') or 'unknown')
+        status = record.get('status') or 'other'
+        latency = record.get('latency_ms')
+        with self._lock:
+            self._timeline.add(second)
+            ring = self._phones.get(device)
+            if ring is None:
+                ring = self._phones[device] = SecondRing(WINDOW_SECONDS)
+            ring.add(second)
+            ring = self._statuses.get(status)
+            if ring is None:
+                ring = self._statuses[status] = SecondRing(WINDOW_SECONDS)
+            ring.add(second)
+            if latency is not None and status == 'success':
+                index = self._latency_next
+                self._latency[index] = latency
+                self._latency_at[index] = second
+                self._latency_next = (index + 1) % LATENCY_SAMPLES
+
+    def _compute(self, now):
+        """当前看板状态（不含时间线）"""
+        with self._lock:
+            phones = {}
+            for device, ring in list(self._phones.items()):
+                count = ring.total(now, WINDOW_SECONDS)
+                if count:
+                    phones[device] = count
+                elif now - ring.last_seen() > WINDOW_SECONDS:
+                    # 超过一分钟没有扫码的手机不再保留计数环
+                    del self._phones[device]
+            statuses = {status: ring.total(now, WINDOW_SECONDS) for status, ring in self._statuses.items()}
+            start = now - WINDOW_SECONDS
+            samples = sorted(value for value, stamp in zip(self._latency, self._latency_at) if start < stamp <= now)
+
+        state = {
+            'scans_per_min': sum(phones.values()),
+            'phones': phones,
+            'statuses': {status: count for status, count in statuses.items() if count},
+            'latency': {
+                'samples': len(samples),
+                'p50': _percentile(samples, 0.5),
+                'p95': _percentile(samples, 0.95),
+                'p99': _percentile(samples, 0.99),
+                'max': round(samples[-1], 1)
+            } if samples else {'samples': 0}
+        }
+        if self.state_fn:
+            try:
+                state.update(self.state_fn())
+            except Exception as e:
+                logger.debug(f"获取看板状态失败: {e}")
+        return state
+
+    def _timeline_since(self, start, end):
+        with self._lock:
+            return [[second, self._timeline.get(second)] for second in range(start + 1, end + 1)]
+
+    def snapshot(self):
+        """完整状态（新订阅者的第一条消息），与之后推送的delta基于同一次计算"""
+        with self._tick_lock:
+            if self._state is None:
+                now = int(time.time())
+                self._state = self._compute(now)
+                self._timeline_end = now - 1
+            state = dict(self._state)
+            end = self._timeline_end
+        state['timeline'] = self._timeline_since(end - TIMELINE_SECONDS, end)
+        state['window_seconds'] = WINDOW_SECONDS
+        return state
+
+    def subscribe(self):
+        """
+        订阅推送
+
+        Returns:
+            queue.Queue: 依次取出 (事件名, JSON字符串)；取出 _RESYNC 时应重新发送snapshot
+        """
+        subscriber = queue.Queue(maxsize=SUBSCRIBER_QUEUE)
+        with self._subscribers_lock:
+            self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._subscribers_lock:
+            self._subscribers.discard(subscriber)
+
+    @property
+    def subscriber_count(self):
+        return len(self._subscribers)
+
+    def tick(self):
+        """计算一次状态变化并推送给所有订阅者；没有订阅者时不计算"""
+        with self._tick_lock:
+            if not self._subscribers:
+                self._state = self._timeline_end = None
+                return
+            now = int(time.time())
+            end = now - 1
+            state = self._compute(now)
+            delta = diff_state(self._state, state) if self._state is not None else state
+            if self._timeline_end is not None and self._timeline_end < end:
+                # 时间线只推送新完成的秒
+                delta['timeline_append'] = self._timeline_since(max(self._timeline_end, end - TIMELINE_SECONDS), end)
+            self._state = state
+            self._timeline_end = end
+            self.ticks += 1
+        if not delta:
+            return
+
+        self.deltas += 1
+        message = ('delta', json.dumps(delta, ensure_ascii=False, separators=(',', ':')))
+        with self._subscribers_lock:
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            try:
+                subscriber.put_nowait(message)
+            except queue.Full:
+                # 订阅者跟不上（如浏览器页面在后台），丢弃积压，下一条发送完整状态
+                self.resyncs += 1
+                while True:
+                    try:
+                        subscriber.get_nowait()
+                    except queue.Empty:
+                        break
+                subscriber.put_nowait(_RESYNC)
+
+    def stream(self):
+        """
+        SSE数据流（生成器），在HTTP请求线程中运行，断开时自动取消订阅
+        """
+        subscriber = self.subscribe()
+        try:
+            yield self._format('snapshot', json.dumps(self.snapshot(), ensure_ascii=False, separators=(',', ':')))
+            while not self._stop_event.is_set():
+                try:
+                    item = subscriber.get(timeout=HEARTBEAT_SECONDS)
+                except queue.Empty:
+                    yield ': keepalive\n\n'
+                    continue
+                if item is _RESYNC:
+                    yield self._format('snapshot', json.dumps(self.snapshot(), ensure_ascii=False,
+                                                              separators=(',', ':')))
+                else:
+                    yield self._format(*item)
+        finally:
+            self.unsubscribe(subscriber)
+
+    @staticmethod
+    def _format(event, data):
+        return f"event: {event}\ndata: {data}\n\n"
+
+    def _publish_loop(self):
+        while not self._stop_event.wait(self.interval):
+            try:
+                self.tick()
+            except Exception as e:
+                logger.error(f"看板推送失败: {e}")
+
+    def get_stats(self):
+        return {
+            'subscribers': self.subscriber_count,
+            'ticks': self.ticks,
+            'deltas': self.deltas,
+            'resyncs': self.resyncs
+        }
+
+    def close(self):
+        self._stop_event.set()
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+服务器端重复扫码抑制
+同一条码在时间窗口内再次到达（无论来自哪台手机）时不再输入，只回复duplicate确认。
+窗口可按码制分别配置，可选按工位（手机设备）区分。
+
+条目按首次接受的时间顺序保存在OrderedDict中，查询、插入、过期清理均为O(1)（均摊），
+条目数有上限，内存占用固定。
+"""
+
+import collections
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_symbology(name):
+    """统一码制名称，如 'EAN_13' -> 'ean13'，'QR_CODE' -> 'qrcode'"""
+    if not name:
+        return None
+    return str(name).lower().replace('_', '').replace('-', '').replace(' ', '')
+
+
+def parse_windows(spec):
+    """
+    解析按码制的窗口配置
+
+    Args:
+        spec: 如 'ean13:3000,qrcode:10000'
+
+    Returns:
+        dict: 码制 -> 窗口毫秒
+    """
+    windows = {}
+    for item in (spec or '').split(','):
+        if not item.strip():
+            continue
+        name, _, value = item.partition(':')
+        windows[normalize_symbology(name.strip())] = int(value)
+    return windows
+
+
+class DuplicateFilter:
+    """
+    重复扫码过滤器（TTL缓存）
+
+    Args:
+        window_ms: 默认抑制窗口（毫秒），0表示未单独配置的码制不抑制
+        windows: 码制 -> 窗口毫秒
+        per_station: 是否按工位（手机设备）分别判断
+        max_entries: 缓存条目上限
+    """
+
+    def __init__(self, window_ms=0, windows=None, per_station=False, max_entries=100000):
+        self.window_ms = window_ms
+        self.windows = dict(windows or {})
+        self.per_station = per_station
+        self.max_entries = max_entries
+        self._max_window = max([window_ms] + list(self.windows.values()))
+
+        # key -> (接受时间秒, 窗口秒)，按接受时间排序
+        self._seen = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self.checked = 0
+        self.suppressed = 0
+        self.suppressed_by_symbology = collections.Counter()
+
+    @classmethod
+    def from_env(cls):
+        """按环境变量 DEDUP_WINDOW_MS / DEDUP_WINDOWS / DEDUP_PER_STATION 创建"""
+        return cls(
+            window_ms=int(os.getenv('DEDUP_WINDOW_MS', '0')),
+            windows=parse_windows(os.getenv('DEDUP_WINDOWS')),
+            per_station=os.getenv('DEDUP_PER_STATION', 'false').lower() == 'true'
+        )
+
+    @property
+    def enabled(self):
+        return self._max_window > 0
+
+    def window_for(self, symbology):
+        """码制对应的抑制窗口（毫秒）"""
+        return self.windows.get(normalize_symbology(symbology), self.window_ms)
+
+    def check(self, barcode, symbology=None, station=None, now=None):
+        """
+        判断是否为重复扫码；不是重复时记录本次扫码
+
+        Args:
+            barcode: 条码（规则处理后）
+            symbology: 码制
+            station: 工位标识（per_station时参与判断）
+            now: 当前时间（秒，测试用）
+
+        Returns:
+            float: 重复时返回距首次扫码的毫秒数，否则返回None
+        """
+        window = self.window_for(symbology) / 1000
+        if window <= 0:
+            return None
+        now = time.monotonic() if now is None else now
+        key = (station, barcode) if self.per_station else barcode
+
+        with self._lock:
+            self.checked += 1
+            self._expire(now)
+            entry = self._seen.get(key)
+            if entry is not None and now - entry[0] < entry[1]:
+                self.suppressed += 1
+                self.suppressed_by_symbology[normalize_symbology(symbology) or 'unknown'] += 1
+                return (now - entry[0]) * 1000
+
+            # 窗口从首次接受算起，重复扫码不会延长窗口
+            self._seen.pop(key, None)
+            self._seen[key] = (now, window)
+            if len(self._seen) > self.max_entries:
+                self._seen.popitem(last=False)
+        return None
+
+    def forget(self, barcode, station=None):
+        """扫码最终未被接受（如输入队列已满）时移除记录，允许立即重试"""
+        key = (station, barcode) if self.per_station else barcode
+        with self._lock:
+            self._seen.pop(key, None)
+
+    def _expire(self, now):
+        # 按接受时间排序，队首超过最大窗口即可删除；各码制窗口不同时，较短窗口的条目在查询时判断
+        horizon = now - self._max_window / 1000
+        while self._seen:
+            key, (seen, _) = next(iter(self._seen.items()))
+            if seen > horizon:
+                break
+            self._seen.popitem(last=False)
+
+    def get_stats(self):
+        return {
+            'enabled': self.enabled,
+            'window_ms': self.window_ms,
+            'windows': self.windows,
+            'per_station': self.per_station,
+            'entries': len(self._seen),
+            'checked': self.checked,
+            'suppressed': self.suppressed,
+            'suppressed_by_symbology': dict(self.suppressed_by_symbology)
+        }
@@ -4,18 +4,42 @@ H5 Barcode Gun - 双端口服务器（修复版）
 HTTP服务器(5100) + WebSocket服务器(9999) - 只使用一个Flask应用
 """
 
+import functools
+import itertools
+import json
 import logging
+import math
+import queue
+import shutil
+import tempfile
+from collections import deque
 from datetime import datetime
 import os
 import socket
-from flask import Flask, render_template, jsonify, request
+from flask import Flask, Response, render_template, jsonify, request, stream_with_context
 from flask_socketio import SocketIO, emit
 import signal
+import subprocess
 import sys
 import threading
 import time
 from dotenv import load_dotenv
-from utils.keyboard_simulator import simulate_keyboard_input
+from utils.barcode_rules import BarcodeRuleEngine, RuleRejected, detect_symbology
+from utils.dashboard import DashboardMetrics
+from utils.dedup import DuplicateFilter
+from utils.forwarder import ScanForwarder
+from utils.inventory import InventoryCount, PresenceFilter, parse_targets, write_count_file
+from utils.product_catalog import ProductCatalog
+from utils.scan_history import ScanHistory, parse_time
+from utils.scan_export import EXPORT_FORMATS, export_scans
+from utils.sessions import SessionRegistry
+from utils.rate_limiter import RateLimiter
+from utils.injection_queue import InjectionQueue
+from utils import keyboard_simulator
+from utils.protocol import ENCODING_JSON, decode_message, encode_message, negotiate_encoding, now_ms, to_epoch_ms
+from utils.profiling import current_rss_kb, format_folded, sample_stacks, spans
+from utils.tracing import ScanTracer
+from utils.traffic_capture import TrafficRecorder
 
 # 加载环境变量
 load_dotenv()
@@ -34,15 +58,80 @@ warnings.filterwarnings('ignore', message='.*production deployment.*')
 import os
 os.environ['FLASK_ENV'] = 'development'
 
+# 重启时由旧进程传给新进程的监听socket和就绪通知管道
+LISTEN_FD_ENV = 'H5_LISTEN_FD'
+READY_FD_ENV = 'H5_READY_FD'
+
 
 class BarcodeGunServer:
     """HTTPS扫码枪服务器类（单端口）"""
 
-    def __init__(self, host='0.0.0.0', port=5100, barcode_callback=None):
+    def __init__(self, host='0.0.0.0', port=5100, barcode_callback=None, rules_file=None):
         self.host = host
         self.port = port
         self.barcode_callback = barcode_callback  # 用于通知PC客户端的回调函数
 
+        # 条码校验/转换规则（启动时编译一次，reload_config时重新编译）
+        self.rules_file = rules_file
+        rules_file = rules_file or os.getenv('BARCODE_RULES_FILE')
+        self.rule_engine = BarcodeRuleEngine.from_file(rules_file) if rules_file else None
+        # 输入配置在启动时加载，配置文件有误时直接报错，而不是每次扫码输入失败
+        keyboard_simulator.get_profiles()
+
+        # 重复扫码抑制（DEDUP_WINDOW_MS为0且未配置DEDUP_WINDOWS时不启用）
+        self.dedup = DuplicateFilter.from_env()
+
+        # 商品目录（mmap索引，索引已存在时毫秒级打开，CSV变化时后台重建）
+        self.catalog = None
+        self.catalog_required = os.getenv('PRODUCT_CATALOG_REQUIRED', 'false').lower() == 'true'
+        catalog_csv = os.getenv('PRODUCT_CATALOG_CSV')
+        if catalog_csv:
+            self.catalog = ProductCatalog(
+                catalog_csv,
+                index_path=os.getenv('PRODUCT_CATALOG_INDEX') or None,
+                barcode_column=os.getenv('PRODUCT_BARCODE_COLUMN', 'barcode'),
+                check_interval=float(os.getenv('PRODUCT_CATALOG_CHECK_INTERVAL', '60'))
+            )
+            self.catalog.open()
+
+        # 扫码历史（SQLite WAL，后台批量写入），SCAN_HISTORY_DB为空时不启用
+        history_db = os.getenv('SCAN_HISTORY_DB', 'scan_history.db')
+        self.history = ScanHistory(history_db, station=os.getenv('STATION_NAME') or None) if history_db else None
+
+        # 可选：把扫码记录批量转发到下游系统（FORWARD_URL），下游不可用时暂存到磁盘
+        self.forwarder = ScanForwarder.from_env()
+        self.forward_statuses = set(os.getenv('FORWARD_STATUSES', 'success').split(','))
+        self.station = os.getenv('STATION_NAME') or socket.gethostname()
+
+        # 盘点模式：扫码只在内存中按条码计数，提交时每个条码输出一行数量（键盘输入/文件/转发）
+        self.inventory = InventoryCount()
+        self.inventory_targets = parse_targets(os.getenv('INVENTORY_COMMIT_TARGETS', 'keyboard,file'))
+        self.inventory_dir = os.getenv('INVENTORY_DIR', 'inventory_counts')
+        separator = os.getenv('INVENTORY_SEPARATOR', 'tab')
+        self.inventory_separator = {'tab': '\t', 'space': ' '}.get(separator.lower(), separator)
+        self.inventory_presence = PresenceFilter()
+
+        # 可选：录制收到的事件流，供 utils.traffic_replay 重放
+        capture_file = os.getenv('TRAFFIC_CAPTURE_FILE')
+        self.capture = TrafficRecorder(capture_file) if capture_file else None
+
+        # 限流：单连接与全局令牌桶
+        self.rate_limiter = RateLimiter(
+            client_rate=float(os.getenv('RATE_LIMIT_PER_CLIENT', '20')),
+            client_burst=float(os.getenv('RATE_LIMIT_BURST', '10')),
+            global_rate=float(os.getenv('RATE_LIMIT_GLOBAL', '50')),
+            global_burst=float(os.getenv('RATE_LIMIT_GLOBAL_BURST', '50'))
+        )
+
+        # 键盘输入队列（积压时通过flow_control通知手机端减速/暂停）
+        self.flow_slow_delay_ms = int(os.getenv('FLOW_SLOW_DELAY_MS', '2000'))
+        self.injection_queue = InjectionQueue(
+            max_size=int(os.getenv('INJECTION_QUEUE_MAX', '200')),
+            high_watermark=int(os.getenv('INJECTION_QUEUE_HIGH', '20')),
+            low_watermark=int(os.getenv('INJECTION_QUEUE_LOW', '5')),
+            on_flow_change=self._on_flow_change
+        )
+
         # 创建Flask应用
         # 配置模板和静态文件路径，确保在打包后也能正确找到
         project_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -54,6 +143,16 @@ class BarcodeGunServer:
                         static_folder=static_folder)
         self.app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'h5-barcode-gun-secret')
 
+        # Engine.IO传输方式：默认先长轮询再升级；设为websocket时跳过长轮询，减少TLS下的握手往返
+        self.debug_api = os.getenv('DEBUG_API', 'false').lower() == 'true'
+        self._profile_lock = threading.Lock()
+
+        self.transports = [t.strip() for t in os.getenv('SOCKETIO_TRANSPORTS', 'polling,websocket').split(',') if t.strip()]
+
+        # 心跳：每PING_INTERVAL秒ping一次，PING_TIMEOUT秒内无回应判定断开（失联手机最多约两者之和后被移除）
+        self.ping_interval = float(os.getenv('PING_INTERVAL', '5'))
+        self.ping_timeout = float(os.getenv('PING_TIMEOUT', '5'))
+
         # 配置SocketIO - WebSocket通过HTTP端口升级，不需要独立端口
         # 注意：不使用eventlet，使用threading模式避免卡死
         self.socketio = SocketIO(
@@ -62,13 +161,69 @@ class BarcodeGunServer:
             logger=False,  # 关闭日志避免性能问题
             engineio_logger=False,
             async_mode='threading',  # 使用threading替代eventlet，更稳定
-            ping_timeout=60,
-            ping_interval=30,
-            async_handlers=True  # 异步处理handler
+            ping_timeout=self.ping_timeout,
+            ping_interval=self.ping_interval,
+            async_handlers=True,  # 异步处理handler
+            transports=self.transports
         )
 
-        # 存储连接的客户端
-        self.mobile_clients = {}  # 手机端客户端
+        # 可选：不经过Socket.IO的原生WebSocket扫码端点
+        self.raw_ws = None
+        if os.getenv('RAW_WEBSOCKET', 'false').lower() == 'true':
+            from utils.raw_ws import RawScanEndpoint
+            self.raw_ws = RawScanEndpoint(self)
+
+        # 扫码全链路追踪（手机时钟偏差由clock_ping交换估算）
+        self.tracer = ScanTracer(slow_threshold_ms=float(os.getenv('SLOW_TRACE_MS', '300')))
+
+        # 可选：服务器端帧解码（旧手机只发送灰度帧，由进程池识别条码）
+        self.frame_decoder = None
+        if os.getenv('FRAME_DECODING', 'false').lower() == 'true':
+            from utils.frame_decoder import FrameDecoder
+            self.frame_decoder = FrameDecoder(
+                workers=int(os.getenv('FRAME_DECODE_WORKERS', '0')) or None,
+                decoder=os.getenv('FRAME_DECODER', 'auto'),
+                on_result=self._on_frame_decoded
+            )
+
+        # 可选：上传图片/ZIP批量解码（POST /api/decode）
+        self.bulk_decoder = None
+        self._upload_ids = itertools.count(1)
+        if os.getenv('BULK_DECODE_UPLOAD', 'false').lower() == 'true':
+            from utils.bulk_decode import BulkDecoder
+            self.bulk_decoder = BulkDecoder(
+                workers=int(os.getenv('BULK_DECODE_WORKERS', '0')) or None,
+                decoder=os.getenv('FRAME_DECODER', 'auto')
+            )
+            self.app.config['MAX_CONTENT_LENGTH'] = int(os.getenv('BULK_DECODE_MAX_MB', '200')) * 1024 * 1024
+
+        # HTTP批量提交扫码（POST /api/scans）单次JSON数组的条数上限，NDJSON流式提交不限
+        self.ingest_max_items = int(os.getenv('HTTP_INGEST_MAX_ITEMS', '10000'))
+        # HTTP批量提交使用独立的限流器（按请求方地址计），限额按批量流量设置，不占用手机的限额
+        self.ingest_limiter = self._create_ingest_limiter()
+        self._ingest_requests = {}    # 限流桶ID -> 进行中的请求数，最后一个请求结束时释放令牌桶
+        self._ingest_lock = threading.Lock()
+
+        # 扫码记录监听（如PC客户端的最近扫码表格），在处理扫码的线程中调用，不能阻塞
+        self.scan_listeners = []
+
+        # 浏览器实时看板（/dashboard），统计只在有人打开看板时每秒计算一次
+        self.dashboard = None
+        if os.getenv('DASHBOARD', 'true').lower() == 'true':
+            self.dashboard = DashboardMetrics(self._dashboard_state)
+            self.add_scan_listener(self.dashboard.record)
+
+        # 手机端上报的性能指标（如各传输方式的连接就绪耗时）
+        self.client_metrics = {}
+        # 相机启动指标按手机分别统计（第一帧/第一次识别耗时，各手机相机差异很大）
+        self.device_metrics = {}
+
+        # 会话登记：清理未注册的连接，手机重连时凭resume_token恢复会话
+        self.sessions = SessionRegistry(
+            register_timeout=float(os.getenv('SESSION_REGISTER_TIMEOUT', '10')),
+            resume_ttl=float(os.getenv('SESSION_RESUME_TTL', '300'))
+        )
+        self.mobile_clients = self.sessions.clients  # 已注册的手机端 sid -> Session
         self.scan_count = 0       # 扫码次数统计
         self.start_time = datetime.now()  # 服务器启动时间
 
@@ -79,8 +234,14 @@ class BarcodeGunServer:
         # 注册信号处理
         signal.signal(signal.SIGINT, self._signal_handler)
         signal.signal(signal.SIGTERM, self._signal_handler)
+        if hasattr(signal, 'SIGHUP'):
+            signal.signal(signal.SIGHUP, self._signal_handler)
 
         self.running = False
+        self.draining = False     # 正在排空（停止/重启中），不再接受新连接和扫码
+        self.drain_timeout = float(os.getenv('SHUTDOWN_DRAIN_TIMEOUT', '5'))
+        self.http_server = None
+        self.on_ready = None      # 开始监听后调用的回调 on_ready(server)，如守护进程的就绪通知
         self.http_thread = None
         self.ws_thread = None
 
@@ -90,20 +251,232 @@ class BarcodeGunServer:
         @self.app.route('/')
         def index():
             """手机端扫码页面"""
-            return render_template('scanner.html')
+            return render_template(
+                'scanner.html',
+                transports=self.transports,
+                raw_ws_path=self.raw_ws.path if self.raw_ws else None,
+                frame_decoding=self.frame_decoder is not None
+            )
+
+        @self.app.route('/dashboard')
+        def dashboard():
+            """实时看板页面"""
+            if not self.dashboard:
+                return jsonify({'error': '看板未启用'}), 404
+            return render_template('dashboard.html')
+
+        @self.app.route('/api/dashboard/stream')
+        def dashboard_stream():
+            """看板数据（SSE）：先发送完整状态，之后每秒只发送变化的部分"""
+            if not self.dashboard:
+                return jsonify({'error': '看板未启用'}), 404
+            return Response(stream_with_context(self.dashboard.stream()), mimetype='text/event-stream',
+                            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
         @self.app.route('/api/status')
         def get_status():
             """获取服务器状态"""
             return jsonify(self.get_server_info())
 
+        @self.app.route('/api/scans', methods=['POST'])
+        def ingest_scans():
+            """
+            批量提交扫码（固定式扫码器、PLC网关等只能发HTTP请求的设备），与手机扫码走相同的处理流程。
+            请求体为JSON数组或NDJSON（Content-Type: application/x-ndjson）。NDJSON可分块流式上传，
+            边读边处理并逐行返回结果，网关可保持一个请求持续提交。
+            每项为条码字符串或 {"barcode", "format", "station"}。
+            默认在入队后立即返回每项的处理结果（queued/duplicate/error/throttled）；
+            ?wait=true 时等待键盘输入完成，返回最终确认。
+            """
+            wait = request.args.get('wait', '').lower() in ('1', 'true')
+            station = request.args.get('station') or request.headers.get('X-Station-Id')
+            content_type = request.mimetype or ''
+            if content_type in ('application/x-ndjson', 'application/jsonl', 'application/json-seq'):
+                items = self._iter_ndjson(request.stream)
+                stream = self._ingest_stream(items, request.remote_addr, station, wait)
+                return Response(stream_with_context(stream), mimetype='application/x-ndjson')
+
+            try:
+                items = json.loads(request.get_data(cache=False) or b'null')
+            except ValueError as e:
+                return jsonify({'error': f"JSON格式错误: {e}"}), 400
+            if isinstance(items, dict):
+                items = items.get('scans')
+            if not isinstance(items, list):
+                return jsonify({'error': '请求体应为条码数组'}), 400
+            if len(items) > self.ingest_max_items:
+                return jsonify({'error': f"单次最多提交 {self.ingest_max_items} 条"}), 413
+
+            results = [json.loads(line) for line in
+                       self._ingest_stream(iter(items), request.remote_addr, station, wait)]
+            summary = {}
+            for result in results:
+                summary[result.get('status')] = summary.get(result.get('status'), 0) + 1
+            return jsonify({'count': len(results), 'summary': summary, 'results': results})
+
+        @self.app.route('/api/scans')
+        def get_scans():
+            """分页查询扫码历史"""
+            if not self.history:
+                return jsonify({'error': '扫码历史未启用'}), 404
+            args = request.args
+            try:
+                result = self.history.query(
+                    limit=args.get('limit', 100),
+                    cursor=args.get('cursor') or None,
+                    barcode=args.get('barcode'),
+                    client=args.get('client'),
+                    device_id=args.get('device_id'),
+                    station=args.get('station'),
+                    status=args.get('status'),
+                    since=parse_time(args.get('since')),
+                    until=parse_time(args.get('until'))
+                )
+            except ValueError as e:
+                return jsonify({'error': f"参数错误: {e}"}), 400
+            return jsonify(result)
+
+        @self.app.route('/api/inventory', methods=['GET', 'POST'])
+        def inventory():
+            """
+            盘点模式
+            GET: 当前状态和各条码数量
+            POST {"action": "start" | "commit" | "discard"}
+            """
+            if request.method == 'GET':
+                return jsonify(dict(self.inventory.state(), items=self.inventory.items()))
+            data = request.get_json(silent=True) or {}
+            try:
+                return jsonify(self._handle_count_action(data.get('action')))
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+
+        @self.app.route('/api/scans/export')
+        def export_scan_history():
+            """流式导出扫码历史（CSV/NDJSON，可选gzip）"""
+            if not self.history:
+                return jsonify({'error': '扫码历史未启用'}), 404
+            args = request.args
+            fmt = args.get('format', 'csv')
+            compress = args.get('gzip', '').lower() in ('1', 'true')
+            if fmt not in EXPORT_FORMATS:
+                return jsonify({'error': f"不支持的导出格式: {fmt}"}), 400
+            try:
+                stream = export_scans(
+                    self.history, fmt, compress,
+                    client=args.get('client'),
+                    device_id=args.get('device_id'),
+                    station=args.get('station'),
+                    status=args.get('status'),
+                    since=parse_time(args.get('since')),
+                    until=parse_time(args.get('until'))
+                )
+            except ValueError as e:
+                return jsonify({'error': f"参数错误: {e}"}), 400
+
+            filename = f"scans-{datetime.now().strftime('%Y%m%d%H%M%S')}.{fmt}" + ('.gz' if compress else '')
+            mimetype = 'application/gzip' if compress else EXPORT_FORMATS[fmt]
+            return Response(stream_with_context(stream), mimetype=mimetype, headers={
+                'Content-Disposition': f'attachment; filename="{filename}"'
+            })
+
+        @self.app.route('/api/decode', methods=['POST'])
+        def decode_upload():
+            """
+            批量解码上传的图片/ZIP（multipart字段files，可多个），
+            以NDJSON逐条返回解码结果和每个条码的处理确认
+            """
+            if not self.bulk_decoder:
+                return jsonify({'error': '批量解码未启用'}), 404
+            uploads = [f for f in request.files.getlist('files') if f.filename]
+            if not uploads:
+                return jsonify({'error': '没有上传文件'}), 400
+
+            # 上传内容先写入临时目录，工作进程按路径逐个流式读取
+            from werkzeug.utils import secure_filename
+            workdir = tempfile.mkdtemp(prefix='h5-decode-')
+            paths = []
+            for index, upload in enumerate(uploads):
+                path = os.path.join(workdir, f"{index}-{secure_filename(upload.filename) or 'upload'}")
+                upload.save(path)
+                paths.append(path)
+
+            sid = f"upload-{next(self._upload_ids)}"
+            client_info = {
+                'sid': sid,
+                'type': 'bulk_upload',
+                'platform': 'upload',
+                'ip': request.remote_addr,
+                'device_id': sid
+            }
+            stream = self._decode_upload_stream(sid, client_info, paths, workdir)
+            return Response(stream_with_context(stream), mimetype='application/x-ndjson')
+
+        @self.app.route('/api/traces/slow')
+        def get_slow_traces():
+            """最近的慢扫码追踪（各阶段时间已换算到PC时钟）"""
+            try:
+                limit = min(int(request.args.get('limit', 50)), 200)
+            except ValueError:
+                return jsonify({'error': '参数错误'}), 400
+            return jsonify({
+                'threshold_ms': self.tracer.slow_threshold_ms,
+                'traces': self.tracer.get_slow_traces(limit)
+            })
+
+        @self.app.route('/api/traces/latency')
+        def get_trace_latency():
+            """按设备统计的扫码延迟分布"""
+            return jsonify(self.tracer.get_latency_stats())
+
+        @self.app.route('/api/debug/profile')
+        def debug_profile():
+            """采样所有线程的调用栈，返回火焰图折叠格式"""
+            if not self.debug_api:
+                return jsonify({'error': '调试接口未启用'}), 404
+            try:
+                seconds = float(request.args.get('seconds', 10))
+                interval = float(request.args.get('interval_ms', 5)) / 1000
+            except ValueError:
+                return jsonify({'error': '参数错误'}), 400
+            if not (math.isfinite(seconds) and math.isfinite(interval)):
+                return jsonify({'error': '参数错误'}), 400
+            # 同一时间只允许一个采样任务
+            if not self._profile_lock.acquire(blocking=False):
+                return jsonify({'error': '已有采样任务正在运行'}), 409
+            try:
+                counts = sample_stacks(seconds, interval)
+            finally:
+                self._profile_lock.release()
+            return Response(format_folded(counts), mimetype='text/plain; charset=utf-8')
+
+        @self.app.route('/api/debug/spans', methods=['GET', 'POST'])
+        def debug_spans():
+            """查看各阶段耗时；POST {"enabled": true, "reset": true} 运行时开关计时"""
+            if not self.debug_api:
+                return jsonify({'error': '调试接口未启用'}), 404
+            if request.method == 'POST':
+                options = request.get_json(silent=True) or {}
+                if options.get('reset'):
+                    spans.reset()
+                if 'enabled' in options:
+                    spans.set_enabled(options['enabled'])
+            return jsonify(spans.get_stats())
+
     def _register_socketio_events(self):
         """注册SocketIO事件处理"""
 
         @self.socketio.on('connect')
         def handle_connect():
             """处理客户端连接"""
+            if self.draining:
+                # 返回False拒绝连接，客户端会自动重连到新进程
+                return False
             logger.info(f"客户端连接: {request.sid} (IP: {request.remote_addr})")
+            self.sessions.open(request.sid, request.remote_addr, 'socketio',
+                               functools.partial(self.socketio.server.disconnect, request.sid))
+            if self.capture:
+                self.capture.record('connect', request.sid, {'ip': request.remote_addr, 'transport': 'socketio'})
 
             emit('server_response', {
                 'status': 'connected',
@@ -115,10 +488,15 @@ class BarcodeGunServer:
         def handle_disconnect():
             """处理客户端断开连接"""
             sid = request.sid
+            if self.capture:
+                self.capture.record('disconnect', sid)
 
             # 从客户端列表中移除
-            if sid in self.mobile_clients:
-                del self.mobile_clients[sid]
+            self.rate_limiter.remove(sid)
+            if self.frame_decoder:
+                self.frame_decoder.remove(sid)
+                self.inventory_presence.remove(sid)
+            if self.sessions.remove(sid):
                 logger.info(f"手机端断开连接: {sid}")
             else:
                 logger.info(f"未知客户端断开连接: {sid}")
@@ -127,70 +505,843 @@ class BarcodeGunServer:
         def handle_client_info(data):
             """处理客户端信息"""
             sid = request.sid
+            try:
+                data = decode_message(data)
+            except ValueError as e:
+                logger.warning(f"无法解析客户端信息 (来自: {sid}): {e}")
+                return
             client_type = data.get('type', 'unknown')
-            platform = data.get('platform', 'unknown')
-
-            client_info = {
-                'sid': sid,
-                'type': client_type,
-                'platform': platform,
-                'ip': request.remote_addr,
-                'connect_time': datetime.now().isoformat(),
-                'version': data.get('version', 'unknown')
-            }
 
             if client_type == 'mobile_client':
-                self.mobile_clients[sid] = client_info
-                logger.info(f"手机端连接: {sid} (平台: {platform})")
-                emit('server_response', {
-                    'status': 'registered',
-                    'message': '手机端已注册',
-                    'client_type': 'mobile'
-                })
+                session, resumed = self.sessions.register(sid, data, request.remote_addr, 'socketio',
+                                                          negotiate_encoding(data.get('encodings')))
+                if session is None:
+                    # token已过期（如PC端重启过），客户端需要发送完整的client_info重新注册
+                    emit('server_response', {'status': 'resume_failed', 'message': '会话已过期'})
+                    return
+                self._capture_client_info(sid, data, session, resumed)
+                logger.info(f"手机端{'恢复' if resumed else '连接'}: {sid} "
+                            f"(平台: {session.platform}, 编码: {session.encoding})")
+                # 注册响应始终使用JSON，客户端据此切换编码
+                emit('server_response', self._registered_message(session, resumed))
+                # 输入队列正在积压时，新注册的手机端也需要知道流控状态
+                if self.injection_queue.flow_state != 'normal':
+                    emit('flow_control', self._flow_control_message(
+                        self.injection_queue.flow_state, self.injection_queue.depth
+                    ))
             else:
+                if self.capture:
+                    self.capture.record('client_info', sid, data)
                 logger.warning(f"未知客户端类型: {client_type}")
 
+        @self.socketio.on('count_mode')
+        def handle_count_mode(data):
+            """手机端开启/提交/放弃盘点"""
+            sid = request.sid
+            try:
+                data = decode_message(data)
+            except ValueError:
+                return
+            if sid not in self.mobile_clients:
+                return
+            try:
+                response = self._handle_count_action(data.get('action'))
+            except ValueError as e:
+                self._send(sid, 'count_mode', dict(self.inventory.state(), error=str(e)))
+                return
+            if data.get('action') == 'status':
+                # 其他操作的结果已随盘点状态广播给所有手机端
+                self._send(sid, 'count_mode', response['state'])
+
+        @self.socketio.on('client_metrics')
+        def handle_client_metrics(data):
+            """处理手机端上报的性能指标"""
+            try:
+                self._record_client_metrics(decode_message(data), self.mobile_clients.get(request.sid, {}).get('device_id'))
+            except ValueError:
+                pass
+
+        @self.socketio.on('clock_ping')
+        def handle_clock_ping(data):
+            """时钟同步ping：回复服务器收到/发出的时间"""
+            received = now_ms()
+            self.sessions.touch(request.sid)
+            try:
+                data = decode_message(data)
+            except ValueError:
+                return
+            self._send(request.sid, 'clock_pong', self._clock_pong(data.get('t0'), received))
+
+        @self.socketio.on('clock_sample')
+        def handle_clock_sample(data):
+            """手机端回传完整的ping交换时间，用于估算时钟偏差"""
+            try:
+                self._record_clock_sample(request.sid, decode_message(data))
+            except ValueError:
+                pass
+
+        @self.socketio.on('trace_ack')
+        def handle_trace_ack(data):
+            """手机端收到扫码确认的时间，结束该次追踪"""
+            try:
+                data = decode_message(data)
+            except ValueError:
+                return
+            self._complete_trace(data.get('trace_id'), data.get('ack_ts'))
+
+        @self.socketio.on('scan_frame')
+        def handle_scan_frame(data):
+            """处理手机端发送的灰度帧（二进制附件），在进程池中解码"""
+            sid = request.sid
+            self.sessions.touch(sid)
+            if not self.frame_decoder or not isinstance(data, dict) or self.draining:
+                return
+            try:
+                accepted = self.frame_decoder.submit(sid, data)
+            except (KeyError, TypeError, ValueError) as e:
+                logger.warning(f"无法处理帧 (来自: {sid}): {e}")
+                return
+            if not accepted:
+                # 进程池忙：丢弃该帧，手机端收到后立即发送最新画面
+                self._send(sid, 'frame_result', {'frame_id': data.get('frame_id'), 'dropped': True})
+
         @self.socketio.on('scan_result')
         def handle_scan_result(data):
             """处理扫码结果"""
-            barcode = data.get('barcode', '')
-            client_info = self.mobile_clients.get(request.sid, {})
+            sid = request.sid
+            self.sessions.touch(sid)
+            try:
+                with spans.span('scan.decode'):
+                    data = decode_message(data)
+            except ValueError as e:
+                logger.warning(f"无法解析扫码消息 (来自: {sid}): {e}")
+                return
+            client_info = self.mobile_clients.get(sid) or {'sid': sid, 'ip': request.remote_addr}
+            with spans.span('scan.process'):
+                self._process_scan(sid, client_info, data, lambda confirm: self._send(sid, 'scan_confirm', confirm))
 
-            if barcode:
-                self.scan_count += 1
-                # 打印H5页面上报的条码
+    def _process_scan(self, sid, client_info, data, reply):
+        """
+        扫码处理流程（限流 -> 规则 -> 商品目录 -> 键盘输入队列）
+
+        Args:
+            sid: 连接ID
+            client_info: 客户端信息
+            data: 扫码消息（已解码）
+            reply: 发送确认消息的函数 reply(confirm_dict)，可能在输入线程中调用
+        """
+        received = now_ms()
+        if not isinstance(data, dict):
+            data = {}
+        barcode = data.get('barcode', '')
+        rule_context = {}
+
+        if self.capture:
+            reply = self._capture_scan(sid, data, reply)
+
+        trace_id = data.get('trace_id')
+        if trace_id:
+            # 重复、限流等立即回复的确认也带上追踪ID，客户端可据此对应每次扫码
+            reply = functools.partial(self._reply_with_trace_id, str(trace_id)[:64], reply)
+
+        # 条码必须是字符串（规则、商品目录、重复抑制都按字符串处理），与HTTP批量提交的检查一致
+        if not isinstance(barcode, str):
+            logger.warning(f"条码格式错误: {barcode!r} (来自: {sid})")
+            self._record_scan(str(barcode)[:200], client_info, 'rejected', '条码格式错误', received=received)
+            reply({
+                'status': 'error',
+                'message': '条码格式错误'
+            })
+            return
+
+        if self.draining:
+            reply({
+                'status': 'throttled',
+                'barcode': barcode,
+                'message': '服务器正在重启，请稍候',
+                'retry_after_ms': 1000
+            })
+            return
+
+        # 限流：单连接令牌桶 + 全局令牌桶（HTTP批量提交使用独立的限流器，按批记录日志）
+        http_client = client_info.get('type') == 'http_client'
+        limiter = self.ingest_limiter if http_client else self.rate_limiter
+        with spans.span('scan.rate_limit'):
+            allowed, retry_after = limiter.acquire(sid)
+        if not allowed:
+            if not http_client:
+                logger.warning(f"扫码被限流: {barcode} (来自: {sid})")
+            self._record_scan(barcode, client_info, 'throttled', received=received)
+            reply({
+                'status': 'throttled',
+                'barcode': barcode,
+                'message': '扫码过快，请稍后重试',
+                'retry_after_ms': int(retry_after * 1000) + 1
+            })
+            return
+
+        if barcode and self.rule_engine:
+            try:
+                with spans.span('scan.rules'):
+                    barcode, rule_context = self.rule_engine.apply(barcode)
+            except RuleRejected as e:
+                logger.warning(f"条码未通过规则[{e.rule_name}]: {barcode} ({e.message})")
+                self._record_scan(barcode, client_info, 'rejected', e.message, received=received)
+                reply({
+                    'status': 'error',
+                    'barcode': barcode,
+                    'message': e.message
+                })
+                return
+
+        with spans.span('scan.catalog'):
+            product = self.catalog.lookup(barcode) if barcode and self.catalog else None
+        if barcode and self.catalog_required and self.catalog.ready and product is None:
+            logger.warning(f"条码不在商品目录中: {barcode}")
+            self._record_scan(barcode, client_info, 'rejected', '商品目录中不存在该条码', received=received)
+            reply({
+                'status': 'error',
+                'barcode': barcode,
+                'message': '商品目录中不存在该条码'
+            })
+            return
+
+        # 盘点模式：只计数，不做重复抑制也不输入
+        if barcode and self.inventory.active and self._count_scan(client_info, data, barcode, product, received, reply):
+            return
+
+        # 重复扫码抑制：同一条码在窗口内已被接受时只回复duplicate
+        station = client_info.get('device_id') or client_info.get('ip')
+        if barcode and self.dedup.enabled:
+            symbology = rule_context.get('symbology') or data.get('format') or detect_symbology(barcode)
+            with spans.span('scan.dedup'):
+                age = self.dedup.check(barcode, symbology, station)
+            if age is not None:
+                logger.info(f"重复扫码已忽略: {barcode} ({age:.0f}ms前已接受, 来自: {sid})")
+                self._record_scan(barcode, client_info, 'duplicate', received=received)
+                reply({
+                    'status': 'duplicate',
+                    'barcode': barcode,
+                    'message': '重复扫码，已忽略',
+                    'first_seen_ms_ago': int(age)
+                })
+                return
+
+        if barcode:
+            # 打印H5页面上报的条码
+            with spans.span('scan.log'):
                 logger.info(f"=*==*==*==*==*==*==*==*==*==*==*==*==*==*==*==*==*==*==*==*=")
                 logger.info(f"H5页面扫码上报: {barcode}")
-                logger.info(f"手机平台: {client_info.get('platform', 'unknown')}, 连接ID: {request.sid}")
+                logger.info(f"手机平台: {client_info.get('platform', 'unknown')}, 连接ID: {sid}")
                 logger.info(f"=*==*==*==*==*==*==*==*==*==*==*==*==*==*==*==*==*==*==*==*=")
 
-                # 模拟键盘输入条码并添加回车符
-                logger.info(f"正在模拟键盘输入条码: {barcode}")
-                keyboard_success = simulate_keyboard_input(barcode)
+            # 确认消息在键盘输入完成后发送
+            confirm = {
+                'status': 'success',
+                'barcode': barcode
+            }
+            if 'gs1' in rule_context:
+                confirm['gs1'] = rule_context['gs1']
+            if product is not None:
+                confirm['product'] = product
+
+            trace = None
+            trace_id = data.get('trace_id')
+            if trace_id:
+                trace = self.tracer.begin(
+                    str(trace_id)[:64], client_info.get('device_id') or client_info.get('ip'), sid, barcode,
+                    to_epoch_ms(data.get('timestamp')), to_epoch_ms(data.get('emit_ts')), received
+                )
+                confirm['trace_id'] = trace.trace_id
+
+            def on_injected(keyboard_success, started, finished):
+                if trace is not None:
+                    trace.inject_start = started * 1000
+                    trace.inject_end = finished * 1000
                 if keyboard_success:
                     logger.info("✓ 键盘模拟输入成功")
                 else:
                     logger.error("✗ 键盘模拟输入失败")
+                self._record_scan(barcode, client_info, 'success' if keyboard_success else 'input_failed', received=received)
 
                 # 通过回调通知PC客户端（如果设置了回调）
                 if self.barcode_callback:
                     try:
-                        self.barcode_callback(barcode)
+                        with spans.span('scan.callback'):
+                            self.barcode_callback(barcode)
                     except Exception as e:
                         logger.error(f"调用条码回调失败: {e}")
 
-                # 确认收到并打印确认消息
-                emit('scan_confirm', {
-                    'status': 'success',
-                    'barcode': barcode
-                })
+                with spans.span('scan.ack'):
+                    reply(confirm)
                 logger.info(f"已确认收到条码: {barcode}")
+
+            # 模拟键盘输入条码并添加回车符（排队由输入线程依次执行）
+            logger.info(f"正在模拟键盘输入条码: {barcode}")
+            with spans.span('scan.enqueue'):
+                submitted = self.injection_queue.submit(barcode, on_injected)
+            if submitted:
+                self.scan_count += 1
             else:
-                logger.warning(f"收到空条码 (来自: {request.sid})")
-                emit('scan_confirm', {
-                    'status': 'error',
-                    'message': '条码不能为空'
+                if trace is not None:
+                    self.tracer.discard(trace.trace_id)
+                self.dedup.forget(barcode, station)
+                if not http_client:
+                    logger.warning(f"键盘输入队列已满，拒绝条码: {barcode}")
+                self._record_scan(barcode, client_info, 'throttled', '输入队列已满', received=received)
+                reply({
+                    'status': 'throttled',
+                    'barcode': barcode,
+                    'message': 'PC端输入繁忙，请稍后重试',
+                    'retry_after_ms': 1000
                 })
+        else:
+            logger.warning(f"收到空条码 (来自: {sid})")
+            reply({
+                'status': 'error',
+                'message': '条码不能为空'
+            })
+
+    def _count_scan(self, client_info, data, barcode, product, received, reply):
+        """
+        盘点模式下的扫码：累加数量并回复当前数量
+
+        Returns:
+            bool: 是否已计数（盘点刚好结束时返回False，按普通扫码处理）
+        """
+        quantity = data.get('quantity', 1)
+        if not isinstance(quantity, int) or isinstance(quantity, bool) or not -10000 <= quantity <= 10000:
+            quantity = 1
+        count = self.inventory.add(barcode, quantity)
+        if count is None:
+            return False
+        self._record_scan(barcode, client_info, 'counted', f"数量 {count}", received=received)
+        confirm = {
+            'status': 'counted',
+            'barcode': barcode,
+            'count': count,
+            'inventory': self.inventory.state()
+        }
+        if product is not None:
+            confirm['product'] = product
+        reply(confirm)
+        return True
+
+    def start_count(self):
+        """开始盘点（手机端或PC端调用），通知所有手机端"""
+        if self.inventory.start():
+            logger.info(f"盘点模式已开启: {self.inventory.count_id}")
+        self._broadcast_count_mode()
+        return self.inventory.state()
+
+    def commit_count(self, keyboard_delay=0):
+        """
+        提交盘点：结束盘点并按 INVENTORY_COMMIT_TARGETS 输出每个条码的数量
+
+        Args:
+            keyboard_delay: 开始键盘输入前等待的秒数（在PC端提交时留出切换到目标程序的时间）
+
+        Returns:
+            dict: {count_id, skus, total, file}；未在盘点中返回None
+        """
+        count_id, items = self.inventory.finish()
+        if count_id is None:
+            return None
+        result = {'count_id': count_id, 'skus': len(items), 'total': sum(quantity for _, quantity in items)}
+        logger.info(f"提交盘点 {count_id}: {result['skus']} 个条码，共 {result['total']} 件")
+        self._emit_count(count_id, items, result, keyboard_delay)
+        self._broadcast_count_mode(result=result)
+        return result
+
+    def discard_count(self):
+        """放弃盘点（不输出结果）"""
+        count_id, items = self.inventory.finish()
+        if count_id is None:
+            return None
+        logger.warning(f"盘点 {count_id} 已放弃 ({len(items)} 个条码)")
+        self._broadcast_count_mode()
+        return {'count_id': count_id, 'skus': len(items), 'discarded': True}
+
+    def _emit_count(self, count_id, items, result, keyboard_delay=0):
+        """输出盘点结果：文件和转发立即完成，键盘输入在后台线程中逐行排队"""
+        if not items:
+            return
+        if 'file' in self.inventory_targets:
+            try:
+                result['file'] = write_count_file(self.inventory_dir, count_id, items, self.station)
+                logger.info(f"盘点结果已写入: {result['file']}")
+            except OSError as e:
+                result['error'] = f"写入盘点文件失败: {e}"
+                logger.error(result['error'])
+        if 'forward' in self.inventory_targets and self.forwarder:
+            ts = now_ms()
+            for barcode, quantity in items:
+                self.forwarder.submit({'type': 'inventory', 'count_id': count_id, 'barcode': barcode,
+                                       'quantity': quantity, 'ts': ts, 'station': self.station})
+        if 'keyboard' in self.inventory_targets:
+            lines = [f"{barcode}{self.inventory_separator}{quantity}" for barcode, quantity in items]
+            threading.Thread(target=self._type_count_lines, args=(count_id, lines, keyboard_delay),
+                             name='InventoryCommit', daemon=True).start()
+
+    def _type_count_lines(self, count_id, lines, delay=0):
+        """逐行提交到键盘输入队列，队列满时等待（与手机扫码共用同一个输入线程，不会交错）"""
+        if delay:
+            time.sleep(delay)
+        for line in lines:
+            while not self.injection_queue.submit(line):
+                time.sleep(0.2)
+        logger.info(f"盘点 {count_id} 的 {len(lines)} 行已提交键盘输入")
+
+    def _broadcast_count_mode(self, result=None):
+        """向所有手机端发送盘点状态"""
+        message = dict(self.inventory.state(), result=result) if result else self.inventory.state()
+        self.socketio.emit('count_mode', message)
+        if self.raw_ws:
+            self.raw_ws.broadcast('I' + json.dumps(message, ensure_ascii=False, separators=(',', ':')))
+
+    def _handle_count_action(self, action):
+        """
+        执行盘点操作（手机端 count_mode 消息、POST /api/inventory）
+
+        Returns:
+            dict: 操作结果（含当前盘点状态）
+
+        Raises:
+            ValueError: 未知操作
+        """
+        if action == 'start':
+            return {'state': self.start_count()}
+        if action == 'commit':
+            result = self.commit_count()
+        elif action == 'discard':
+            result = self.discard_count()
+        elif action == 'status':
+            result = None
+        else:
+            raise ValueError(f"未知的盘点操作: {action}")
+        return {'state': self.inventory.state(), 'result': result}
+
+    @staticmethod
+    def _reply_with_trace_id(trace_id, reply, confirm):
+        if 'trace_id' not in confirm:
+            confirm = dict(confirm, trace_id=trace_id)
+        reply(confirm)
+
+    def _capture_scan(self, sid, data, reply):
+        """录制扫码消息，返回同时录制确认消息的reply"""
+        seq = self.capture.next_seq()
+        self.capture.record('scan', sid, data, seq)
+
+        def capturing_reply(confirm):
+            self.capture.record('confirm', sid, confirm, seq)
+            reply(confirm)
+        return capturing_reply
+
+    def _decode_upload_stream(self, sid, client_info, paths, workdir):
+        """批量解码并逐条提交识别到的条码，产出NDJSON行"""
+        from utils.bulk_decode import iter_tasks
+
+        confirms = queue.Queue()
+        submitted = 0
+        received = 0
+
+        def line(data):
+            return json.dumps(data, ensure_ascii=False) + '\n'
+
+        try:
+            for result in self.bulk_decoder.run(iter_tasks(paths)):
+                # 显示名称去掉临时文件的序号前缀
+                result['name'] = result['name'].split('-', 1)[-1]
+                yield line(dict(result, type='decoded'))
+                for barcode, symbology in result['codes']:
+                    source = result['name']
+                    self._submit_scan(sid, client_info, {'barcode': barcode, 'format': symbology},
+                                      lambda confirm, source=source: confirms.put(dict(confirm, source=source)))
+                    submitted += 1
+                while not confirms.empty():
+                    received += 1
+                    yield line(dict(confirms.get(), type='confirm'))
+
+            # 等待队列中的条码输入完成
+            deadline = time.monotonic() + max(30.0, submitted * 0.5)
+            while received < submitted and time.monotonic() < deadline:
+                try:
+                    confirm = confirms.get(timeout=0.5)
+                except queue.Empty:
+                    continue
+                received += 1
+                yield line(dict(confirm, type='confirm'))
+        finally:
+            self.rate_limiter.remove(sid)
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    @staticmethod
+    def _iter_ndjson(stream):
+        """逐行解析NDJSON请求体，无法解析的行产出 ValueError"""
+        for raw in stream:
+            raw = raw.strip()
+            if not raw:
+                continue
+            try:
+                yield json.loads(raw)
+            except ValueError as e:
+                yield ValueError(f"JSON格式错误: {e}")
+
+    def _ingest_stream(self, items, ip, station, wait):
+        """
+        依次处理HTTP提交的扫码，产出每项结果的NDJSON行（按提交顺序）
+
+        Args:
+            items: 条码字符串或扫码消息dict的迭代器
+            ip: 请求方地址
+            station: 默认工位标识（每项可用station覆盖）
+            wait: 是否等待键盘输入完成后再返回最终确认
+        """
+        # 限流桶按请求方地址计：每项的station由调用方填写，不能用来区分限流
+        sid = f"http-{ip}"
+        with self._ingest_lock:
+            self._ingest_requests[sid] = self._ingest_requests.get(sid, 0) + 1
+        try:
+            yield from self._ingest_items(items, sid, ip, station, wait)
+        finally:
+            with self._ingest_lock:
+                remaining = self._ingest_requests.pop(sid, 1) - 1
+                if remaining > 0:
+                    self._ingest_requests[sid] = remaining
+                else:
+                    self.ingest_limiter.remove(sid)
+
+    def _ingest_items(self, items, sid, ip, station, wait):
+        """_ingest_stream 的处理循环（sid为本次请求的限流桶ID）"""
+        confirms = queue.Queue()
+        clients = {}
+        pending = 0
+        throttled = 0
+
+        def line(data):
+            return json.dumps(data, ensure_ascii=False) + '\n'
+
+        def client_for(name):
+            client_info = clients.get(name)
+            if client_info is None:
+                client_info = clients[name] = {
+                    'sid': sid,
+                    'type': 'http_client',
+                    'platform': 'http',
+                    'ip': ip,
+                    'device_id': name or ip
+                }
+            return client_info
+
+        for index, item in enumerate(items):
+            if isinstance(item, str):
+                item = {'barcode': item}
+            if not isinstance(item, dict) or not isinstance(item.get('barcode', ''), str):
+                message = str(item) if isinstance(item, ValueError) else '每项应为条码字符串或包含barcode的对象'
+                yield line({'index': index, 'status': 'error', 'message': message})
+                continue
+
+            client_info = client_for(str(item.get('station') or station or '')[:64] or None)
+            confirm = self._try_scan(client_info['sid'], client_info, item,
+                                     lambda confirm, index=index: confirms.put(dict(confirm, index=index)))
+            if confirm is None:
+                if not wait:
+                    yield line({'index': index, 'status': 'queued', 'barcode': item.get('barcode')})
+                else:
+                    pending += 1
+            else:
+                if confirm.get('status') == 'throttled':
+                    throttled += 1
+                yield line(dict(confirm, index=index))
+
+            # 等待模式下已完成输入的确认随时返回
+            while wait and not confirms.empty():
+                pending -= 1
+                yield line(confirms.get())
+
+        deadline = time.monotonic() + max(30.0, pending * 0.5)
+        while wait and pending > 0 and time.monotonic() < deadline:
+            try:
+                confirm = confirms.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            pending -= 1
+            yield line(confirm)
+
+        if throttled:
+            logger.warning(f"HTTP批量提交中 {throttled} 条被限流或输入队列已满 (来自: {ip})")
+
+    def _create_ingest_limiter(self):
+        """创建HTTP批量提交的限流器（INGEST_RATE_*）"""
+        rate = float(os.getenv('INGEST_RATE_LIMIT', '5000'))
+        global_rate = float(os.getenv('INGEST_RATE_LIMIT_GLOBAL', '10000'))
+        return RateLimiter(
+            client_rate=rate,
+            client_burst=float(os.getenv('INGEST_RATE_BURST') or rate),
+            global_rate=global_rate,
+            global_burst=global_rate
+        )
+
+    def _try_scan(self, sid, client_info, data, on_confirm):
+        """
+        提交一条扫码，区分立即返回的结果和入队后在输入完成时送达的确认
+
+        Args:
+            on_confirm: 入队后的确认回调（在输入线程中调用）
+
+        Returns:
+            dict: 未入队时的确认消息（被限流、拒绝、重复等）；已入队返回None
+        """
+        lock = threading.Lock()
+        state = {'returned': False, 'confirm': None}
+
+        def reply(confirm):
+            with lock:
+                if not state['returned']:
+                    state['confirm'] = confirm
+                    return
+            on_confirm(confirm)
+
+        self._process_scan(sid, client_info, data, reply)
+        with lock:
+            state['returned'] = True
+            return state['confirm']
+
+    def _submit_scan(self, sid, client_info, data, on_confirm, max_wait=30.0):
+        """
+        提交一条非实时扫码（批量解码/导入），被限流时按建议的时间等待后重试
+
+        Args:
+            on_confirm: 确认回调，每条扫码只调用一次（可能在输入线程中调用）
+
+        Returns:
+            bool: 是否已进入输入队列
+        """
+        deadline = time.monotonic() + max_wait
+        while True:
+            confirm = self._try_scan(sid, client_info, data, on_confirm)
+            if confirm is None:
+                # 已入队，确认在输入完成后送达
+                return True
+            if confirm.get('status') == 'throttled' and time.monotonic() < deadline:
+                time.sleep(confirm.get('retry_after_ms', 1000) / 1000)
+                continue
+            on_confirm(confirm)
+            return confirm.get('status') in ('success', 'counted')
+
+    def _on_frame_decoded(self, sid, frame, results, timings):
+        """帧解码完成（进程池回调线程）：返回解码结果，识别到的条码走正常扫码流程"""
+        self._send(sid, 'frame_result', dict(timings, frame_id=frame.get('frame_id'),
+                                             found=[text for text, _ in results]))
+        client_info = self.mobile_clients.get(sid)
+        if client_info is None:
+            return
+        for text, symbology in results:
+            if self.inventory.active and not self.inventory_presence.accept(sid, text):
+                # 盘点时商品仍在画面中，不重复计数
+                continue
+            self._process_scan(sid, client_info, {
+                'barcode': text,
+                'format': symbology,
+                'timestamp': frame.get('timestamp'),
+                'trace_id': frame.get('trace_id')
+            }, lambda confirm: self._send(sid, 'scan_confirm', confirm))
+
+    def _capture_client_info(self, sid, data, session, resumed):
+        """录制注册信息；恢复的会话录制为完整信息（不含token），重放时按普通注册处理"""
+        if not self.capture:
+            return
+        if resumed:
+            data = {
+                'type': 'mobile_client',
+                'platform': session.platform,
+                'version': session.version,
+                'device_id': session.device_id,
+                'encodings': [session.encoding]
+            }
+        else:
+            data = {key: value for key, value in data.items() if key != 'resume_token'}
+        self.capture.record('client_info', sid, data)
+
+    def _registered_message(self, session, resumed):
+        """注册成功响应，resume_token供手机端重连时恢复会话，inventory为当前盘点状态"""
+        return {
+            'status': 'registered',
+            'message': '手机端已恢复' if resumed else '手机端已注册',
+            'client_type': 'mobile',
+            'encoding': session.encoding,
+            'resume_token': session.resume_token,
+            'resumed': resumed,
+            'inventory': self.inventory.state()
+        }
+
+    def _send(self, sid, event, data):
+        """按该连接协商的编码（JSON/MessagePack）发送消息"""
+        encoding = self.mobile_clients.get(sid, {}).get('encoding', ENCODING_JSON)
+        self.socketio.emit(event, encode_message(data, encoding), to=sid)
+
+    def _on_flow_change(self, state, depth):
+        """输入队列积压变化时向所有手机端发送流控消息"""
+        message = self._flow_control_message(state, depth)
+        self.socketio.emit('flow_control', message)
+        if self.raw_ws:
+            self.raw_ws.broadcast_flow_control(message)
+
+    def _flow_control_message(self, state, depth, reason=None):
+        """构造流控消息"""
+        message = {
+            'state': state,
+            'queue_depth': depth,
+            'delay_ms': self.flow_slow_delay_ms if state == 'slow' else 0
+        }
+        if reason:
+            message['reason'] = reason
+        return message
+
+    def _clock_pong(self, t0, received):
+        """构造时钟同步回复 {t0: 手机发出, t1: 服务器收到, t2: 服务器发出}"""
+        return {'t0': t0, 't1': received, 't2': now_ms()}
+
+    def _record_clock_sample(self, sid, data):
+        """记录一次完整的ping交换（t0/t3为手机时钟，t1/t2为PC时钟）"""
+        try:
+            t0, t1, t2, t3 = (float(data[k]) for k in ('t0', 't1', 't2', 't3'))
+        except (KeyError, TypeError, ValueError):
+            return
+        client_info = self.mobile_clients.get(sid, {})
+        self.tracer.add_clock_sample(client_info.get('device_id') or client_info.get('ip') or sid, t0, t1, t2, t3)
+
+    def _complete_trace(self, trace_id, ack_ts):
+        """手机端确认后结束追踪，慢扫码记录日志"""
+        ack_ms = to_epoch_ms(ack_ts)
+        if not trace_id or ack_ms is None:
+            return
+        trace = self.tracer.complete(str(trace_id), ack_ms)
+        if trace is not None:
+            total = trace.stages()['total']
+            if total is not None and total >= self.tracer.slow_threshold_ms:
+                logger.warning(f"慢扫码: {trace.barcode} 总耗时 {total}ms (设备: {trace.device}, 追踪ID: {trace.trace_id})")
+
+    def _record_client_metrics(self, data, device=None):
+        """
+        记录手机端上报的指标
+
+        Args:
+            data: {'transport': 'websocket', 'metrics': {'connect_ready_ms': 120, ...}}
+            device: 上报的手机（device_id），相机指标按手机分别记录
+        """
+        # 格式不对的上报直接忽略（两种连接方式都在这里检查，异常不会中断连接）
+        if not isinstance(data, dict) or not isinstance(data.get('metrics') or {}, dict):
+            return
+        transport = str(data.get('transport', 'unknown'))[:20]
+        for name, value in (data.get('metrics') or {}).items():
+            if not isinstance(value, (int, float)):
+                continue
+            name = str(name)[:40]
+            if device and name.startswith('camera_'):
+                self._record_device_metric(device, name, float(value))
+            key = f"{name}:{transport}"
+            values = self.client_metrics.get(key)
+            if values is None:
+                if len(self.client_metrics) >= 100:
+                    continue
+                values = self.client_metrics[key] = deque(maxlen=500)
+            values.append(float(value))
+
+    def _record_device_metric(self, device, name, value):
+        metrics = self.device_metrics.get(device)
+        if metrics is None:
+            if len(self.device_metrics) >= 200:
+                return
+            metrics = self.device_metrics[device] = {}
+        values = metrics.get(name)
+        if values is None:
+            if len(metrics) >= 20:
+                return
+            values = metrics[name] = deque(maxlen=50)
+        values.append(value)
+
+    def get_device_metrics(self):
+        """各手机的相机启动指标 {device_id: {指标: {count, p50, last}}}"""
+        summary = {}
+        for device, metrics in list(self.device_metrics.items()):
+            summary[device] = {}
+            for name, values in list(metrics.items()):
+                ordered = sorted(values)
+                if ordered:
+                    summary[device][name] = {
+                        'count': len(ordered),
+                        'p50': ordered[len(ordered) // 2],
+                        'last': values[-1]
+                    }
+        return summary
+
+    def get_client_metrics(self):
+        """汇总手机端指标（按指标名和传输方式）"""
+        summary = {}
+        for key, values in list(self.client_metrics.items()):
+            ordered = sorted(values)
+            if not ordered:
+                continue
+            summary[key] = {
+                'count': len(ordered),
+                'avg': round(sum(ordered) / len(ordered), 1),
+                'p50': ordered[len(ordered) // 2],
+                'p95': ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+            }
+        return summary
+
+    def add_scan_listener(self, listener):
+        """
+        注册扫码记录监听 listener(record)
+
+        record: {barcode, status, message, ts(epoch毫秒), device_id, platform, ip, latency_ms}，
+        latency_ms为服务器收到扫码到得出结果（含排队和键盘输入）的耗时
+        """
+        self.scan_listeners.append(listener)
+
+    def _record_scan(self, barcode, client_info, status, message=None, received=None):
+        """记录扫码历史、转发到下游系统并通知监听（只入队，不阻塞扫码处理）"""
+        if self.history:
+            self.history.record(barcode, client_info, status, message)
+        if not self.scan_listeners and not (self.forwarder and status in self.forward_statuses):
+            return
+        ts = now_ms()
+        record = {
+            'barcode': barcode,
+            'status': status,
+            'message': message,
+            'ts': ts,
+            'device_id': client_info.get('device_id'),
+            'platform': client_info.get('platform'),
+            'ip': client_info.get('ip')
+        }
+        if self.forwarder and status in self.forward_statuses:
+            self.forwarder.submit(dict(record, station=self.station))
+        if self.scan_listeners:
+            record['latency_ms'] = ts - received if received is not None else None
+            for listener in self.scan_listeners:
+                try:
+                    listener(record)
+                except Exception as e:
+                    logger.error(f"扫码记录监听出错: {e}")
+
+    def _dashboard_state(self):
+        """看板中来自服务器的部分：输入队列、在线设备"""
+        devices = {}
+        for session in list(self.mobile_clients.values()):
+            devices[session.get('device_id') or session.get('sid')] = {
+                'platform': session.get('platform'),
+                'transport': session.get('transport'),
+                'ip': session.get('ip'),
+                'since': session.get('connect_time')
+            }
+        return {
+            'queue': {'depth': self.injection_queue.depth, 'state': self.injection_queue.flow_state},
+            'devices': devices,
+            'connections': self.sessions.connection_count,
+            'scan_count': self.scan_count
+        }
 
     def get_local_ip(self):
         """获取本机IP地址"""
@@ -211,16 +1362,53 @@ class BarcodeGunServer:
             'port': self.port,
             'ip': self.get_local_ip(),
             'mobile_clients': len(self.mobile_clients),
-            'total_connections': len(self.mobile_clients),
+            'total_connections': self.sessions.connection_count,
             'scan_count': self.scan_count,
             'start_time': self.start_time.isoformat(),
-            'uptime': str(datetime.now() - self.start_time)
+            'uptime': str(datetime.now() - self.start_time),
+            'rules': self.rule_engine.get_stats() if self.rule_engine else [],
+            'catalog': self.catalog.get_stats() if self.catalog else None,
+            'history': self.history.get_stats() if self.history else None,
+            'capture': self.capture.get_stats() if self.capture else None,
+            'inventory': self.inventory.state(),
+            'dashboard': self.dashboard.get_stats() if self.dashboard else None,
+            'forwarder': self.forwarder.get_stats() if self.forwarder else None,
+            'sessions': self.sessions.get_stats(),
+            'ping': {'interval': self.ping_interval, 'timeout': self.ping_timeout},
+            'rate_limit': self.rate_limiter.get_stats(),
+            'ingest_rate_limit': self.ingest_limiter.get_stats(),
+            'injection': self.injection_queue.get_stats(),
+            'injection_profiles': self._injection_profile_stats(),
+            'transports': self.transports,
+            'raw_ws_clients': self.raw_ws.connection_count if self.raw_ws else 0,
+            'client_metrics': self.get_client_metrics(),
+            'device_metrics': self.get_device_metrics(),
+            'tracing': self.tracer.get_stats(),
+            'dedup': self.dedup.get_stats(),
+            'frame_decoder': self.frame_decoder.get_stats() if self.frame_decoder else None,
+            'process': {
+                'pid': os.getpid(),
+                'rss_kb': current_rss_kb(),
+                'threads': threading.active_count()
+            }
         }
 
+    def _injection_profile_stats(self):
+        try:
+            profiles = keyboard_simulator.get_profiles()
+        except Exception as e:
+            return {'error': str(e)}
+        return profiles.get_stats() if profiles else None
+
     def _signal_handler(self, signum, frame):
-        """信号处理"""
-        logger.info(f"接收到信号 {signum}，正在关闭服务器...")
-        self.stop()
+        """信号处理（在独立线程中执行，避免在服务线程内等待自身退出）"""
+        if hasattr(signal, 'SIGHUP') and signum == signal.SIGHUP:
+            logger.info("接收到SIGHUP，正在平滑重启服务器...")
+            target = self.restart
+        else:
+            logger.info(f"接收到信号 {signum}，正在关闭服务器...")
+            target = self.stop
+        threading.Thread(target=target, name='ServerShutdown', daemon=True).start()
 
     def start(self):
         """启动HTTPS服务器（包含HTTP和WebSocket）"""
@@ -245,41 +1433,206 @@ class BarcodeGunServer:
                 logger.error("无法创建SSL上下文")
                 return
 
-            logger.info(f"HTTPS/WSS服务器启动于 {self.host}:{self.port}")
+            # 重启时直接使用旧进程传入的监听socket，不需要重新绑定端口
+            inherited_fd = os.environ.pop(LISTEN_FD_ENV, None)
+            if inherited_fd:
+                logger.info(f"继承监听socket (fd={inherited_fd})")
 
             # 启动Flask + SocketIO服务器（WebSocket通过HTTP端口自动升级）
-            # 注意：必须在主线程中运行，使用socketio.run()而不是app.run()
-            self.socketio.run(
+            # 与socketio.run()在threading模式下相同，使用Werkzeug多线程服务器；
+            # 这里直接创建服务器对象，以便重启时停止接受连接并移交监听socket
+            from werkzeug.serving import make_server
+            self.http_server = make_server(
+                self.host,
+                self.port,
                 self.app,
-                host=self.host,
-                port=self.port,
-                debug=False,
-                use_reloader=False,
-                log_output=False,  # 关闭日志输出避免性能问题
+                threaded=True,
                 ssl_context=ssl_context,
-                allow_unsafe_werkzeug=True  # 允许在threading模式下使用Werkzeug
+                fd=int(inherited_fd) if inherited_fd else None
             )
 
+            logger.info(f"HTTPS/WSS服务器启动于 {self.host}:{self.port}")
+            self._notify_parent_ready()
+            if self.on_ready:
+                try:
+                    self.on_ready(self)
+                except Exception as e:
+                    logger.error(f"就绪回调失败: {e}")
+            self.http_server.serve_forever()
+
         except Exception as e:
             logger.error(f"服务器运行出错: {e}", exc_info=True)
             self.running = False
 
-    def stop(self):
-        """停止HTTPS服务器"""
+    def reload_config(self):
+        """
+        重新读取.env并应用可在运行时调整的配置，不中断连接：
+        条码规则、限流、输入队列水位、流控延迟、商品目录（CSV变化时重建索引）及强制校验、慢扫码阈值、输入配置。
+        端口、证书、传输方式等需要重启（SIGHUP）才能生效。
+        """
+        load_dotenv(override=True)
+
+        rules_file = self.rules_file or os.getenv('BARCODE_RULES_FILE')
+        try:
+            self.rule_engine = BarcodeRuleEngine.from_file(rules_file) if rules_file else None
+        except Exception as e:
+            # 新规则有误时保留原规则继续运行
+            logger.error(f"重新加载条码规则失败，继续使用原规则: {e}")
+
+        # 令牌桶随限流器一起重建，已有连接的计数清零
+        self.rate_limiter = RateLimiter(
+            client_rate=float(os.getenv('RATE_LIMIT_PER_CLIENT', '20')),
+            client_burst=float(os.getenv('RATE_LIMIT_BURST', '10')),
+            global_rate=float(os.getenv('RATE_LIMIT_GLOBAL', '50')),
+            global_burst=float(os.getenv('RATE_LIMIT_GLOBAL_BURST', '50'))
+        )
+        self.ingest_limiter = self._create_ingest_limiter()
+
+        self.injection_queue.max_size = int(os.getenv('INJECTION_QUEUE_MAX', '200'))
+        self.injection_queue.high_watermark = int(os.getenv('INJECTION_QUEUE_HIGH', '20'))
+        self.injection_queue.low_watermark = int(os.getenv('INJECTION_QUEUE_LOW', '5'))
+        self.flow_slow_delay_ms = int(os.getenv('FLOW_SLOW_DELAY_MS', '2000'))
+        self.catalog_required = os.getenv('PRODUCT_CATALOG_REQUIRED', 'false').lower() == 'true'
+        if self.catalog:
+            # SKU主数据更新后随重载一起重建索引（后台进行，期间继续使用旧索引）
+            self.catalog.check_interval = float(os.getenv('PRODUCT_CATALOG_CHECK_INTERVAL', '60'))
+            self.catalog.refresh()
+        self.tracer.slow_threshold_ms = float(os.getenv('SLOW_TRACE_MS', '300'))
+        self.dedup = DuplicateFilter.from_env()
+        self.drain_timeout = float(os.getenv('SHUTDOWN_DRAIN_TIMEOUT', '5'))
+
+        profiles_file = os.getenv('INJECTION_PROFILES_FILE')
+        try:
+            keyboard_simulator.set_profiles(profiles_file or None)
+        except Exception as e:
+            logger.error(f"重新加载输入配置失败，继续使用原配置: {e}")
+        logger.info("配置已重新加载")
+
+    def _notify_parent_ready(self):
+        """重启时通知旧进程：新进程已就绪"""
+        ready_fd = os.environ.pop(READY_FD_ENV, None)
+        if ready_fd:
+            try:
+                os.write(int(ready_fd), b'1')
+                os.close(int(ready_fd))
+            except OSError as e:
+                logger.warning(f"通知旧进程失败: {e}")
+
+    def _drain(self, reason):
+        """
+        排空：拒绝新连接和新扫码，通知手机端暂存扫码，
+        并在期限内完成已排队的键盘输入和扫码历史写入
+        """
+        self.draining = True
+        start = time.perf_counter()
+
+        # 通知手机端暂存扫码，待重连后再发送
+        message = self._flow_control_message('pause', self.injection_queue.depth, reason)
+        self.socketio.emit('flow_control', message)
+        if self.raw_ws:
+            self.raw_ws.broadcast_flow_control(message)
+
+        if not self.injection_queue.wait_idle(self.drain_timeout):
+            logger.warning(f"排空超时，仍有 {self.injection_queue.depth} 个条码未输入")
+
+        # 未提交的盘点计数只在内存中，写入文件避免停止/重启后丢失
+        items = self.inventory.items()
+        if self.inventory.active and items:
+            try:
+                path = write_count_file(self.inventory_dir, f"{self.inventory.count_id}-uncommitted", items, self.station)
+                logger.warning(f"盘点尚未提交，当前计数已保存到: {path}")
+            except OSError as e:
+                logger.error(f"保存未提交的盘点计数失败: {e}")
+
+        # 写完队列中的扫码历史
+        if self.history:
+            remaining = max(0.5, self.drain_timeout - (time.perf_counter() - start))
+            self.history.close(remaining)
+        if self.forwarder:
+            self.forwarder.close(max(0.5, self.drain_timeout - (time.perf_counter() - start)))
+        if self.capture:
+            self.capture.close(max(0.5, self.drain_timeout - (time.perf_counter() - start)))
+        self.sessions.close()
+        if self.dashboard:
+            self.dashboard.close()
+
+        logger.info(f"排空完成，耗时 {time.perf_counter() - start:.2f}s")
+
+    def restart(self):
+        """
+        平滑重启：启动新进程并把监听socket交给它，
+        新进程就绪后旧进程停止接受连接、排空后退出。
+        端口始终处于监听状态，手机端只需一次快速重连。
+        """
+        if not self.running or not self.http_server:
+            logger.warning("服务器未在运行")
+            return
+
+        main_spec = getattr(sys.modules['__main__'], '__spec__', None)
+        if getattr(sys, 'frozen', False):
+            command = [sys.executable] + sys.argv[1:]
+        elif main_spec is not None and main_spec.name:
+            # 以 python -m 方式启动（如 utils.daemon）时按模块名重新启动
+            command = [sys.executable, '-m', main_spec.name] + sys.argv[1:]
+        else:
+            command = [sys.executable] + sys.argv
+        env = dict(os.environ)
+        start = time.perf_counter()
+
+        if os.name == 'nt':
+            # Windows不支持通过文件描述符继承socket，先释放端口再启动新进程
+            logger.warning("当前平台不支持监听socket移交，将先释放端口再启动新进程")
+            self.http_server.shutdown()
+            self.http_server.server_close()
+            subprocess.Popen(command, env=env)
+        else:
+            listen_fd = self.http_server.socket.fileno()
+            os.set_inheritable(listen_fd, True)
+            ready_read, ready_write = os.pipe()
+            env[LISTEN_FD_ENV] = str(listen_fd)
+            env[READY_FD_ENV] = str(ready_write)
+            subprocess.Popen(command, env=env, pass_fds=(listen_fd, ready_write))
+            os.close(ready_write)
+
+            # 等待新进程就绪（最多15秒），之后旧进程不再接受新连接
+            import select
+            ready, _, _ = select.select([ready_read], [], [], 15)
+            os.close(ready_read)
+            if ready:
+                logger.info(f"新进程已就绪，耗时 {time.perf_counter() - start:.2f}s")
+            else:
+                logger.warning("等待新进程就绪超时，继续关闭旧进程")
+            self.http_server.shutdown()
+
+        self._drain('restart')
+        self.stop(drain=False)
+
+    def stop(self, drain=True):
+        """
+        停止HTTPS服务器
+
+        Args:
+            drain: 是否先排空已排队的键盘输入和扫码历史（最长SHUTDOWN_DRAIN_TIMEOUT秒）
+        """
         if not self.running:
             logger.warning("服务器未在运行")
             return
 
         logger.info("正在停止服务器...")
+        if drain and not self.draining:
+            self._drain('shutdown')
         self.running = False
 
         try:
             # 清空客户端列表
             logger.debug("清空客户端列表...")
-            self.mobile_clients.clear()
+            self.sessions.clear()
+
+            if self.frame_decoder:
+                self.frame_decoder.close()
 
             # 强制退出进程
-            logger.info("服务器已停止（立即强制退出）")
+            logger.info("服务器已停止")
             os._exit(0)
         except Exception as e:
             os._exit(0)
@@ -292,24 +1645,18 @@ def main():
 
     server = BarcodeGunServer(host=host, port=port)
 
-    # 启动服务器
-    server.start()
+    def on_ready(server):
+        logger.info("=" * 60)
+        logger.info("H5扫码枪 - HTTPS服务器已启动")
+        logger.info("=" * 60)
+        logger.info(f"服务器地址: https://{server.get_local_ip()}:{port}")
+        logger.info("=" * 60)
+        logger.info("手机访问HTTPS地址即可扫码")
+        logger.info("=" * 60)
 
-    logger.info("=" * 60)
-    logger.info("H5扫码枪 - HTTPS服务器已启动")
-    logger.info("=" * 60)
-    logger.info(f"服务器地址: https://{server.get_local_ip()}:{port}")
-    logger.info("=" * 60)
-    logger.info("手机访问HTTPS地址即可扫码")
-    logger.info("=" * 60)
-
-    try:
-        while True:
-            time.sleep(1)
-    except KeyboardInterrupt:
-        logger.info("\n正在关闭服务器...")
-        server.stop()
-        sys.exit(0)
+    # 启动服务器（阻塞直到收到停止信号）
+    server.on_ready = on_ready
+    server.start()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,407 @@
+#!/usr/bin/env python3
+"""
+扫码转发
+把扫码记录按小批量POST到下游系统（如仓储系统）的HTTP接口：
+- 复用长连接（requests.Session连接池），按条数或等待时间凑批
+- 发送失败时短暂重试；仍失败则把该批写入本地磁盘队列，按指数退避定期重试，恢复后按顺序补发
+- 磁盘队列中有积压时，新批次也先写入磁盘，保证下游收到的顺序与扫码顺序一致
+- 磁盘写入只在工作线程中进行；内存队列满时由工作线程把积压按顺序转入磁盘队列，submit不做I/O
+- 每条记录带唯一scan_id，下游可据此去重（重试可能导致同一批重复送达）
+
+磁盘队列每批一个文件（先写临时文件再改名），进程重启后自动继续补发。
+"""
+
+import collections
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+SEGMENT_SUFFIX = '.ndjson'
+
+# 单批内的快速重试等待（秒），之后转入磁盘队列按退避重试
+INLINE_RETRY_DELAYS = (0.2, 0.5)
+
+
+class PermanentError(Exception):
+    """下游拒绝（4xx，429除外），重试也不会成功"""
+
+
+class DiskSpool:
+    """
+    磁盘队列：每批一个NDJSON文件，文件名为递增序号
+
+    Args:
+        directory: 队列目录
+        fsync: 写入后是否fsync（断电也不丢失）
+    """
+
+    def __init__(self, directory, fsync=True):
+        self.directory = directory
+        self.fsync = fsync
+        os.makedirs(directory, exist_ok=True)
+        # 清理上次写到一半的临时文件
+        for name in os.listdir(directory):
+            if name.endswith('.tmp'):
+                os.remove(os.path.join(directory, name))
+        self._segments = sorted(name for name in os.listdir(directory) if name.endswith(SEGMENT_SUFFIX))
+        self._next = int(self._segments[-1][:-len(SEGMENT_SUFFIX)]) + 1 if self._segments else 1
+        self.records = sum(self._count(name) for name in self._segments)
+
+    def __len__(self):
+        return len(self._segments)
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _count(self, name):
+        with open(self._path(name), 'rb') as f:
+            return sum(1 for line in f if line.strip())
+
+    def append(self, records):
+        """把一批记录写入新文件"""
+        name = f"{self._next:012d}{SEGMENT_SUFFIX}"
+        self._next += 1
+        tmp = self._path(name + '.tmp')
+        with open(tmp, 'w', encoding='utf-8') as f:
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False) + '\n')
+            f.flush()
+            if self.fsync:
+                os.fsync(f.fileno())
+        os.replace(tmp, self._path(name))
+        self._segments.append(name)
+        self.records += len(records)
+
+    def peek(self):
+        """最早的一批 (文件名, 记录列表)，队列为空时返回None"""
+        while self._segments:
+            name = self._segments[0]
+            try:
+                with open(self._path(name), 'r', encoding='utf-8') as f:
+                    records = [json.loads(line) for line in f if line.strip()]
+            except FileNotFoundError:
+                # 文件被外部删除：从队列中移除，否则会一直补发失败
+                logger.error(f"磁盘队列文件已丢失，跳过: {name}")
+                self._segments.pop(0)
+                if not self._segments:
+                    self.records = 0
+                continue
+            return name, records
+        return None
+
+    def remove(self, name, count):
+        """发送成功后删除该批"""
+        os.remove(self._path(name))
+        self._segments.remove(name)
+        self.records -= count
+
+
+class ScanForwarder:
+    """
+    扫码转发器
+
+    Args:
+        url: 下游接口地址，每批以 {"scans": [...]} POST
+        spool_dir: 磁盘队列目录
+        batch_size: 每批最多条数
+        flush_interval: 凑批最长等待时间（秒）
+        timeout: 单次请求超时（秒）
+        headers: 附加请求头（如Authorization）
+        verify: 是否校验下游HTTPS证书
+        backoff_base / backoff_max: 磁盘队列重试的退避起始/上限（秒）
+        max_queue: 内存队列上限，满时新记录暂存溢出区，由工作线程把积压按顺序转入磁盘队列；
+            溢出区也满时丢弃并计数
+    """
+
+    def __init__(self, url, spool_dir, batch_size=100, flush_interval=0.2, timeout=5.0, headers=None,
+                 verify=True, backoff_base=1.0, backoff_max=60.0, max_queue=10000):
+        try:
+            import requests
+            from requests.adapters import HTTPAdapter
+        except ImportError:
+            raise ImportError("扫码转发需要requests。请使用: pip install requests")
+
+        self.url = url
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.timeout = timeout
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+        # 单个工作线程顺序发送，一个长连接即可
+        self._session = requests.Session()
+        self._session.mount('http://', HTTPAdapter(pool_connections=1, pool_maxsize=1))
+        self._session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=1))
+        self._session.headers.update({'Content-Type': 'application/json'})
+        self._session.headers.update(headers or {})
+        self._session.verify = verify
+
+        self.spool = DiskSpool(spool_dir)
+        self._spool_lock = threading.Lock()
+        self._queue = queue.Queue(maxsize=max_queue)
+        # 内存队列满后到达的记录（比队列中的记录新），工作线程先把队列再把溢出区写入磁盘
+        self._overflow = collections.deque()
+        self._overflow_max = max_queue
+        self._overflow_lock = threading.Lock()
+        # 写入磁盘失败而未送出的记录（只由工作线程访问，早于内存队列和溢出区中的记录）
+        self._unsent = []
+        self._stop_event = threading.Event()
+        self._backoff = 0.0
+        self._next_attempt = 0.0
+
+        self.submitted = 0
+        self.sent = 0
+        self.batches = 0
+        self.retries = 0
+        self.spilled = 0
+        self.rejected = 0
+        self.dropped = 0
+        self.last_error = None
+        self.post_ms = collections.deque(maxlen=1000)
+
+        if len(self.spool):
+            logger.warning(f"扫码转发磁盘队列中有 {self.spool.records} 条待补发")
+        self._worker = threading.Thread(target=self._worker_loop, name='ScanForwarder', daemon=True)
+        self._worker.start()
+        logger.info(f"扫码转发已启用: {url} (每批 {batch_size} 条 / {int(flush_interval * 1000)}ms)")
+
+    @classmethod
+    def from_env(cls):
+        """按 FORWARD_* 环境变量创建，未配置FORWARD_URL时返回None"""
+        url = os.getenv('FORWARD_URL')
+        if not url:
+            return None
+        token = os.getenv('FORWARD_AUTH_TOKEN')
+        return cls(
+            url,
+            spool_dir=os.getenv('FORWARD_SPOOL_DIR', 'forward_spool'),
+            batch_size=int(os.getenv('FORWARD_BATCH_SIZE', '100')),
+            flush_interval=int(os.getenv('FORWARD_FLUSH_MS', '200')) / 1000,
+            timeout=float(os.getenv('FORWARD_TIMEOUT', '5')),
+            headers={'Authorization': f"Bearer {token}"} if token else None,
+            verify=os.getenv('FORWARD_VERIFY_TLS', 'true').lower() == 'true',
+            backoff_max=float(os.getenv('FORWARD_BACKOFF_MAX', '60'))
+        )
+
+    @property
+    def outage(self):
+        """下游不可用（磁盘队列有积压）"""
+        return len(self.spool) > 0
+
+    def submit(self, record):
+        """
+        提交一条扫码记录（非阻塞）
+
+        Args:
+            record: 扫码记录dict，自动补充scan_id
+        """
+        record.setdefault('scan_id', uuid.uuid4().hex)
+        self.submitted += 1
+        with self._overflow_lock:
+            # 溢出区有记录时新记录也进溢出区，保证顺序；不在这里写磁盘，扫码处理线程不被阻塞
+            if not self._overflow:
+                try:
+                    self._queue.put_nowait(record)
+                    return
+                except queue.Full:
+                    logger.warning("扫码转发内存队列已满，积压转入磁盘队列")
+            if len(self._overflow) >= self._overflow_max:
+                self.dropped += 1
+                return
+            self._overflow.append(record)
+
+    def _collect(self):
+        """凑一批：取到第一条后最多再等flush_interval"""
+        try:
+            batch = [self._queue.get(timeout=self.flush_interval)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _post(self, records):
+        """
+        发送一批
+
+        Raises:
+            PermanentError: 下游拒绝（4xx，429除外）
+            Exception: 网络错误、超时、5xx、429
+        """
+        start = time.perf_counter()
+        body = json.dumps({'scans': records}, ensure_ascii=False).encode('utf-8')
+        response = self._session.post(self.url, data=body, timeout=self.timeout)
+        self.post_ms.append((time.perf_counter() - start) * 1000)
+        if 400 <= response.status_code < 500 and response.status_code != 429:
+            raise PermanentError(f"HTTP {response.status_code}: {response.text[:200]}")
+        response.raise_for_status()
+        self.sent += len(records)
+        self.batches += 1
+
+    def _send(self, records, retry=True):
+        """发送一批，失败时短暂重试；返回是否成功（被下游拒绝的批次视为已处理）"""
+        delays = INLINE_RETRY_DELAYS if retry else ()
+        for attempt in range(len(delays) + 1):
+            try:
+                self._post(records)
+                return True
+            except PermanentError as e:
+                self._reject(records, e)
+                return True
+            except Exception as e:
+                self.last_error = str(e)
+                if attempt < len(delays):
+                    self.retries += 1
+                    if self._stop_event.wait(delays[attempt]):
+                        break
+        return False
+
+    def _reject(self, records, error):
+        # 下游拒绝的记录写入rejected文件，便于人工处理，不再重试
+        self.rejected += len(records)
+        self.last_error = str(error)
+        logger.error(f"下游拒绝了 {len(records)} 条扫码记录: {error}")
+        path = os.path.join(self.spool.directory, 'rejected.ndjson')
+        try:
+            with open(path, 'a', encoding='utf-8') as f:
+                for record in records:
+                    f.write(json.dumps(record, ensure_ascii=False) + '\n')
+        except OSError as e:
+            logger.error(f"写入rejected文件失败: {e}")
+
+    def _take_pending(self):
+        """取出未送出、内存队列和溢出区中的全部记录（按提交顺序）"""
+        records = self._unsent
+        self._unsent = []
+        while True:
+            try:
+                records.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        with self._overflow_lock:
+            # 溢出区非空时submit不再写入内存队列，此时内存队列中的记录都早于溢出区
+            records.extend(self._overflow)
+            self._overflow.clear()
+        return records
+
+    def _spill_pending(self):
+        """内存队列满时把积压按顺序写入磁盘队列，之后的记录经磁盘队列补发"""
+        records = self._take_pending()
+        for i in range(0, len(records), self.batch_size):
+            try:
+                self._spill(records[i:i + self.batch_size])
+            except Exception:
+                # 写入失败的部分留待下次重试，保持顺序
+                self._unsent = records[i:]
+                raise
+
+    def _spill(self, records):
+        with self._spool_lock:
+            if not self.outage:
+                logger.warning(f"下游不可用，扫码记录转入磁盘队列: {self.last_error}")
+                self._schedule_retry()
+            self.spool.append(records)
+        self.spilled += len(records)
+
+    def _schedule_retry(self):
+        # 指数退避加随机抖动，避免多个工位同时重连
+        self._backoff = min(self.backoff_max, self._backoff * 2 if self._backoff else self.backoff_base)
+        self._next_attempt = time.monotonic() + self._backoff * random.uniform(0.8, 1.2)
+
+    def _drain_spool(self):
+        """按顺序补发磁盘队列；某批失败时按退避等待下次重试"""
+        while self.outage and not self._stop_event.is_set():
+            if time.monotonic() < self._next_attempt:
+                return
+            with self._spool_lock:
+                entry = self.spool.peek()
+            if entry is None:
+                self._backoff = 0.0
+                return
+            name, records = entry
+            if not self._send(records, retry=False):
+                with self._spool_lock:
+                    self._schedule_retry()
+                logger.warning(f"补发失败，{self._backoff:.1f}s后重试: {self.last_error}")
+                return
+            with self._spool_lock:
+                self.spool.remove(name, len(records))
+                if not self.outage:
+                    self._backoff = 0.0
+                    logger.info("下游已恢复，磁盘队列补发完成")
+
+    def _worker_loop(self):
+        while not self._stop_event.is_set():
+            try:
+                self._forward_once()
+            except Exception as e:
+                # 磁盘已满、队列目录被删除等：记录错误后退避重试，工作线程不能退出
+                self.last_error = str(e)
+                with self._spool_lock:
+                    self._schedule_retry()
+                logger.error(f"扫码转发出错，{self._backoff:.1f}s后重试: {e}")
+                self._stop_event.wait(self._backoff)
+
+        # 停止时尽量发出内存中的记录，发不出去的落盘，下次启动补发
+        try:
+            remaining = self._take_pending()
+            for i in range(0, len(remaining), self.batch_size):
+                batch = remaining[i:i + self.batch_size]
+                if self.outage or not self._send(batch, retry=False):
+                    self._spill(batch)
+        except Exception as e:
+            logger.error(f"停止时保存未转发的扫码记录失败: {e}")
+
+    def _forward_once(self):
+        if self._overflow or self._unsent:
+            self._spill_pending()
+        batch = self._collect()
+        if batch:
+            if self.outage or not self._send(batch):
+                try:
+                    self._spill(batch)
+                except Exception:
+                    self._unsent = batch
+                    raise
+        if self.outage:
+            self._drain_spool()
+
+    def get_stats(self):
+        ordered = sorted(self.post_ms)
+        return {
+            'url': self.url,
+            'state': 'outage' if self.outage else 'ok',
+            'submitted': self.submitted,
+            'sent': self.sent,
+            'batches': self.batches,
+            'pending': self._queue.qsize() + len(self._overflow) + len(self._unsent),
+            'retries': self.retries,
+            'spilled': self.spilled,
+            'spool_batches': len(self.spool),
+            'spool_records': self.spool.records,
+            'rejected': self.rejected,
+            'dropped': self.dropped,
+            'next_retry_s': round(max(0.0, self._next_attempt - time.monotonic()), 1) if self.outage else None,
+            'post_p50_ms': round(ordered[len(ordered) // 2], 1) if ordered else 0,
+            'last_error': self.last_error
+        }
+
+    def close(self, timeout=5):
+        """停止工作线程，未发送的记录写入磁盘队列"""
+        self._stop_event.set()
+        self._worker.join(timeout)
+        self._session.close()
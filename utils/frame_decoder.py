@@ -0,0 +1,276 @@
+#!/usr/bin/env python3
+"""
+服务器端帧解码
+性能较弱的手机只负责采集画面：页面把缩小后的灰度帧作为Socket.IO二进制附件发送，
+服务器在进程池中用本地解码库（zxing-cpp或pyzbar）识别条码，结果经同一连接返回。
+
+进程池忙时直接丢弃新帧（手机端随后发送更新的画面），不排队处理过期画面。
+"""
+
+import collections
+import concurrent.futures
+import importlib.util
+import logging
+import multiprocessing
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# 解码库优先级
+DECODERS = ('zxingcpp', 'pyzbar')
+
+# 单帧像素上限（约4MP），防止异常帧占满内存
+MAX_FRAME_PIXELS = 4 * 1024 * 1024
+
+# 利用率统计窗口（秒）
+UTILIZATION_WINDOW = 10.0
+
+
+def available_decoders():
+    """已安装的解码库（不实际导入）"""
+    return [name for name in DECODERS if importlib.util.find_spec(name) is not None]
+
+
+def resolve_decoder(decoder='auto'):
+    """
+    确定使用的解码库
+
+    Raises:
+        ImportError: 没有可用的解码库
+    """
+    installed = available_decoders()
+    if decoder == 'auto':
+        if not installed:
+            raise ImportError(
+                "服务器端解码需要解码库。请使用: pip install zxing-cpp numpy 或 pip install pyzbar"
+            )
+        return installed[0]
+    if decoder not in installed:
+        raise ImportError(f"解码库 {decoder} 未安装")
+    return decoder
+
+
+# ---- 以下在工作进程中执行 ----
+
+_decoder = None
+
+
+def init_worker(decoder):
+    """工作进程初始化：选择并预先导入解码库"""
+    global _decoder
+    _decoder = decoder
+    # 预先导入解码库，避免首帧额外耗时
+    if decoder == 'zxingcpp':
+        import numpy  # noqa: F401
+        import zxingcpp  # noqa: F401
+    else:
+        from pyzbar import pyzbar  # noqa: F401
+
+
+def _decode_gray(width, height, data):
+    """
+    解码一帧灰度图
+
+    Returns:
+        tuple: ([(文本, 码制), ...], 解码耗时毫秒)
+    """
+    start = time.perf_counter()
+    if _decoder == 'zxingcpp':
+        import numpy
+        results = decode_image(numpy.frombuffer(data, dtype=numpy.uint8).reshape(height, width))
+    else:
+        results = decode_image((data, width, height))
+    return results, (time.perf_counter() - start) * 1000
+
+
+def decode_image(image):
+    """
+    用当前进程选择的解码库识别图像中的全部条码
+
+    Args:
+        image: PIL图像、numpy数组（zxingcpp）或 (灰度字节, 宽, 高)（pyzbar）
+
+    Returns:
+        list: [(文本, 码制), ...]
+    """
+    if _decoder == 'zxingcpp':
+        import zxingcpp
+        return [(item.text, item.format.name) for item in zxingcpp.read_barcodes(image)]
+    from pyzbar import pyzbar
+    return [(item.data.decode('utf-8', 'replace'), item.type) for item in pyzbar.decode(image)]
+
+
+def _warm_up():
+    return os.getpid()
+
+
+# ---- 以上在工作进程中执行 ----
+
+
+class FrameDecoder:
+    """
+    帧解码进程池
+
+    Args:
+        workers: 工作进程数，默认 CPU核数-1（至少1）
+        decoder: 解码库 auto/zxingcpp/pyzbar
+        on_result: 解码完成回调 on_result(sid, frame, results, timings)，results为需要处理的新条码
+    """
+
+    def __init__(self, workers=None, decoder='auto', on_result=None):
+        decoder = resolve_decoder(decoder)
+        self.decoder = decoder
+        self.workers = workers or max(1, (os.cpu_count() or 2) - 1)
+        self.on_result = on_result
+
+        self._pool = self._create_pool()
+        self._lock = threading.Lock()
+        self._inflight = 0
+        self._busy_clients = set()
+        self._last_result = {}
+        self._recent = collections.deque()   # (完成时间, 解码耗时秒)，用于计算利用率
+
+        self.received = 0
+        self.dropped = 0
+        self.decoded = 0
+        self.found = 0
+        self.failed = 0
+        self.decode_ms = collections.deque(maxlen=1000)
+        self.total_ms = collections.deque(maxlen=1000)
+
+        logger.info(f"服务器端帧解码已启用 (解码库: {decoder}, 进程数: {self.workers})")
+
+    def _create_pool(self):
+        # spawn方式启动，避免在多线程服务器进程中fork
+        pool = concurrent.futures.ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=init_worker,
+            initargs=(self.decoder,)
+        )
+        for _ in range(self.workers):
+            pool.submit(_warm_up)
+        return pool
+
+    def submit(self, sid, frame):
+        """
+        提交一帧
+
+        Args:
+            sid: 连接ID
+            frame: {'frame_id', 'width', 'height', 'data': bytes, 'interval': 同一条码最小间隔毫秒, ...}
+
+        Returns:
+            bool: 是否受理（进程池忙或该连接已有帧在解码时丢弃）
+        """
+        width, height, data = int(frame['width']), int(frame['height']), frame['data']
+        if width <= 0 or height <= 0 or width * height > MAX_FRAME_PIXELS or len(data) != width * height:
+            raise ValueError(f"帧尺寸不正确: {width}x{height}, {len(data)} 字节")
+        # 识别间隔由手机端填写，在这里校验（解码完成回调中出错时帧会被静默丢弃），不合法时按0处理
+        interval = frame.get('interval', 0)
+        if not isinstance(interval, (int, float)) or isinstance(interval, bool) or not 0 <= interval <= 60000:
+            interval = 0
+        min_interval = interval / 1000
+
+        with self._lock:
+            self.received += 1
+            if sid in self._busy_clients or self._inflight >= self.workers:
+                self.dropped += 1
+                return False
+            self._busy_clients.add(sid)
+            self._inflight += 1
+
+        submitted = time.perf_counter()
+        try:
+            future = self._pool.submit(_decode_gray, width, height, bytes(data))
+        except concurrent.futures.process.BrokenProcessPool:
+            # 工作进程异常退出后进程池不可再用，重建后丢弃本帧
+            logger.error("帧解码进程池已损坏，正在重建")
+            with self._lock:
+                self._inflight -= 1
+                self._busy_clients.discard(sid)
+                self.failed += 1
+            self._pool.shutdown(wait=False)
+            self._pool = self._create_pool()
+            return False
+        future.add_done_callback(lambda f: self._on_done(sid, frame, submitted, min_interval, f))
+        return True
+
+    def _on_done(self, sid, frame, submitted, min_interval, future):
+        total_ms = (time.perf_counter() - submitted) * 1000
+        with self._lock:
+            self._inflight -= 1
+            self._busy_clients.discard(sid)
+
+        try:
+            results, decode_ms = future.result()
+        except Exception as e:
+            self.failed += 1
+            logger.error(f"帧解码失败: {e}")
+            results, decode_ms = [], None
+
+        now = time.monotonic()
+        fresh = []
+        with self._lock:
+            self.decoded += 1
+            if decode_ms is not None:
+                self.decode_ms.append(decode_ms)
+                self._recent.append((now, decode_ms / 1000))
+            self.total_ms.append(total_ms)
+            # 同一画面会连续多帧识别到同一条码，按页面设置的识别间隔去重
+            last = self._last_result.get(sid)
+            for text, symbology in results:
+                if last and last[0] == text and now - last[1] < min_interval:
+                    continue
+                last = self._last_result[sid] = (text, now)
+                fresh.append((text, symbology))
+            self.found += len(fresh)
+
+        if self.on_result:
+            try:
+                self.on_result(sid, frame, fresh, {
+                    'decode_ms': round(decode_ms, 1) if decode_ms is not None else None,
+                    'total_ms': round(total_ms, 1)
+                })
+            except Exception as e:
+                logger.error(f"帧解码结果处理失败: {e}")
+
+    def remove(self, sid):
+        """连接断开时清理"""
+        with self._lock:
+            self._last_result.pop(sid, None)
+
+    def utilization(self):
+        """最近一段时间的进程池利用率（0~1）"""
+        now = time.monotonic()
+        with self._lock:
+            while self._recent and self._recent[0][0] < now - UTILIZATION_WINDOW:
+                self._recent.popleft()
+            busy = sum(seconds for _, seconds in self._recent)
+        return min(1.0, busy / (self.workers * UTILIZATION_WINDOW))
+
+    def get_stats(self):
+        def percentile(values, p):
+            ordered = sorted(values)
+            return round(ordered[min(len(ordered) - 1, int(len(ordered) * p))], 1) if ordered else 0
+
+        return {
+            'decoder': self.decoder,
+            'workers': self.workers,
+            'inflight': self._inflight,
+            'utilization': round(self.utilization(), 3),
+            'received': self.received,
+            'dropped': self.dropped,
+            'decoded': self.decoded,
+            'found': self.found,
+            'failed': self.failed,
+            'decode_p50_ms': percentile(self.decode_ms, 0.5),
+            'decode_p95_ms': percentile(self.decode_ms, 0.95),
+            'total_p50_ms': percentile(self.total_ms, 0.5),
+            'total_p95_ms': percentile(self.total_ms, 0.95)
+        }
+
+    def close(self):
+        self._pool.shutdown(wait=False)
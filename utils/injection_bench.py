@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+"""
+键盘输入吞吐基准测试
+对每个可用的输入后端、字符间隔和条码长度，重复调用 simulate_keyboard_input，测量:
+    - chars_per_sec: 每秒输入字符数
+    - overhead_ms:   单次调用中扣除字符间隔后的额外耗时
+    - enter_ms:      从调用开始到按下回车的延迟
+
+recording后端不产生真实按键，可在无显示的Linux上直接运行；
+真实后端（pyautogui/pynput）需要显示环境，例如:
+    xvfb-run -a python -m utils.injection_bench --backends pyautogui,pynput,recording
+
+结果以JSON保存，可用 --baseline 与之前的结果对比，发现性能回退。
+"""
+
+import json
+import logging
+import os
+import platform
+import statistics
+import sys
+import time
+from datetime import datetime
+
+from utils import keyboard_simulator
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LENGTHS = (8, 13, 24, 48)
+DEFAULT_INTERVALS = (0.0, 0.01)
+
+
+class _TimedBackend:
+    """包装输入后端，记录按下回车的时间"""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.name = backend.name
+        self.enter_time = None
+
+    def write(self, text, interval):
+        self.backend.write(text, interval)
+
+    def enter(self):
+        self.backend.enter()
+        self.enter_time = time.perf_counter()
+
+
+def available_backends(names):
+    """返回能成功创建的后端实例 {名称: 后端}"""
+    backends = {}
+    for name in names:
+        try:
+            backends[name] = keyboard_simulator.BACKENDS[name]()
+        except KeyError:
+            logger.error(f"未知的输入后端: {name}")
+        except Exception as e:
+            logger.warning(f"输入后端 {name} 不可用，跳过: {e}")
+    return backends
+
+
+def make_code(length, index):
+    """生成指定长度的测试条码（数字，按序号变化避免被缓存）"""
+    return str(index).zfill(length)[-length:]
+
+
+def bench_case(backend, length, interval, repeat):
+    """
+    测量一种组合
+
+    Returns:
+        dict: 统计结果（毫秒）
+    """
+    timed = _TimedBackend(backend)
+    keyboard_simulator.set_backend(timed)
+
+    totals = []
+    enters = []
+    failures = 0
+    for i in range(repeat):
+        code = make_code(length, i)
+        timed.enter_time = None
+        start = time.perf_counter()
+        if not keyboard_simulator.simulate_keyboard_input(code, interval):
+            failures += 1
+            continue
+        end = time.perf_counter()
+        totals.append(end - start)
+        if timed.enter_time is not None:
+            enters.append(timed.enter_time - start)
+
+    if not totals:
+        return {'backend': backend.name, 'length': length, 'interval': interval, 'failures': failures}
+
+    pacing = length * interval
+    median_total = statistics.median(totals)
+    return {
+        'backend': backend.name,
+        'length': length,
+        'interval': interval,
+        'calls': len(totals),
+        'failures': failures,
+        'chars_per_sec': round(length / median_total, 1),
+        'overhead_ms': round(max(0.0, median_total - pacing) * 1000, 3),
+        'enter_ms': round(statistics.median(enters) * 1000, 3) if enters else None,
+        'enter_p95_ms': round(sorted(enters)[min(len(enters) - 1, int(len(enters) * 0.95))] * 1000, 3) if enters else None
+    }
+
+
+def run(backend_names, lengths=DEFAULT_LENGTHS, intervals=DEFAULT_INTERVALS, repeat=50):
+    """
+    运行全部组合
+
+    Returns:
+        dict: {'meta': {...}, 'results': [...]}
+    """
+    # 基准测试只关心耗时，关闭逐条输入日志
+    logging.getLogger(keyboard_simulator.__name__).setLevel(logging.WARNING)
+    # 只测量后端本身，不按前台程序切换输入配置
+    keyboard_simulator.set_profiles(None)
+
+    results = []
+    backends = available_backends(backend_names)
+    for name, backend in backends.items():
+        for interval in intervals:
+            for length in lengths:
+                result = bench_case(backend, length, interval, repeat)
+                logger.info(f"{name} 间隔={interval}s 长度={length}: {result.get('chars_per_sec')} 字符/秒, "
+                            f"额外耗时 {result.get('overhead_ms')}ms")
+                results.append(result)
+
+    return {
+        'meta': {
+            'time': datetime.now().isoformat(),
+            'platform': platform.platform(),
+            'python': platform.python_version(),
+            'display': os.getenv('DISPLAY'),
+            'repeat': repeat
+        },
+        'results': results
+    }
+
+
+def compare(current, baseline, tolerance=0.2):
+    """
+    与基线结果对比
+
+    Args:
+        tolerance: 允许的退化比例（0.2表示额外耗时增加或吞吐下降超过20%视为回退）
+
+    Returns:
+        list: 回退说明
+    """
+    def key(result):
+        return result['backend'], result['length'], result['interval']
+
+    base = {key(r): r for r in baseline.get('results', []) if 'chars_per_sec' in r}
+    regressions = []
+    for result in current.get('results', []):
+        old = base.get(key(result))
+        if old is None or 'chars_per_sec' not in result:
+            continue
+        if result['chars_per_sec'] < old['chars_per_sec'] * (1 - tolerance):
+            regressions.append(f"{key(result)} 吞吐 {old['chars_per_sec']} -> {result['chars_per_sec']} 字符/秒")
+        # 额外耗时过小时波动大，低于0.05ms不比较
+        if old['overhead_ms'] >= 0.05 and result['overhead_ms'] > old['overhead_ms'] * (1 + tolerance):
+            regressions.append(f"{key(result)} 额外耗时 {old['overhead_ms']} -> {result['overhead_ms']} ms")
+    return regressions
+
+
+if __name__ == '__main__':
+    import argparse
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s'
+    )
+
+    parser = argparse.ArgumentParser(description='键盘输入吞吐基准测试')
+    parser.add_argument('--backends', default='recording', help='输入后端，逗号分隔（pyautogui,pynput,recording）')
+    parser.add_argument('--lengths', default=','.join(map(str, DEFAULT_LENGTHS)), help='条码长度，逗号分隔')
+    parser.add_argument('--intervals', default=','.join(map(str, DEFAULT_INTERVALS)), help='字符间隔（秒），逗号分隔')
+    parser.add_argument('-n', '--repeat', type=int, default=50, help='每种组合的调用次数')
+    parser.add_argument('-o', '--output', help='结果JSON文件（默认输出到标准输出）')
+    parser.add_argument('--baseline', help='基线结果JSON，出现回退时返回码为1')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='允许的退化比例')
+    args = parser.parse_args()
+
+    report = run(
+        args.backends.split(','),
+        lengths=[int(x) for x in args.lengths.split(',')],
+        intervals=[float(x) for x in args.intervals.split(',')],
+        repeat=args.repeat
+    )
+
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text)
+        logger.info(f"结果已保存到 {args.output}")
+    else:
+        print(text)
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        for line in regressions:
+            logger.warning(f"性能回退: {line}")
+        sys.exit(1 if regressions else 0)
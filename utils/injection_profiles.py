@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+"""
+按目标程序的输入配置
+根据前台窗口的进程名/标题选择输入方式：字符间隔、结束键（回车/Tab）、输入后端。
+例如ERP表格可以整条快速输入后回车，老式终端仿真程序逐字符慢速输入后按Tab。
+
+前台窗口查询有缓存：每次输入只调用GetForegroundWindow和GetWindowTextW，
+窗口句柄变化（焦点切换）时才重新查询进程名；(进程名, 标题) -> 配置 的匹配结果也被缓存。
+进程名/标题匹配目前仅支持Windows，其他平台始终使用默认配置。
+"""
+
+import functools
+import json
+import logging
+import os
+import platform
+import re
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# 结束键
+TERMINATOR_KEYS = ('enter', 'tab')
+
+# 窗口句柄 -> 进程名 缓存条数
+PROCESS_CACHE_SIZE = 256
+
+# 匹配结果缓存条数
+MATCH_CACHE_SIZE = 512
+
+PROCESS_QUERY_LIMITED_INFORMATION = 0x1000
+
+
+def parse_terminator(value):
+    """
+    解析结束键配置
+
+    Args:
+        value: 'enter' / 'tab' / 'none' / 'tab,enter'，或列表
+
+    Returns:
+        tuple: 依次按下的键
+    """
+    if value is None:
+        return ('enter',)
+    if isinstance(value, str):
+        value = [] if value.strip().lower() in ('', 'none') else value.split(',')
+    keys = tuple(key.strip().lower() for key in value)
+    for key in keys:
+        if key not in TERMINATOR_KEYS:
+            raise ValueError(f"未知的结束键: {key}")
+    return keys
+
+
+class InjectionProfile:
+    """
+    一个目标程序的输入配置
+
+    Args:
+        name: 配置名称
+        process: 进程名（不区分大小写，如 'erp.exe'），不填则不限
+        title: 窗口标题正则，不填则不限
+        interval: 字符间隔（秒），不填则使用KEYBOARD_TYPE_INTERVAL
+        terminator: 结束键，默认回车
+        backend: 输入后端名称，不填则使用当前后端
+    """
+
+    __slots__ = ('name', 'process', 'title', 'interval', 'terminator', 'backend', 'hits')
+
+    def __init__(self, name, process=None, title=None, interval=None, terminator=None, backend=None):
+        self.name = name
+        self.process = process.lower() if process else None
+        self.title = re.compile(title) if title else None
+        self.interval = float(interval) if interval is not None else None
+        self.terminator = parse_terminator(terminator)
+        self.backend = backend
+        self.hits = 0
+
+    @classmethod
+    def from_dict(cls, config, default_name):
+        config = dict(config)
+        try:
+            return cls(
+                name=config.pop('name', default_name),
+                process=config.pop('process', None),
+                title=config.pop('title', None),
+                interval=config.pop('interval', None),
+                terminator=config.pop('terminator', None),
+                backend=config.pop('backend', None)
+            )
+        finally:
+            if config:
+                logger.warning(f"输入配置 {default_name} 包含未知字段: {', '.join(config)}")
+
+    def matches(self, process, title):
+        if self.process is not None and self.process != (process or '').lower():
+            return False
+        if self.title is not None and not self.title.search(title or ''):
+            return False
+        return True
+
+    def get_stats(self):
+        return {
+            'name': self.name,
+            'process': self.process,
+            'title': self.title.pattern if self.title else None,
+            'interval': self.interval,
+            'terminator': '+'.join(self.terminator) or 'none',
+            'backend': self.backend,
+            'hits': self.hits
+        }
+
+
+class ForegroundWindow:
+    """
+    前台窗口查询（Windows），按窗口句柄缓存进程名
+
+    非Windows平台 current() 始终返回 (None, None, None)。
+    """
+
+    def __init__(self):
+        self.lookups = 0
+        self.process_queries = 0
+        self._processes = {}
+        self._user32 = None
+        if platform.system() == 'Windows':
+            try:
+                self._init_win32()
+            except Exception as e:
+                logger.warning(f"无法查询前台窗口，输入配置只使用默认配置: {e}")
+
+    def _init_win32(self):
+        import ctypes
+        from ctypes import wintypes
+
+        self._ctypes = ctypes
+        self._user32 = ctypes.WinDLL('user32')
+        self._kernel32 = ctypes.WinDLL('kernel32')
+        self._user32.GetForegroundWindow.restype = wintypes.HWND
+        self._user32.GetWindowTextW.argtypes = (wintypes.HWND, wintypes.LPWSTR, ctypes.c_int)
+        self._user32.GetWindowThreadProcessId.argtypes = (wintypes.HWND, ctypes.POINTER(wintypes.DWORD))
+        self._kernel32.OpenProcess.argtypes = (wintypes.DWORD, wintypes.BOOL, wintypes.DWORD)
+        self._kernel32.OpenProcess.restype = wintypes.HANDLE
+        self._kernel32.QueryFullProcessImageNameW.argtypes = (
+            wintypes.HANDLE, wintypes.DWORD, wintypes.LPWSTR, ctypes.POINTER(wintypes.DWORD)
+        )
+        self._kernel32.CloseHandle.argtypes = (wintypes.HANDLE,)
+        self._title_buffer = ctypes.create_unicode_buffer(512)
+
+    def current(self):
+        """
+        当前前台窗口
+
+        Returns:
+            tuple: (窗口句柄, 进程名, 标题)
+        """
+        if self._user32 is None:
+            return None, None, None
+        self.lookups += 1
+        hwnd = self._user32.GetForegroundWindow()
+        if not hwnd:
+            return None, None, None
+
+        # 标题可能随文档/页面变化，每次读取（开销很小）；进程名只在焦点切换到新窗口时查询
+        self._user32.GetWindowTextW(hwnd, self._title_buffer, len(self._title_buffer))
+        process = self._processes.get(hwnd)
+        if process is None:
+            if len(self._processes) >= PROCESS_CACHE_SIZE:
+                self._processes.clear()
+            process = self._processes[hwnd] = self._process_name(hwnd)
+        return hwnd, process, self._title_buffer.value
+
+    def _process_name(self, hwnd):
+        from ctypes import wintypes
+
+        ctypes = self._ctypes
+        self.process_queries += 1
+        pid = wintypes.DWORD()
+        self._user32.GetWindowThreadProcessId(hwnd, ctypes.byref(pid))
+        handle = self._kernel32.OpenProcess(PROCESS_QUERY_LIMITED_INFORMATION, False, pid.value)
+        if not handle:
+            return ''
+        try:
+            buffer = ctypes.create_unicode_buffer(1024)
+            size = wintypes.DWORD(len(buffer))
+            if not self._kernel32.QueryFullProcessImageNameW(handle, 0, buffer, ctypes.byref(size)):
+                return ''
+            return os.path.basename(buffer.value).lower()
+        finally:
+            self._kernel32.CloseHandle(handle)
+
+
+class ProfileSet:
+    """
+    输入配置集合
+
+    配置文件格式(JSON):
+        {
+            "default": {"interval": 0.01, "terminator": "enter"},
+            "profiles": [
+                {"name": "ERP", "process": "erp.exe", "interval": 0, "backend": "keymap"},
+                {"name": "终端仿真", "process": "pcomm.exe", "title": "会话", "interval": 0.03, "terminator": "tab"}
+            ]
+        }
+
+    配置按顺序匹配，第一个进程名和标题都符合的生效，均不符合时使用default。
+    """
+
+    def __init__(self, profiles=None, default=None, window=None):
+        self.profiles = tuple(profiles or ())
+        self.default = default or InjectionProfile('default')
+        self.window = window or ForegroundWindow()
+        self.path = None
+        self.total_ns = 0
+        self._lock = threading.Lock()
+        self._match = functools.lru_cache(maxsize=MATCH_CACHE_SIZE)(self._find)
+
+    @classmethod
+    def from_file(cls, path):
+        """从JSON配置文件创建"""
+        with open(path, 'r', encoding='utf-8') as f:
+            config = json.load(f)
+        profiles = [InjectionProfile.from_dict(item, f"profile#{index}")
+                    for index, item in enumerate(config.get('profiles', []))]
+        default = InjectionProfile.from_dict(config.get('default', {}), 'default')
+        profile_set = cls(profiles, default)
+        profile_set.path = path
+        logger.info(f"已加载输入配置 {len(profiles)} 个: {path}")
+        return profile_set
+
+    def _find(self, process, title):
+        for profile in self.profiles:
+            if profile.matches(process, title):
+                return profile
+        return self.default
+
+    def profile_for(self, process, title):
+        """进程名和标题对应的配置（不计入命中次数）"""
+        return self._match(process, title) if process is not None else self.default
+
+    def resolve(self):
+        """
+        当前前台窗口对应的输入配置
+
+        Returns:
+            InjectionProfile: 匹配的配置
+        """
+        start = time.perf_counter_ns()
+        if self.profiles:
+            _, process, title = self.window.current()
+            profile = self.profile_for(process, title)
+        else:
+            profile = self.default
+        with self._lock:
+            profile.hits += 1
+            self.total_ns += time.perf_counter_ns() - start
+        return profile
+
+    def get_stats(self):
+        resolves = sum(profile.hits for profile in self.profiles) + self.default.hits
+        cache = self._match.cache_info()
+        return {
+            'file': self.path,
+            'profiles': [profile.get_stats() for profile in self.profiles],
+            'default': self.default.get_stats(),
+            'window_lookups': self.window.lookups,
+            'process_queries': self.window.process_queries,
+            'match_cache_hits': cache.hits,
+            'match_cache_misses': cache.misses,
+            'resolve_avg_us': round(self.total_ns / resolves / 1000, 2) if resolves else 0
+        }
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+键盘输入队列
+所有条码由单个后台线程依次模拟键盘输入，避免多个连接同时输入导致字符交错，
+同时提供队列深度用于向手机端发送流控信号。
+"""
+
+import logging
+import queue
+import threading
+import time
+
+from utils.keyboard_simulator import simulate_keyboard_input
+from utils.profiling import spans
+
+logger = logging.getLogger(__name__)
+
+
+class InjectionQueue:
+    """
+    键盘输入队列
+
+    Args:
+        max_size: 队列上限，超过时拒绝新的条码
+        high_watermark: 队列深度达到该值时通知手机端减速
+        low_watermark: 队列深度回落到该值时通知手机端恢复
+        on_flow_change: 流控状态变化回调 on_flow_change(state, depth)，state为'slow'/'pause'/'normal'
+        inject: 实际执行输入的函数，默认为 simulate_keyboard_input
+    """
+
+    def __init__(self, max_size=200, high_watermark=20, low_watermark=5,
+                 on_flow_change=None, inject=None):
+        self.max_size = max_size
+        self.high_watermark = high_watermark
+        self.low_watermark = low_watermark
+        self.on_flow_change = on_flow_change
+        self.inject = inject or simulate_keyboard_input
+
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self.flow_state = 'normal'
+
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.total_inject_time = 0.0
+
+        self._worker = threading.Thread(target=self._worker_loop, name='KeyboardInjection', daemon=True)
+        self._worker.start()
+
+    @property
+    def depth(self):
+        """当前排队数量"""
+        return self._queue.qsize()
+
+    def submit(self, text, on_done=None):
+        """
+        提交一个条码到输入队列
+
+        Args:
+            text: 要输入的文本
+            on_done: 输入完成回调 on_done(success, started, finished)，在输入线程中调用，
+                started/finished为输入开始/结束的epoch秒
+
+        Returns:
+            bool: 是否成功入队（队列已满时返回False）
+        """
+        with self._lock:
+            if self._queue.qsize() >= self.max_size:
+                self.rejected += 1
+                return False
+            self._queue.put((text, on_done, time.perf_counter()))
+            self._update_flow_state()
+        return True
+
+    def _update_flow_state(self):
+        depth = self._queue.qsize()
+        state = self.flow_state
+        if depth >= self.max_size:
+            state = 'pause'
+        elif depth >= self.high_watermark:
+            state = 'slow'
+        elif depth <= self.low_watermark:
+            state = 'normal'
+
+        if state != self.flow_state:
+            self.flow_state = state
+            logger.info(f"键盘输入队列流控状态: {state} (排队 {depth})")
+            if self.on_flow_change:
+                try:
+                    self.on_flow_change(state, depth)
+                except Exception as e:
+                    logger.error(f"流控回调失败: {e}")
+
+    def _worker_loop(self):
+        while True:
+            text, on_done, enqueued = self._queue.get()
+            started = time.time()
+            start = time.perf_counter()
+            spans.record('injection.wait', start - enqueued)
+            success = self.inject(text)
+            elapsed = time.perf_counter() - start
+            finished = started + elapsed
+            spans.record('injection.total', elapsed)
+            self.total_inject_time += elapsed
+            if success:
+                self.completed += 1
+            else:
+                self.failed += 1
+
+            with self._lock:
+                self._update_flow_state()
+
+            if on_done:
+                try:
+                    on_done(success, started, finished)
+                except Exception as e:
+                    logger.error(f"输入完成回调失败: {e}")
+            self._queue.task_done()
+
+    def wait_idle(self, timeout):
+        """
+        等待队列中的条码全部输入完成
+
+        Args:
+            timeout: 最长等待秒数
+
+        Returns:
+            bool: 是否在超时前全部完成
+        """
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks:
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(0.02)
+        return True
+
+    def get_stats(self):
+        """获取输入队列统计"""
+        done = self.completed + self.failed
+        return {
+            'depth': self.depth,
+            'flow_state': self.flow_state,
+            'completed': self.completed,
+            'failed': self.failed,
+            'rejected': self.rejected,
+            'avg_inject_ms': round(self.total_inject_time / done * 1000, 2) if done else 0
+        }
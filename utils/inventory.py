@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+盘点计数
+盘点模式下扫码不再逐条模拟键盘输入，只在内存中按条码累加数量（手机端的扫码确认带回当前数量），
+提交时每个条码只输出一行 "条码<分隔符>数量"，输出方式可组合：
+- keyboard: 依次模拟键盘输入（分隔符默认Tab，表格中数量落在相邻单元格）
+- file: 写入 INVENTORY_DIR 下的CSV文件
+- forward: 作为盘点记录交给扫码转发（FORWARD_URL）
+盘点期间的吞吐量只取决于识别速度，与键盘输入速度无关。
+"""
+
+import csv
+import logging
+import os
+import threading
+import time
+import uuid
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+COMMIT_TARGETS = ('keyboard', 'file', 'forward')
+
+
+class InventoryCount:
+    """
+    盘点计数（所有手机共用一份，条码按首次扫到的顺序输出）
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.active = False
+        self.count_id = None
+        self.started = None
+        self._counts = {}
+        self.total = 0
+
+    def start(self):
+        """
+        开始盘点（已在盘点中时保留当前计数）
+
+        Returns:
+            bool: 是否新开始了一次盘点
+        """
+        with self._lock:
+            if self.active:
+                return False
+            self.active = True
+            self.count_id = uuid.uuid4().hex[:12]
+            self.started = datetime.now().isoformat()
+            self._counts = {}
+            self.total = 0
+            return True
+
+    def add(self, barcode, quantity=1):
+        """
+        累加（quantity为负数时扣减，减到0时移除该条码）
+
+        Returns:
+            int: 该条码当前数量；未在盘点中返回None
+        """
+        with self._lock:
+            if not self.active:
+                return None
+            current = self._counts.get(barcode, 0)
+            quantity = max(quantity, -current)
+            current += quantity
+            self.total += quantity
+            if current:
+                self._counts[barcode] = current
+            else:
+                self._counts.pop(barcode, None)
+            return current
+
+    def items(self):
+        """当前各条码数量 [(条码, 数量), ...]"""
+        with self._lock:
+            return list(self._counts.items())
+
+    def finish(self):
+        """
+        结束盘点并取出结果（提交和放弃都调用）
+
+        Returns:
+            tuple: (count_id, [(条码, 数量), ...])；未在盘点中返回 (None, [])
+        """
+        with self._lock:
+            if not self.active:
+                return None, []
+            items = list(self._counts.items())
+            count_id = self.count_id
+            self.active = False
+            self.count_id = self.started = None
+            self._counts = {}
+            self.total = 0
+            return count_id, items
+
+    def state(self):
+        """盘点状态（发送给手机端和PC端）"""
+        return {
+            'active': self.active,
+            'count_id': self.count_id,
+            'started': self.started,
+            'skus': len(self._counts),
+            'total': self.total
+        }
+
+
+class PresenceFilter:
+    """
+    盘点时同一件商品停留在画面中会被连续识别：同一连接的同一条码
+    在 rearm 秒内再次识别到时视为仍在画面中，不重复计数（服务器端帧解码使用）
+    """
+
+    def __init__(self, rearm=0.7):
+        self.rearm = rearm
+        self._seen = {}    # sid -> {条码: 最近识别时间}
+        self._lock = threading.Lock()
+
+    def accept(self, sid, barcode, now=None):
+        """是否为新出现在画面中的条码"""
+        now = now if now is not None else time.monotonic()
+        with self._lock:
+            seen = self._seen.get(sid)
+            if seen is None:
+                seen = self._seen[sid] = {}
+            elif len(seen) > 16:
+                for name in [name for name, last in seen.items() if now - last >= self.rearm]:
+                    del seen[name]
+            last = seen.get(barcode)
+            seen[barcode] = now
+            return last is None or now - last >= self.rearm
+
+    def remove(self, sid):
+        with self._lock:
+            self._seen.pop(sid, None)
+
+
+def write_count_file(directory, count_id, items, station=None):
+    """
+    把盘点结果写入CSV（先写临时文件再改名）
+
+    Returns:
+        str: 文件路径
+    """
+    os.makedirs(directory, exist_ok=True)
+    name = f"count-{datetime.now():%Y%m%d-%H%M%S}-{count_id}.csv"
+    path = os.path.join(directory, name)
+    # utf-8-sig：Excel直接打开不乱码
+    with open(path + '.tmp', 'w', encoding='utf-8-sig', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['barcode', 'quantity', 'station'])
+        for barcode, quantity in items:
+            writer.writerow([barcode, quantity, station or ''])
+    os.replace(path + '.tmp', path)
+    return path
+
+
+def parse_targets(value):
+    """
+    解析INVENTORY_COMMIT_TARGETS
+
+    Raises:
+        ValueError: 未知的输出方式
+    """
+    targets = [target.strip() for target in value.split(',') if target.strip()]
+    for target in targets:
+        if target not in COMMIT_TARGETS:
+            raise ValueError(f"未知的盘点输出方式: {target}（可选: {', '.join(COMMIT_TARGETS)}）")
+    return targets
@@ -1,11 +1,19 @@
 #!/usr/bin/env python3
 """
 模拟键盘输入模块
-基于pyautogui实现，支持跨平台操作
+基于pyautogui实现，支持跨平台操作；输入后端可替换（见 KEYBOARD_BACKEND / set_backend）
 """
 
+import collections
 import logging
+import os
 import platform
+import threading
+import time
+
+from utils.injection_profiles import ForegroundWindow, ProfileSet
+from utils.keymap import KeymapBackend
+from utils.profiling import spans
 
 logger = logging.getLogger(__name__)
 
@@ -53,12 +61,231 @@ def set_foreground_window():
             logger.debug(f"设置前台窗口失败: {e}")
 
 
-def simulate_keyboard_input(text):
+# 逐字符输入间隔（秒），0表示一次性输入
+TYPE_INTERVAL = float(os.getenv('KEYBOARD_TYPE_INTERVAL', '0.01'))
+
+
+class PyAutoGUIBackend:
+    """默认输入后端：pyautogui逐字符输入，pynput按下回车"""
+
+    name = 'pyautogui'
+
+    def __init__(self):
+        self.pyautogui = _setup_pyautogui()
+        try:
+            from pynput.keyboard import Key, Controller
+            self._enter_key = Key.enter
+            self._keyboard = Controller()
+        except Exception:
+            self._keyboard = None
+
+    def write(self, text, interval):
+        try:
+            self.pyautogui.write(text, interval=interval)
+        except Exception:
+            # 如果write失败，回退到typewrite
+            self.pyautogui.typewrite(text, interval=interval)
+
+    def enter(self):
+        if self._keyboard is None:
+            self.pyautogui.press('enter')
+            return
+        # 使用键盘控制器对象模拟按下回车
+        logger.debug("正在按下回车键")
+        self._keyboard.press(self._enter_key)
+        logger.debug("释放回车键")
+        self._keyboard.release(self._enter_key)
+
+    def tab(self):
+        self.pyautogui.press('tab')
+
+
+class PynputBackend:
+    """pynput输入后端（不依赖pyautogui）"""
+
+    name = 'pynput'
+
+    def __init__(self):
+        from pynput.keyboard import Key, Controller
+        self._enter_key = Key.enter
+        self._tab_key = Key.tab
+        self._keyboard = Controller()
+
+    def write(self, text, interval):
+        for char in text:
+            self._keyboard.type(char)
+            if interval:
+                time.sleep(interval)
+
+    def enter(self):
+        self._keyboard.press(self._enter_key)
+        self._keyboard.release(self._enter_key)
+
+    def tab(self):
+        self._keyboard.press(self._tab_key)
+        self._keyboard.release(self._tab_key)
+
+
+class RecordingBackend:
     """
-    使用pyautogui模拟键盘输入文本并自动添加回车符
+    记录输入后端：不产生真实按键，只记录 (时间, 字符)，回车记为'\\n'，Tab记为'\\t'
+    按相同的字符间隔等待，用于无显示环境下的基准测试和压测
+    """
+
+    name = 'recording'
+
+    def __init__(self, max_events=100000):
+        self.events = collections.deque(maxlen=max_events)
+
+    def write(self, text, interval):
+        for char in text:
+            self.events.append((time.perf_counter(), char))
+            if interval:
+                time.sleep(interval)
+
+    def enter(self):
+        self.events.append((time.perf_counter(), '\n'))
+
+    def tab(self):
+        self.events.append((time.perf_counter(), '\t'))
+
+    def typed_lines(self):
+        """按回车拆分已记录的输入"""
+        return ''.join(char for _, char in self.events).split('\n')[:-1]
+
+
+BACKENDS = {
+    'keymap': KeymapBackend,
+    'pyautogui': PyAutoGUIBackend,
+    'pynput': PynputBackend,
+    'recording': RecordingBackend,
+}
+
+_backend = None
+_backend_lock = threading.Lock()
+_named_backends = {}
+
+# 按目标程序的输入配置（见 INJECTION_PROFILES_FILE / set_profiles）
+_profiles = None
+_profiles_loaded = False
+
+
+def _create_default_backend():
+    name = os.getenv('KEYBOARD_BACKEND', 'auto')
+    if name != 'auto':
+        if name not in BACKENDS:
+            raise ValueError(f"未知的键盘输入后端: {name}")
+        return BACKENDS[name]()
+    # auto：Windows优先使用按键映射后端（不依赖输入法），其他平台使用pyautogui
+    if platform.system() == 'Windows':
+        try:
+            return KeymapBackend()
+        except Exception as e:
+            logger.warning(f"按键映射输入后端不可用，改用pyautogui: {e}")
+    return PyAutoGUIBackend()
+
+
+def get_backend():
+    """获取当前输入后端（首次调用时按KEYBOARD_BACKEND创建，默认auto）"""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = _create_default_backend()
+                logger.info(f"键盘输入后端: {_backend.name}")
+    return _backend
+
+
+def set_backend(backend):
+    """
+    替换输入后端
+
+    Args:
+        backend: 后端名称或具有 write(text, interval) / enter() 方法的对象
+
+    Returns:
+        当前后端实例
+    """
+    global _backend
+    if isinstance(backend, str):
+        backend = BACKENDS[backend]()
+    with _backend_lock:
+        _backend = backend
+    return backend
+
+
+def _named_backend(name):
+    """按名称获取输入配置指定的后端（每种只创建一次）"""
+    backend = _named_backends.get(name)
+    if backend is None:
+        with _backend_lock:
+            backend = _named_backends.get(name)
+            if backend is None:
+                if name not in BACKENDS:
+                    raise ValueError(f"未知的键盘输入后端: {name}")
+                backend = _named_backends[name] = BACKENDS[name]()
+    return backend
+
+
+def _check_profile_backends(profiles):
+    """
+    检查输入配置中的后端名称（加载时发现拼写错误，而不是在每次输入时失败）
+
+    Raises:
+        ValueError: 未知的输入后端
+    """
+    for profile in (profiles.default,) + profiles.profiles:
+        if profile.backend and profile.backend not in BACKENDS:
+            raise ValueError(f"输入配置 {profile.name} 的后端未知: {profile.backend}"
+                             f"（可选: {', '.join(BACKENDS)}）")
+
+
+def get_profiles():
+    """获取输入配置（首次调用时读取INJECTION_PROFILES_FILE，未配置时返回None）"""
+    global _profiles, _profiles_loaded
+    if not _profiles_loaded:
+        with _backend_lock:
+            if not _profiles_loaded:
+                path = os.getenv('INJECTION_PROFILES_FILE')
+                profiles = ProfileSet.from_file(path) if path else None
+                if profiles is not None:
+                    _check_profile_backends(profiles)
+                _profiles = profiles
+                _profiles_loaded = True
+    return _profiles
+
+
+def set_profiles(profiles):
+    """
+    替换输入配置
+
+    Args:
+        profiles: ProfileSet、配置文件路径，或None（不使用输入配置）
+
+    Returns:
+        当前输入配置
+
+    Raises:
+        ValueError: 配置中有未知的输入后端（原配置不变）
+    """
+    global _profiles, _profiles_loaded
+    if isinstance(profiles, str):
+        profiles = ProfileSet.from_file(profiles)
+    if profiles is not None:
+        _check_profile_backends(profiles)
+    with _backend_lock:
+        _profiles = profiles
+        _profiles_loaded = True
+    return profiles
+
+
+def simulate_keyboard_input(text, interval=None):
+    """
+    模拟键盘输入文本并自动添加回车符（配置了输入配置时按前台程序选择结束键）
 
     Args:
         text: 要输入的文本字符串
+        interval: 字符间隔（秒），默认使用输入配置或TYPE_INTERVAL
 
     Returns:
         bool: 是否成功
@@ -72,38 +299,35 @@ def simulate_keyboard_input(text):
             logger.warning("输入文本为空")
             return False
 
-        # 获取pyautogui实例
-        pyautogui = _setup_pyautogui()
+        # 获取输入后端和前台程序对应的输入配置
+        with spans.span('keyboard.setup'):
+            profiles = get_profiles()
+            profile = profiles.resolve() if profiles else None
+            if profile is not None and profile.backend:
+                backend = _named_backend(profile.backend)
+            else:
+                backend = get_backend()
+            if interval is None:
+                interval = profile.interval if profile is not None and profile.interval is not None else TYPE_INTERVAL
+            terminator = profile.terminator if profile is not None else ('enter',)
 
         # 尝试将窗口设置为前台（提高输入成功率）
         try:
-            set_foreground_window()
+            with spans.span('keyboard.foreground'):
+                set_foreground_window()
         except:
             pass
 
-        # 输入文本（使用typewrite，特殊字符需要特殊处理）
         logger.debug(f"正在输入文本: {text}")
-
-        # 对于一些特殊字符，使用write可能比typewrite更可靠
-        # typewrite更适合模拟单个按键，而write适合直接输入字符串
-        try:
-            # 导入pynput库模拟键盘输入，创建键盘控制器
-            from pynput.keyboard import Key, Controller
-            keyboard = Controller()
-            pyautogui.write(str(text), interval=0.01)
-            # 使用键盘控制器对象模拟按下回车
-            logger.debug("正在按下回车键")
-            keyboard.press(Key.enter)
-            logger.debug("释放回车键")
-            keyboard.release(Key.enter)
-
-        except:
-            # 如果write失败，回退到typewrite
-            pyautogui.typewrite(str(text), interval=0.01)
+        with spans.span('keyboard.write'):
+            backend.write(str(text), interval)
+        with spans.span('keyboard.enter'):
+            for key in terminator:
+                getattr(backend, key)()
 
         logger.debug("文本输入完成")
 
-        logger.info(f"成功输入条码: {text}")
+        logger.info(f"成功输入条码: {text}" + (f" (输入配置: {profile.name})" if profile is not None else ""))
         return True
 
     except Exception as e:
@@ -162,27 +386,29 @@ def get_window_info():
     获取当前活动窗口信息（调试用）
 
     Returns:
-        dict: 窗口信息
+        dict: 窗口信息，包含进程名和匹配的输入配置
     """
     system = platform.system()
     info = {
         'platform': system,
-        'active_window': None
+        'active_window': None,
+        'profile': None
     }
 
-    if system == 'Windows':
-        try:
-            import win32gui
-            hwnd = win32gui.GetForegroundWindow()
-            if hwnd:
-                info['active_window'] = {
-                    'title': win32gui.GetWindowText(hwnd),
-                    'hwnd': hwnd
-                }
-        except ImportError:
-            pass
-        except Exception as e:
-            logger.debug(f"获取窗口信息失败: {e}")
+    try:
+        profiles = get_profiles()
+        window = profiles.window if profiles else ForegroundWindow()
+        hwnd, process, title = window.current()
+        if hwnd:
+            info['active_window'] = {
+                'title': title,
+                'hwnd': hwnd,
+                'process': process
+            }
+        if profiles:
+            info['profile'] = profiles.profile_for(process, title).name
+    except Exception as e:
+        logger.debug(f"获取窗口信息失败: {e}")
 
     return info
 
@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+"""
+按键映射输入后端（Windows）
+- 每个键盘布局只构建一次 字符 -> (虚拟键码, 是否需要Shift) 映射表
+- 布局中没有的字符、或前台窗口的输入法处于中文等本地输入模式时，使用Unicode直接输入（KEYEVENTF_UNICODE），
+  不经过输入法转换，无需切换英文输入法
+- 编译好的按键序列按 (布局, 输入方式, 文本) 缓存，重复条码直接复用，一次SendInput调用完成输入
+"""
+
+import ctypes
+import functools
+import logging
+import os
+import platform
+import time
+
+logger = logging.getLogger(__name__)
+
+VK_SHIFT = 0x10
+VK_RETURN = 0x0D
+VK_TAB = 0x09
+
+INPUT_KEYBOARD = 1
+KEYEVENTF_KEYUP = 0x0002
+KEYEVENTF_UNICODE = 0x0004
+
+WM_IME_CONTROL = 0x0283
+IMC_GETCONVERSIONMODE = 0x0001
+IMC_GETOPENSTATUS = 0x0005
+IME_CMODE_NATIVE = 0x0001
+SMTO_ABORTIFHUNG = 0x0002
+
+# 映射表覆盖的字符（可打印ASCII），其余字符走Unicode输入
+LAYOUT_CHARS = ''.join(chr(c) for c in range(0x20, 0x7f))
+
+# 控制字符始终按实际按键发送（表格等按Tab/回车键而不是WM_CHAR切换单元格），与布局和输入法无关
+CONTROL_KEYS = {'\t': VK_TAB, '\n': VK_RETURN}
+
+# 编译序列缓存条数
+SEQUENCE_CACHE_SIZE = 1024
+
+# Unicode输入模式：auto（输入法处于本地输入模式时全部使用Unicode）/ always / never
+UNICODE_MODES = ('auto', 'always', 'never')
+
+
+def compile_events(text, keymap, unicode_only=False):
+    """
+    将文本编译为按键事件序列（与平台无关，便于测试）
+
+    Args:
+        text: 要输入的文本
+        keymap: 字符 -> (虚拟键码, 是否需要Shift)
+        unicode_only: 是否全部使用Unicode输入
+
+    Returns:
+        tuple: (类型, 码, 是否按下) 的序列，类型为 'vk' 或 'unicode'
+    """
+    events = []
+    shift_down = False
+    for char in text:
+        if char in CONTROL_KEYS:
+            key = (CONTROL_KEYS[char], False)
+        else:
+            key = None if unicode_only else keymap.get(char)
+        if key is None:
+            if shift_down:
+                events.append(('vk', VK_SHIFT, False))
+                shift_down = False
+            # 超出BMP的字符按UTF-16代理对逐个发送
+            data = char.encode('utf-16-le')
+            for i in range(0, len(data), 2):
+                unit = int.from_bytes(data[i:i + 2], 'little')
+                events.append(('unicode', unit, True))
+                events.append(('unicode', unit, False))
+            continue
+
+        vk, shift = key
+        # 连续的大写/符号字符保持Shift按下，减少按键事件
+        if shift != shift_down:
+            events.append(('vk', VK_SHIFT, shift))
+            shift_down = shift
+        events.append(('vk', vk, True))
+        events.append(('vk', vk, False))
+    if shift_down:
+        events.append(('vk', VK_SHIFT, False))
+    return tuple(events)
+
+
+class KeymapBackend:
+    """
+    Windows按键映射输入后端
+
+    Args:
+        unicode_mode: Unicode输入模式，默认读取KEYBOARD_UNICODE_MODE（auto）
+    """
+
+    name = 'keymap'
+
+    def __init__(self, unicode_mode=None):
+        if platform.system() != 'Windows':
+            raise OSError('按键映射输入后端仅支持Windows')
+        self.unicode_mode = unicode_mode or os.getenv('KEYBOARD_UNICODE_MODE', 'auto')
+        if self.unicode_mode not in UNICODE_MODES:
+            raise ValueError(f"未知的Unicode输入模式: {self.unicode_mode}")
+
+        from ctypes import wintypes
+        self.user32 = ctypes.WinDLL('user32', use_last_error=True)
+        self.imm32 = ctypes.WinDLL('imm32')
+        self.user32.GetForegroundWindow.restype = wintypes.HWND
+        self.user32.GetWindowThreadProcessId.argtypes = (wintypes.HWND, ctypes.c_void_p)
+        self.user32.GetWindowThreadProcessId.restype = wintypes.DWORD
+        self.user32.GetKeyboardLayout.argtypes = (wintypes.DWORD,)
+        self.user32.GetKeyboardLayout.restype = ctypes.c_void_p
+        self.user32.VkKeyScanExW.argtypes = (wintypes.WCHAR, ctypes.c_void_p)
+        self.user32.VkKeyScanExW.restype = ctypes.c_short
+        self.user32.SendMessageTimeoutW.argtypes = (
+            wintypes.HWND, wintypes.UINT, wintypes.WPARAM, wintypes.LPARAM,
+            wintypes.UINT, wintypes.UINT, ctypes.POINTER(ctypes.c_size_t)
+        )
+        self.user32.SendInput.argtypes = (wintypes.UINT, ctypes.c_void_p, ctypes.c_int)
+        self.user32.SendInput.restype = wintypes.UINT
+        self.imm32.ImmGetDefaultIMEWnd.argtypes = (wintypes.HWND,)
+        self.imm32.ImmGetDefaultIMEWnd.restype = wintypes.HWND
+
+        self._input_type = _input_structure()
+        self._keymaps = {}
+        self._sequence = functools.lru_cache(maxsize=SEQUENCE_CACHE_SIZE)(self._build_sequence)
+        self._enter = self._to_inputs((('vk', VK_RETURN, True), ('vk', VK_RETURN, False)))
+        self._tab = self._to_inputs((('vk', VK_TAB, True), ('vk', VK_TAB, False)))
+
+    def keymap(self, layout):
+        """获取布局的字符映射表（每个布局只构建一次）"""
+        table = self._keymaps.get(layout)
+        if table is None:
+            table = {}
+            for char in LAYOUT_CHARS:
+                result = self.user32.VkKeyScanExW(char, layout)
+                if result == -1:
+                    continue
+                vk, modifiers = result & 0xff, (result >> 8) & 0xff
+                # 只映射无修饰或仅Shift的字符；需要Ctrl/AltGr的字符走Unicode输入
+                if modifiers in (0, 1):
+                    table[char] = (vk, modifiers == 1)
+            self._keymaps[layout] = table
+            logger.info(f"已构建键盘布局 {layout:#x} 的映射表 ({len(table)} 个字符)")
+        return table
+
+    def _foreground_state(self):
+        """前台窗口的键盘布局，以及是否需要全部使用Unicode输入"""
+        hwnd = self.user32.GetForegroundWindow()
+        thread_id = self.user32.GetWindowThreadProcessId(hwnd, None)
+        layout = self.user32.GetKeyboardLayout(thread_id) or 0
+
+        if self.unicode_mode != 'auto':
+            return layout, self.unicode_mode == 'always'
+        return layout, self._ime_native_mode(hwnd)
+
+    def _ime_native_mode(self, hwnd):
+        """输入法是否打开且处于本地输入（如中文）模式"""
+        ime_wnd = self.imm32.ImmGetDefaultIMEWnd(hwnd)
+        if not ime_wnd:
+            return False
+        result = ctypes.c_size_t()
+        if not self.user32.SendMessageTimeoutW(ime_wnd, WM_IME_CONTROL, IMC_GETOPENSTATUS, 0,
+                                               SMTO_ABORTIFHUNG, 50, ctypes.byref(result)):
+            return False
+        if not result.value:
+            return False
+        if not self.user32.SendMessageTimeoutW(ime_wnd, WM_IME_CONTROL, IMC_GETCONVERSIONMODE, 0,
+                                               SMTO_ABORTIFHUNG, 50, ctypes.byref(result)):
+            return True
+        return bool(result.value & IME_CMODE_NATIVE)
+
+    def _build_sequence(self, layout, unicode_only, text, paced):
+        """编译文本为SendInput数组列表（结果被缓存）；需要字符间隔时按字符分组"""
+        keymap = self.keymap(layout)
+        if not paced:
+            return [self._to_inputs(compile_events(text, keymap, unicode_only))]
+        return [self._to_inputs(compile_events(char, keymap, unicode_only)) for char in text]
+
+    def _to_inputs(self, events):
+        inputs = (self._input_type * len(events))()
+        for item, (kind, code, down) in zip(inputs, events):
+            item.type = INPUT_KEYBOARD
+            flags = 0 if down else KEYEVENTF_KEYUP
+            if kind == 'unicode':
+                item.ki.wScan = code
+                flags |= KEYEVENTF_UNICODE
+            else:
+                item.ki.wVk = code
+            item.ki.dwFlags = flags
+        return inputs
+
+    def _send(self, inputs):
+        sent = self.user32.SendInput(len(inputs), inputs, ctypes.sizeof(self._input_type))
+        if sent != len(inputs):
+            raise OSError(f"SendInput只发送了 {sent}/{len(inputs)} 个事件 (错误码 {ctypes.get_last_error()})")
+
+    def write(self, text, interval):
+        layout, unicode_only = self._foreground_state()
+        for inputs in self._sequence(layout, unicode_only, text, bool(interval)):
+            self._send(inputs)
+            if interval:
+                time.sleep(interval)
+
+    def enter(self):
+        self._send(self._enter)
+
+    def tab(self):
+        self._send(self._tab)
+
+    def cache_info(self):
+        """编译序列缓存命中情况"""
+        return self._sequence.cache_info()
+
+
+def _input_structure():
+    """构造Win32 INPUT结构体类型"""
+    from ctypes import wintypes
+
+    class KEYBDINPUT(ctypes.Structure):
+        _fields_ = (('wVk', wintypes.WORD),
+                    ('wScan', wintypes.WORD),
+                    ('dwFlags', wintypes.DWORD),
+                    ('time', wintypes.DWORD),
+                    ('dwExtraInfo', ctypes.c_size_t))
+
+    class MOUSEINPUT(ctypes.Structure):
+        _fields_ = (('dx', wintypes.LONG),
+                    ('dy', wintypes.LONG),
+                    ('mouseData', wintypes.DWORD),
+                    ('dwFlags', wintypes.DWORD),
+                    ('time', wintypes.DWORD),
+                    ('dwExtraInfo', ctypes.c_size_t))
+
+    class HARDWAREINPUT(ctypes.Structure):
+        _fields_ = (('uMsg', wintypes.DWORD),
+                    ('wParamL', wintypes.WORD),
+                    ('wParamH', wintypes.WORD))
+
+    class _INPUTUNION(ctypes.Union):
+        _fields_ = (('ki', KEYBDINPUT), ('mi', MOUSEINPUT), ('hi', HARDWAREINPUT))
+
+    class INPUT(ctypes.Structure):
+        _anonymous_ = ('u',)
+        _fields_ = (('type', wintypes.DWORD), ('u', _INPUTUNION))
+
+    return INPUT
@@ -0,0 +1,441 @@
+#!/usr/bin/env python3
+"""
+商品目录索引
+从SKU主数据CSV构建紧凑的有序索引文件，通过mmap二分查找条码，
+无需把整个目录加载为Python对象。热点条码由LRU缓存加速。
+"""
+
+import csv
+import functools
+import heapq
+import json
+import logging
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+import zlib
+
+logger = logging.getLogger(__name__)
+
+# 索引文件头: 魔数, 记录数, 键长度, CSV大小, CSV修改时间(ns), CSV尾部CRC, 记录区偏移, 数据区偏移
+INDEX_MAGIC = b'H5CAT\x00\x01\x00'
+HEADER_STRUCT = struct.Struct('<8sQHQqIQQ')
+
+# 每条记录: 条码键(定长,不足补0) + 数据偏移 + 数据长度
+RECORD_TAIL_STRUCT = struct.Struct('<QI')
+
+DEFAULT_KEY_SIZE = 32
+
+# 外部排序时每个分块的行数（控制构建时的内存占用）
+SORT_CHUNK_ROWS = 500000
+
+# 用于判断CSV是否只是追加的尾部校验长度
+TAIL_CHECK_BYTES = 4096
+
+
+def _tail_crc(path, size):
+    """计算文件前size字节中最后一段的CRC，用于判断CSV是否只追加"""
+    if size <= 0:
+        return 0
+    with open(path, 'rb') as f:
+        f.seek(max(0, size - TAIL_CHECK_BYTES))
+        return zlib.crc32(f.read(min(size, TAIL_CHECK_BYTES)))
+
+
+class ProductCatalog:
+    """
+    商品目录（mmap索引）
+
+    Args:
+        csv_path: SKU主数据CSV路径
+        index_path: 索引文件路径，默认为 csv_path + '.idx'
+        barcode_column: 条码列名
+        key_size: 索引中条码键的定长字节数
+        cache_size: 热点条码LRU缓存大小
+        check_interval: 查询时检查CSV是否变化的最短间隔（秒），0为只在open/refresh时检查
+    """
+
+    def __init__(self, csv_path, index_path=None, barcode_column='barcode',
+                 key_size=DEFAULT_KEY_SIZE, cache_size=4096, check_interval=60.0):
+        self.csv_path = csv_path
+        self.index_path = index_path or f"{csv_path}.idx"
+        self.barcode_column = barcode_column
+        self.key_size = key_size
+        self.record_size = key_size + RECORD_TAIL_STRUCT.size
+
+        self._file = None
+        self._mm = None
+        self._count = 0
+        self._records_offset = 0
+        self._header = None
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+        self._build_thread = None
+        self.check_interval = check_interval
+        self._next_check = time.monotonic() + check_interval
+
+        self.lookups = 0
+        self.misses = 0
+
+        self._cached_lookup = functools.lru_cache(maxsize=cache_size)(self._lookup_uncached)
+
+    # ------------------------------------------------------------------
+    # 打开 / 重建
+    # ------------------------------------------------------------------
+
+    def open(self, background=True):
+        """
+        打开索引。索引存在时立即mmap（毫秒级）；
+        CSV有变化时在后台增量或全量重建，期间继续使用旧索引。
+
+        Args:
+            background: 是否在后台线程中重建
+        """
+        if os.path.exists(self.index_path):
+            try:
+                self._load_index()
+                logger.info(f"商品索引已加载: {self._count} 条 ({self.index_path})")
+            except Exception as e:
+                logger.warning(f"商品索引无效，将重建: {e}")
+
+        self.refresh(background)
+
+    def refresh(self, background=True):
+        """
+        CSV有变化时重建索引（正在重建时跳过），长期运行时由reload_config和定期检查调用
+
+        Returns:
+            bool: 是否开始了重建
+        """
+        with self._build_lock:
+            if self._build_thread is not None and self._build_thread.is_alive():
+                return False
+            if not self._needs_rebuild():
+                return False
+            logger.info(f"商品目录CSV有变化: {self.csv_path}")
+            if background:
+                self._build_thread = threading.Thread(target=self.rebuild, daemon=True)
+                self._build_thread.start()
+                return True
+        self.rebuild()
+        return True
+
+    def _needs_rebuild(self):
+        if not os.path.exists(self.csv_path):
+            return False
+        if self._header is None:
+            return True
+        stat = os.stat(self.csv_path)
+        _magic, _count, _ks, csv_size, csv_mtime, _crc, _ro, _do = self._header
+        return stat.st_size != csv_size or stat.st_mtime_ns != csv_mtime
+
+    def _load_index(self):
+        f = open(self.index_path, 'rb')
+        try:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            f.close()
+            raise ValueError('索引文件为空')
+        header = HEADER_STRUCT.unpack_from(mm, 0)
+        magic, count, key_size, _size, _mtime, _crc, records_offset, _data_offset = header
+        if magic != INDEX_MAGIC or key_size != self.key_size:
+            mm.close()
+            f.close()
+            raise ValueError('索引文件格式不匹配')
+
+        with self._lock:
+            old_mm, old_file = self._mm, self._file
+            self._mm, self._file = mm, f
+            self._header = header
+            self._count = count
+            self._records_offset = records_offset
+            self._cached_lookup.cache_clear()
+
+        if old_mm is not None:
+            old_mm.close()
+            old_file.close()
+
+    def rebuild(self):
+        """
+        重建索引。CSV只是追加新行时，只解析新增部分并与旧索引归并；
+        否则全量外部排序重建。
+        """
+        start = time.perf_counter()
+        stat = os.stat(self.csv_path)
+
+        incremental = False
+        if self._header is not None:
+            _magic, _count, _ks, csv_size, _mtime, crc, _ro, _do = self._header
+            if 0 < csv_size < stat.st_size and _tail_crc(self.csv_path, csv_size) == crc:
+                incremental = True
+
+        try:
+            if incremental:
+                csv_size = self._header[3]
+                logger.info(f"CSV仅追加，增量更新商品索引 (从 {csv_size} 字节开始)")
+                runs = self._sort_csv_rows(start_offset=csv_size)
+                sources = [self._iter_index_entries()] + [self._iter_run(r) for r in runs]
+            else:
+                logger.info("正在全量构建商品索引...")
+                runs = self._sort_csv_rows()
+                sources = [self._iter_run(r) for r in runs]
+
+            try:
+                self._write_index(heapq.merge(*sources), stat)
+            finally:
+                for run in runs:
+                    os.unlink(run)
+
+            self._load_index()
+            logger.info(f"商品索引构建完成: {self._count} 条, 耗时 {time.perf_counter() - start:.2f}s")
+        except Exception as e:
+            logger.error(f"构建商品索引失败: {e}", exc_info=True)
+
+    def _iter_csv_rows(self, start_offset=0):
+        """逐行读取CSV，返回(条码, 数据JSON)。start_offset>0时只读取该偏移之后的新行"""
+        with open(self.csv_path, 'r', encoding='utf-8-sig', newline='') as f:
+            reader = csv.reader(f)
+            header = next(reader)
+            try:
+                barcode_index = header.index(self.barcode_column)
+            except ValueError:
+                raise ValueError(f"CSV中缺少条码列: {self.barcode_column}")
+
+            if start_offset:
+                f.seek(start_offset)
+                reader = csv.reader(f)
+
+            for row in reader:
+                if len(row) <= barcode_index:
+                    continue
+                barcode = row[barcode_index].strip()
+                if not barcode:
+                    continue
+                payload = dict(zip(header, row))
+                yield barcode, json.dumps(payload, ensure_ascii=False, separators=(',', ':'))
+
+    def _sort_csv_rows(self, start_offset=0):
+        """外部排序：按块排序后写入临时文件，返回临时文件路径列表"""
+        runs = []
+        chunk = []
+        skipped = 0
+        seq = 0
+        for barcode, payload in self._iter_csv_rows(start_offset):
+            key = barcode.encode('utf-8')
+            if len(key) > self.key_size:
+                skipped += 1
+                continue
+            seq += 1
+            chunk.append((key, seq, payload))
+            if len(chunk) >= SORT_CHUNK_ROWS:
+                runs.append(self._write_run(chunk))
+                chunk = []
+        if chunk:
+            runs.append(self._write_run(chunk))
+        if skipped:
+            logger.warning(f"{skipped} 个条码超过索引键长度 {self.key_size}，已跳过")
+        return runs
+
+    def _write_run(self, chunk):
+        chunk.sort()
+        fd, path = tempfile.mkstemp(prefix='h5cat-', suffix='.run',
+                                    dir=os.path.dirname(os.path.abspath(self.index_path)))
+        with os.fdopen(fd, 'w', encoding='utf-8', newline='\n') as f:
+            for key, seq, payload in chunk:
+                f.write(f"{key.hex()}\t{seq}\t{payload}\n")
+        return path
+
+    @staticmethod
+    def _iter_run(path):
+        with open(path, 'r', encoding='utf-8', newline='\n') as f:
+            for line in f:
+                key_hex, seq, payload = line.rstrip('\n').split('\t', 2)
+                yield bytes.fromhex(key_hex), int(seq), payload
+
+    def _iter_index_entries(self):
+        """按顺序遍历旧索引（seq为0，优先级低于新增行）"""
+        mm = self._mm
+        for i in range(self._count):
+            key, offset, length = self._record_at(mm, i)
+            yield key, 0, mm[offset:offset + length].decode('utf-8')
+
+    def _write_index(self, entries, stat):
+        """将有序条目写入索引文件（同一条码保留最后一条）"""
+        directory = os.path.dirname(os.path.abspath(self.index_path))
+        key_size = self.key_size
+        count = 0
+
+        with tempfile.TemporaryFile(dir=directory) as records, \
+                tempfile.TemporaryFile(dir=directory) as data:
+            data_offset = 0
+            pending = None
+            for key, _seq, payload in entries:
+                if pending is not None and pending[0] != key:
+                    count, data_offset = self._emit_record(records, data, pending, count, data_offset)
+                pending = (key, payload)
+            if pending is not None:
+                count, data_offset = self._emit_record(records, data, pending, count, data_offset)
+
+            records_offset = HEADER_STRUCT.size
+            data_start = records_offset + count * self.record_size
+
+            fd, tmp_path = tempfile.mkstemp(prefix='h5cat-', suffix='.idx', dir=directory)
+            with os.fdopen(fd, 'wb') as out:
+                out.write(HEADER_STRUCT.pack(
+                    INDEX_MAGIC, count, key_size, stat.st_size, stat.st_mtime_ns,
+                    _tail_crc(self.csv_path, stat.st_size), records_offset, data_start
+                ))
+                # 记录区中的偏移是相对数据区的，这里统一加上数据区起始位置
+                records.seek(0)
+                tail = RECORD_TAIL_STRUCT
+                while True:
+                    block = records.read(self.record_size * 4096)
+                    if not block:
+                        break
+                    buf = bytearray(block)
+                    for pos in range(key_size, len(buf), self.record_size):
+                        offset, length = tail.unpack_from(buf, pos)
+                        tail.pack_into(buf, pos, offset + data_start, length)
+                    out.write(buf)
+                data.seek(0)
+                while True:
+                    block = data.read(1 << 20)
+                    if not block:
+                        break
+                    out.write(block)
+
+        # Windows下被mmap的文件不能被替换，先释放旧映射
+        if os.name == 'nt':
+            with self._lock:
+                if self._mm is not None:
+                    self._mm.close()
+                    self._file.close()
+                    self._mm = self._file = None
+                    self._header = None
+                    self._count = 0
+        os.replace(tmp_path, self.index_path)
+
+    def _emit_record(self, records, data, item, count, data_offset):
+        key, payload = item
+        raw = payload.encode('utf-8')
+        records.write(key.ljust(self.key_size, b'\x00'))
+        records.write(RECORD_TAIL_STRUCT.pack(data_offset, len(raw)))
+        data.write(raw)
+        return count + 1, data_offset + len(raw)
+
+    # ------------------------------------------------------------------
+    # 查询
+    # ------------------------------------------------------------------
+
+    def _record_at(self, mm, index):
+        pos = self._records_offset + index * self.record_size
+        key = mm[pos:pos + self.key_size].rstrip(b'\x00')
+        offset, length = RECORD_TAIL_STRUCT.unpack_from(mm, pos + self.key_size)
+        return key, offset, length
+
+    def _lookup_uncached(self, barcode):
+        with self._lock:
+            mm = self._mm
+            if mm is None:
+                return None
+            key = barcode.encode('utf-8')
+            if len(key) > self.key_size:
+                return None
+            padded = key.ljust(self.key_size, b'\x00')
+            base = self._records_offset
+            size = self.record_size
+            key_size = self.key_size
+
+            lo, hi = 0, self._count
+            while lo < hi:
+                mid = (lo + hi) // 2
+                pos = base + mid * size
+                current = mm[pos:pos + key_size]
+                if current < padded:
+                    lo = mid + 1
+                elif current > padded:
+                    hi = mid
+                else:
+                    offset, length = RECORD_TAIL_STRUCT.unpack_from(mm, pos + key_size)
+                    return mm[offset:offset + length].decode('utf-8')
+            return None
+
+    def lookup(self, barcode):
+        """
+        按条码查询商品信息
+
+        Args:
+            barcode: 条码
+
+        Returns:
+            dict: CSV行数据（列名 -> 值），未找到时返回None
+        """
+        self.lookups += 1
+        if self.check_interval > 0:
+            now = time.monotonic()
+            if now >= self._next_check:
+                self._next_check = now + self.check_interval
+                self.refresh()
+        payload = self._cached_lookup(barcode)
+        if payload is None:
+            self.misses += 1
+            return None
+        return json.loads(payload)
+
+    @property
+    def ready(self):
+        """索引是否可用"""
+        return self._mm is not None
+
+    def get_stats(self):
+        """获取目录统计"""
+        cache = self._cached_lookup.cache_info()
+        return {
+            'ready': self.ready,
+            'products': self._count,
+            'lookups': self.lookups,
+            'misses': self.misses,
+            'cache_hits': cache.hits,
+            'cache_size': cache.currsize,
+            'rebuilding': bool(self._build_thread and self._build_thread.is_alive())
+        }
+
+    def close(self):
+        """释放mmap"""
+        with self._lock:
+            if self._mm is not None:
+                self._mm.close()
+                self._file.close()
+                self._mm = self._file = None
+
+    def __len__(self):
+        return self._count
+
+
+if __name__ == '__main__':
+    import argparse
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s'
+    )
+
+    parser = argparse.ArgumentParser(description='商品目录索引')
+    parser.add_argument('csv', help='SKU主数据CSV路径')
+    parser.add_argument('--index', help='索引文件路径')
+    parser.add_argument('--column', default='barcode', help='条码列名')
+    parser.add_argument('codes', nargs='*', help='要查询的条码')
+
+    args = parser.parse_args()
+
+    catalog = ProductCatalog(args.csv, index_path=args.index, barcode_column=args.column)
+    catalog.open(background=False)
+    for code in args.codes:
+        start = time.perf_counter()
+        product = catalog.lookup(code)
+        elapsed = (time.perf_counter() - start) * 1e6
+        print(f"{code}: {product} ({elapsed:.1f}us)")
+    print(catalog.get_stats())
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""
+性能分析工具
+- 采样分析器：定期抓取所有线程的调用栈，输出火焰图可用的折叠格式(folded stacks)
+- 阶段计时：扫码处理与键盘输入各阶段的耗时统计，运行时可开关，关闭时几乎无开销
+"""
+
+import collections
+import logging
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# 单次采样分析的最长时间（秒）
+MAX_PROFILE_SECONDS = 60
+
+
+def _frame_label(code, cache):
+    label = cache.get(code)
+    if label is None:
+        label = f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+        cache[code] = label
+    return label
+
+
+def sample_stacks(seconds, interval=0.005):
+    """
+    采样所有线程的调用栈
+
+    Args:
+        seconds: 采样时长（秒）
+        interval: 采样间隔（秒）
+
+    Returns:
+        collections.Counter: 折叠调用栈 -> 采样次数
+    """
+    seconds = min(float(seconds), MAX_PROFILE_SECONDS)
+    interval = max(float(interval), 0.001)
+    own_id = threading.get_ident()
+    counts = collections.Counter()
+    labels = {}
+    thread_names = {}
+
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        frames = sys._current_frames()
+        if len(thread_names) != len(frames):
+            thread_names = {t.ident: t.name for t in threading.enumerate()}
+        for thread_id, frame in frames.items():
+            if thread_id == own_id:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(_frame_label(frame.f_code, labels))
+                frame = frame.f_back
+            stack.append(thread_names.get(thread_id, str(thread_id)))
+            stack.reverse()
+            counts[';'.join(stack)] += 1
+        del frames
+        time.sleep(interval)
+    return counts
+
+
+def current_rss_kb():
+    """
+    当前进程常驻内存（KB）
+
+    Linux读取/proc/self/status；其他平台返回峰值RSS（resource模块），都不可用时返回None
+    """
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # macOS单位为字节，Linux为KB
+        return peak // 1024 if sys.platform == 'darwin' else peak
+    except ImportError:
+        return None
+
+
+def format_folded(counts):
+    """转换为折叠格式文本（每行: 调用栈 次数），可直接用于flamegraph.pl或speedscope"""
+    return ''.join(f"{stack} {count}\n" for stack, count in counts.most_common())
+
+
+class SpanRecorder:
+    """
+    阶段耗时记录器
+
+    Example:
+        with spans.span('rules'):
+            ...
+    """
+
+    def __init__(self, window=1000):
+        self.enabled = os.getenv('TIMING_SPANS', 'false').lower() == 'true'
+        self.window = window
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def _timed(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def span(self, name):
+        """计时上下文，未启用时返回空上下文"""
+        if not self.enabled:
+            return _NULL_SPAN
+        return self._timed(name)
+
+    def record(self, name, seconds):
+        """记录一次耗时（秒）"""
+        if not self.enabled:
+            return
+        with self._lock:
+            stat = self._stats.get(name)
+            if stat is None:
+                stat = self._stats[name] = {
+                    'count': 0,
+                    'total': 0.0,
+                    'max': 0.0,
+                    'recent': collections.deque(maxlen=self.window)
+                }
+            stat['count'] += 1
+            stat['total'] += seconds
+            if seconds > stat['max']:
+                stat['max'] = seconds
+            stat['recent'].append(seconds)
+
+    def set_enabled(self, enabled):
+        self.enabled = bool(enabled)
+        logger.info(f"阶段计时已{'开启' if self.enabled else '关闭'}")
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+
+    def get_stats(self):
+        """各阶段统计（毫秒）"""
+        with self._lock:
+            items = [(name, dict(stat, recent=sorted(stat['recent']))) for name, stat in self._stats.items()]
+        result = {}
+        for name, stat in items:
+            recent = stat['recent']
+            result[name] = {
+                'count': stat['count'],
+                'avg_ms': round(stat['total'] / stat['count'] * 1000, 3),
+                'max_ms': round(stat['max'] * 1000, 3),
+                'p50_ms': round(recent[len(recent) // 2] * 1000, 3) if recent else 0,
+                'p95_ms': round(recent[min(len(recent) - 1, int(len(recent) * 0.95))] * 1000, 3) if recent else 0
+            }
+        return {'enabled': self.enabled, 'spans': result}
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+# 全局阶段计时器
+spans = SpanRecorder()
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+Socket.IO消息编码
+每个连接在client_info中协商编码方式：
+- json: 默认，兼容所有客户端，时间戳为ISO字符串
+- msgpack: 二进制附件传输，时间戳为整数epoch毫秒，解析更快、体积更小
+"""
+
+import json
+import logging
+import math
+import time
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+ENCODING_JSON = 'json'
+ENCODING_MSGPACK = 'msgpack'
+
+
+def available_encodings():
+    """服务器支持的编码列表（按优先级）"""
+    return [ENCODING_MSGPACK, ENCODING_JSON] if msgpack else [ENCODING_JSON]
+
+
+def negotiate_encoding(client_encodings):
+    """
+    根据客户端声明的编码选择本连接使用的编码
+
+    Args:
+        client_encodings: 客户端支持的编码列表
+
+    Returns:
+        str: 选定的编码
+    """
+    for encoding in available_encodings():
+        if encoding in (client_encodings or ()):
+            return encoding
+    return ENCODING_JSON
+
+
+def now_ms():
+    """当前epoch毫秒"""
+    return int(time.time() * 1000)
+
+
+def to_epoch_ms(value):
+    """
+    将客户端时间戳统一转换为epoch毫秒
+
+    Args:
+        value: 整数/浮点epoch毫秒或ISO字符串
+
+    Returns:
+        int: epoch毫秒，无法解析时返回None
+    """
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        # JSON/MessagePack都能解出NaN和Infinity
+        return int(value) if math.isfinite(value) else None
+    try:
+        return int(datetime.fromisoformat(str(value).replace('Z', '+00:00')).timestamp() * 1000)
+    except ValueError:
+        return None
+
+
+def decode_message(payload):
+    """
+    解码客户端发来的消息
+
+    Args:
+        payload: dict（JSON）或bytes（MessagePack二进制附件）
+
+    Returns:
+        dict: 消息内容
+
+    Raises:
+        ValueError: 无法解码
+    """
+    if isinstance(payload, dict):
+        return payload
+    if isinstance(payload, (bytes, bytearray)):
+        if msgpack is None:
+            raise ValueError('服务器未安装msgpack，无法解析二进制消息')
+        data = msgpack.unpackb(payload, raw=False)
+        if not isinstance(data, dict):
+            raise ValueError('消息格式错误')
+        return data
+    if payload is None:
+        return {}
+    raise ValueError(f"不支持的消息类型: {type(payload).__name__}")
+
+
+def encode_message(data, encoding):
+    """
+    按连接的编码方式编码发送给客户端的消息
+
+    Args:
+        data: 消息内容dict
+        encoding: 连接编码
+
+    Returns:
+        dict或bytes
+    """
+    if encoding == ENCODING_MSGPACK and msgpack is not None:
+        return msgpack.packb(data, use_bin_type=True)
+    return data
+
+
+def benchmark(iterations=100000):
+    """
+    比较JSON与MessagePack的编解码耗时和消息体积
+
+    Returns:
+        dict: 每种编码的 encode_us / decode_us / size
+    """
+    json_message = {
+        'barcode': '6901234567892',
+        'timestamp': datetime.now().isoformat(),
+        'interval': 523
+    }
+    msgpack_message = dict(json_message, timestamp=now_ms())
+
+    results = {}
+    cases = [('json', json_message,
+              lambda m: json.dumps(m, separators=(',', ':')).encode('utf-8'),
+              lambda b: json.loads(b))]
+    if msgpack is not None:
+        cases.append(('msgpack', msgpack_message,
+                      lambda m: msgpack.packb(m, use_bin_type=True),
+                      lambda b: msgpack.unpackb(b, raw=False)))
+    else:
+        logger.warning("msgpack未安装，只测试JSON")
+
+    for name, message, encode, decode in cases:
+        encoded = encode(message)
+        start = time.perf_counter()
+        for _ in range(iterations):
+            encode(message)
+        encode_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for _ in range(iterations):
+            decode(encoded)
+        decode_time = time.perf_counter() - start
+
+        results[name] = {
+            'encode_us': round(encode_time / iterations * 1e6, 3),
+            'decode_us': round(decode_time / iterations * 1e6, 3),
+            'size': len(encoded)
+        }
+    return results
+
+
+if __name__ == '__main__':
+    import argparse
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s'
+    )
+
+    parser = argparse.ArgumentParser(description='Socket.IO消息编码基准测试')
+    parser.add_argument('-n', '--iterations', type=int, default=100000, help='每项测试的迭代次数')
+    args = parser.parse_args()
+
+    print(json.dumps(benchmark(args.iterations), indent=2))
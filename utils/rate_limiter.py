@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+扫码限流
+每个连接一个令牌桶，外加一个全局令牌桶，防止异常客户端刷屏式上报条码。
+"""
+
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """
+    令牌桶
+
+    Args:
+        rate: 每秒补充的令牌数
+        burst: 桶容量（允许的突发数量）
+    """
+
+    __slots__ = ('rate', 'burst', 'tokens', 'updated')
+
+    def __init__(self, rate, burst):
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        elapsed = now - self.updated
+        if elapsed > 0:
+            self.tokens = min(self.burst, self.tokens + elapsed * self.rate)
+            self.updated = now
+
+    def try_acquire(self, now=None):
+        """尝试取出一个令牌，成功返回True"""
+        self._refill(time.monotonic() if now is None else now)
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+    def refund(self):
+        """归还一个令牌（全局桶拒绝时退还单连接桶的令牌）"""
+        self.tokens = min(self.burst, self.tokens + 1)
+
+    def retry_after(self):
+        """距离下一个令牌可用的秒数"""
+        if self.tokens >= 1 or self.rate <= 0:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class RateLimiter:
+    """
+    扫码限流器（单连接令牌桶 + 全局令牌桶）
+
+    Args:
+        client_rate: 每个连接每秒允许的扫码数
+        client_burst: 每个连接允许的突发数量
+        global_rate: 全部连接合计每秒允许的扫码数
+        global_burst: 全局突发数量
+    """
+
+    def __init__(self, client_rate=20, client_burst=10, global_rate=50, global_burst=50):
+        self.client_rate = client_rate
+        self.client_burst = client_burst
+        self._global = TokenBucket(global_rate, global_burst)
+        self._buckets = {}
+        self._throttled = {}
+        self._lock = threading.Lock()
+        self.allowed = 0
+        self.throttled = 0
+
+    def acquire(self, client_id):
+        """
+        为一次扫码申请令牌
+
+        Args:
+            client_id: 连接ID
+
+        Returns:
+            tuple: (是否允许, 建议重试等待秒数)
+        """
+        with self._lock:
+            now = time.monotonic()
+            bucket = self._buckets.get(client_id)
+            if bucket is None:
+                bucket = self._buckets[client_id] = TokenBucket(self.client_rate, self.client_burst)
+
+            if not bucket.try_acquire(now):
+                return self._reject(client_id, bucket.retry_after())
+            if not self._global.try_acquire(now):
+                bucket.refund()
+                return self._reject(client_id, self._global.retry_after())
+
+            self.allowed += 1
+            return True, 0.0
+
+    def _reject(self, client_id, retry_after):
+        self.throttled += 1
+        self._throttled[client_id] = self._throttled.get(client_id, 0) + 1
+        return False, retry_after
+
+    def remove(self, client_id):
+        """连接断开时释放其令牌桶"""
+        with self._lock:
+            self._buckets.pop(client_id, None)
+            self._throttled.pop(client_id, None)
+
+    def get_stats(self):
+        """获取限流统计"""
+        with self._lock:
+            return {
+                'client_rate': self.client_rate,
+                'client_burst': self.client_burst,
+                'global_rate': self._global.rate,
+                'allowed': self.allowed,
+                'throttled': self.throttled,
+                'throttled_by_client': dict(self._throttled)
+            }
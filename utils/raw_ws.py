@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+"""
+原生WebSocket扫码端点
+不经过Socket.IO/Engine.IO，握手后立即可用，适合对连接速度敏感的工位。
+
+帧格式（文本帧，首字符为消息类型）:
+    客户端 -> 服务器
+        H{json}                          注册（同client_info，可只含resume_token以恢复会话）
+        S<seq>\\t<barcode>\\t<ts_ms>\\t<interval>[\\t<trace_id>\\t<emit_ms>]   扫码
+        M{json}                          性能指标（同client_metrics）
+        P<任意文本>                       ping，服务器原样以O回复
+        C<t0>                            时钟同步ping（同clock_ping）
+        K<t0>\\t<t1>\\t<t2>\\t<t3>         时钟同步样本（同clock_sample）
+        T<trace_id>\\t<ack_ms>            扫码确认送达时间（同trace_ack）
+        I{json}                          盘点操作（同count_mode，{"action": "start"|"commit"|"discard"|"status"}）
+    服务器 -> 客户端
+        R{json}                          注册结果（同server_response，含resume_token）
+        A<seq>\\t{json}                   扫码确认（同scan_confirm）
+        F{json}                          流控（同flow_control）
+        O<任意文本>                       pong
+        C<t0>\\t<t1>\\t<t2>               时钟同步pong（同clock_pong）
+        I{json}                          盘点状态（同count_mode）
+"""
+
+import itertools
+import json
+import logging
+import threading
+
+from flask import Response, request
+
+from utils.protocol import now_ms
+
+logger = logging.getLogger(__name__)
+
+RAW_WS_PATH = '/ws/scan'
+
+
+def _dumps(data):
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':'))
+
+
+def parse_scan_frame(payload):
+    """
+    解析扫码帧（不含首字符S）
+
+    Returns:
+        tuple: (seq, 扫码消息dict)
+    """
+    parts = payload.split('\t')
+    seq = parts[0]
+    data = {'barcode': parts[1] if len(parts) > 1 else ''}
+    if len(parts) > 2 and parts[2]:
+        data['timestamp'] = int(parts[2])
+    if len(parts) > 3 and parts[3]:
+        data['interval'] = int(parts[3])
+    if len(parts) > 4 and parts[4]:
+        data['trace_id'] = parts[4]
+    if len(parts) > 5 and parts[5]:
+        data['emit_ts'] = int(parts[5])
+    return seq, data
+
+
+class _ClosedResponse(Response):
+    """连接关闭后阻止WSGI服务器继续写HTTP响应（与flask-sock的处理方式一致）"""
+
+    def __init__(self, mode):
+        super().__init__()
+        self.mode = mode
+
+    def __call__(self, *args, **kwargs):
+        if self.mode == 'werkzeug':
+            raise ConnectionError()
+        return []
+
+
+class RawScanEndpoint:
+    """
+    原生WebSocket扫码端点
+
+    Args:
+        server: BarcodeGunServer实例
+        path: 端点路径
+    """
+
+    def __init__(self, server, path=RAW_WS_PATH):
+        self.server = server
+        self.path = path
+        self._connections = {}
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+
+        try:
+            import simple_websocket
+            self._simple_websocket = simple_websocket
+        except ImportError as e:
+            logger.error(f"无法导入simple_websocket: {e}")
+            raise ImportError(
+                "原生WebSocket端点需要simple-websocket。请使用: pip install simple-websocket"
+            )
+
+        server.app.add_url_rule(path, 'raw_scan_ws', self._handle, websocket=True)
+
+    def _handle(self):
+        # 协议层ping，浏览器自动回复pong；一个间隔内无回应即断开
+        ws = self._simple_websocket.Server(request.environ, ping_interval=self.server.ping_interval or None)
+        sid = f"raw-{next(self._ids)}"
+        ip = request.remote_addr
+        send_lock = threading.Lock()
+
+        def send(frame):
+            with send_lock:
+                try:
+                    ws.send(frame)
+                except self._simple_websocket.ConnectionClosed:
+                    pass
+
+        with self._lock:
+            self._connections[sid] = send
+        self.server.sessions.open(sid, ip, 'raw', ws.close)
+        logger.info(f"原生WebSocket连接: {sid} (IP: {ip})")
+        capture = self.server.capture
+        if capture:
+            capture.record('connect', sid, {'ip': ip, 'transport': 'raw'})
+
+        try:
+            while True:
+                frame = ws.receive()
+                if frame is None:
+                    continue
+                if isinstance(frame, bytes):
+                    frame = frame.decode('utf-8', 'replace')
+                self._dispatch(sid, ip, frame, send)
+        except self._simple_websocket.ConnectionClosed:
+            pass
+        finally:
+            with self._lock:
+                self._connections.pop(sid, None)
+            self.server.rate_limiter.remove(sid)
+            self.server.sessions.remove(sid)
+            if capture:
+                capture.record('disconnect', sid)
+            logger.info(f"原生WebSocket断开: {sid}")
+        return _ClosedResponse(ws.mode)
+
+    def _dispatch(self, sid, ip, frame, send):
+        kind, payload = frame[:1], frame[1:]
+        server = self.server
+        server.sessions.touch(sid)
+
+        if kind == 'S':
+            try:
+                seq, data = parse_scan_frame(payload)
+            except ValueError:
+                logger.warning(f"无法解析扫码帧 (来自: {sid}): {payload!r}")
+                return
+            client_info = server.mobile_clients.get(sid) or {'sid': sid, 'ip': ip}
+            server._process_scan(sid, client_info, data,
+                                 lambda confirm: send(f"A{seq}\t{_dumps(confirm)}"))
+        elif kind == 'H':
+            try:
+                data = json.loads(payload or '{}')
+            except ValueError:
+                data = {}
+            if not isinstance(data, dict):
+                data = {}
+            data = dict(data, type='mobile_client')
+            session, resumed = server.sessions.register(sid, data, ip, 'raw', 'raw')
+            if session is None:
+                send('R' + _dumps({'status': 'resume_failed', 'message': '会话已过期'}))
+                return
+            server._capture_client_info(sid, data, session, resumed)
+            logger.info(f"手机端{'恢复' if resumed else '连接'}: {sid} (平台: {session.platform}, 原生WebSocket)")
+            send('R' + _dumps(server._registered_message(session, resumed)))
+            queue = server.injection_queue
+            if queue.flow_state != 'normal':
+                send('F' + _dumps(server._flow_control_message(queue.flow_state, queue.depth)))
+        elif kind == 'M':
+            try:
+                server._record_client_metrics(json.loads(payload), server.mobile_clients.get(sid, {}).get('device_id'))
+            except ValueError:
+                pass
+        elif kind == 'P':
+            send('O' + payload)
+        elif kind == 'C':
+            pong = server._clock_pong(payload, now_ms())
+            send(f"C{pong['t0']}\t{pong['t1']}\t{pong['t2']}")
+        elif kind == 'K':
+            server._record_clock_sample(sid, dict(zip(('t0', 't1', 't2', 't3'), payload.split('\t'))))
+        elif kind == 'T':
+            trace_id, _, ack_ts = payload.partition('\t')
+            try:
+                server._complete_trace(trace_id, int(ack_ts))
+            except ValueError:
+                pass
+        elif kind == 'I':
+            if sid not in server.mobile_clients:
+                return
+            try:
+                action = json.loads(payload or '{}').get('action')
+                response = server._handle_count_action(action)
+            except (ValueError, AttributeError) as e:
+                send('I' + _dumps(dict(server.inventory.state(), error=str(e))))
+                return
+            if action == 'status':
+                send('I' + _dumps(response['state']))
+        else:
+            logger.warning(f"未知的原生WebSocket帧 (来自: {sid}): {frame[:20]!r}")
+
+    def broadcast_flow_control(self, message):
+        """向所有原生WebSocket连接发送流控消息"""
+        self.broadcast('F' + _dumps(message))
+
+    def broadcast(self, frame):
+        """向所有原生WebSocket连接发送一帧"""
+        with self._lock:
+            senders = list(self._connections.values())
+        for send in senders:
+            send(frame)
+
+    @property
+    def connection_count(self):
+        return len(self._connections)
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+扫码历史导出
+以生成器方式流式输出CSV/NDJSON，可选实时gzip压缩，内存占用与导出行数无关。
+"""
+
+import csv
+import io
+import json
+import logging
+import sys
+import zlib
+from datetime import datetime
+
+from utils.scan_history import COLUMNS
+
+logger = logging.getLogger(__name__)
+
+EXPORT_FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson',
+}
+
+# 每次输出的最小字节数（合并小块，减少HTTP分块数量）
+FLUSH_BYTES = 64 * 1024
+
+
+def _format_row(row):
+    item = dict(zip(COLUMNS, row))
+    item['time'] = datetime.fromtimestamp(item['ts']).isoformat()
+    return item
+
+
+def iter_csv(rows):
+    """
+    将扫码记录转换为CSV文本块
+
+    Args:
+        rows: ScanHistory.iter_scans() 产生的行
+
+    Yields:
+        str: CSV文本块
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(COLUMNS + ('time',))
+    for row in rows:
+        writer.writerow(row + (datetime.fromtimestamp(row[1]).isoformat(),))
+        if buffer.tell() >= FLUSH_BYTES:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def iter_ndjson(rows):
+    """
+    将扫码记录转换为NDJSON文本块（每行一个JSON对象）
+
+    Yields:
+        str: NDJSON文本块
+    """
+    parts = []
+    size = 0
+    for row in rows:
+        line = json.dumps(_format_row(row), ensure_ascii=False, separators=(',', ':'))
+        parts.append(line)
+        size += len(line) + 1
+        if size >= FLUSH_BYTES:
+            yield '\n'.join(parts) + '\n'
+            parts = []
+            size = 0
+    if parts:
+        yield '\n'.join(parts) + '\n'
+
+
+def iter_gzip(chunks):
+    """
+    对文本块流做实时gzip压缩
+
+    Yields:
+        bytes: gzip数据块
+    """
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export_scans(history, fmt='csv', compress=False, **filters):
+    """
+    生成导出数据流
+
+    Args:
+        history: ScanHistory实例
+        fmt: 导出格式(csv/ndjson)
+        compress: 是否gzip压缩
+        **filters: 传给 ScanHistory.iter_scans 的过滤条件
+
+    Returns:
+        generator: 文本块（或compress=True时为gzip字节块）
+
+    Raises:
+        ValueError: 不支持的导出格式
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"不支持的导出格式: {fmt}")
+    rows = history.iter_scans(**filters)
+    chunks = iter_csv(rows) if fmt == 'csv' else iter_ndjson(rows)
+    return iter_gzip(chunks) if compress else chunks
+
+
+if __name__ == '__main__':
+    import argparse
+    import os
+
+    from utils.scan_history import ScanHistory, parse_time
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s'
+    )
+
+    parser = argparse.ArgumentParser(description='导出扫码历史')
+    parser.add_argument('--db', default=os.getenv('SCAN_HISTORY_DB', 'scan_history.db'), help='扫码历史数据库')
+    parser.add_argument('--format', choices=sorted(EXPORT_FORMATS), default='csv', help='导出格式')
+    parser.add_argument('--gzip', action='store_true', help='gzip压缩输出')
+    parser.add_argument('--since', help='开始时间（epoch秒或ISO格式）')
+    parser.add_argument('--until', help='结束时间（epoch秒或ISO格式）')
+    parser.add_argument('--station', help='工位名称')
+    parser.add_argument('--device', help='手机设备ID（按手机导出）')
+    parser.add_argument('--client', help='手机连接ID（每次重连都会变化）')
+    parser.add_argument('-o', '--output', help='输出文件，默认输出到标准输出')
+
+    args = parser.parse_args()
+
+    history = ScanHistory(args.db)
+    stream = export_scans(
+        history, args.format, args.gzip,
+        since=parse_time(args.since), until=parse_time(args.until),
+        station=args.station, client=args.client, device_id=args.device
+    )
+
+    out = open(args.output, 'wb') if args.output else sys.stdout.buffer
+    try:
+        for chunk in stream:
+            out.write(chunk if args.gzip else chunk.encode('utf-8'))
+    finally:
+        if args.output:
+            out.close()
+        history.close()
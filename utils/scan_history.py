@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+"""
+扫码历史存储
+基于SQLite(WAL模式)，由后台线程批量写入，扫码处理线程只负责入队，不会被阻塞。
+"""
+
+import logging
+import os
+import queue
+import socket
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# client为连接ID（每次重连都会变化），device_id为手机的固定标识，按手机查询时使用device_id
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS scans (
+    id INTEGER PRIMARY KEY,
+    ts REAL NOT NULL,
+    barcode TEXT NOT NULL,
+    client TEXT,
+    device_id TEXT,
+    platform TEXT,
+    ip TEXT,
+    station TEXT,
+    status TEXT NOT NULL,
+    message TEXT
+);
+"""
+
+INDEXES = """
+CREATE INDEX IF NOT EXISTS idx_scans_ts ON scans (ts);
+CREATE INDEX IF NOT EXISTS idx_scans_barcode ON scans (barcode, id);
+CREATE INDEX IF NOT EXISTS idx_scans_client ON scans (client, id);
+CREATE INDEX IF NOT EXISTS idx_scans_device ON scans (device_id, id);
+CREATE INDEX IF NOT EXISTS idx_scans_station ON scans (station, id);
+"""
+
+COLUMNS = ('id', 'ts', 'barcode', 'client', 'device_id', 'platform', 'ip', 'station', 'status', 'message')
+
+INSERT_SQL = (
+    "INSERT INTO scans (ts, barcode, client, device_id, platform, ip, station, status, message) "
+    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)"
+)
+
+MAX_PAGE_SIZE = 1000
+
+
+def parse_time(value):
+    """
+    解析时间参数，支持epoch秒或ISO格式字符串
+
+    Returns:
+        float: epoch秒，参数为空时返回None
+
+    Raises:
+        ValueError: 格式无法识别
+    """
+    if value in (None, ''):
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return datetime.fromisoformat(str(value).replace('Z', '+00:00')).timestamp()
+
+
+def build_filters(barcode=None, client=None, station=None, status=None, since=None, until=None,
+                  device_id=None):
+    """根据过滤条件生成WHERE子句和参数"""
+    clauses = []
+    params = []
+    for column, value in (('barcode', barcode), ('client', client), ('device_id', device_id),
+                          ('station', station), ('status', status)):
+        if value:
+            clauses.append(f"{column} = ?")
+            params.append(value)
+    if since is not None:
+        clauses.append("ts >= ?")
+        params.append(since)
+    if until is not None:
+        clauses.append("ts < ?")
+        params.append(until)
+    return clauses, params
+
+
+class ScanHistory:
+    """
+    扫码历史存储
+
+    Args:
+        db_path: SQLite数据库路径
+        station: 工位名称，默认为本机主机名
+        batch_size: 每个事务最多写入的记录数
+        flush_interval: 批量写入的最长等待时间（秒）
+        max_queue: 写入队列上限，超过时丢弃并计数（保证扫码不被阻塞）
+    """
+
+    def __init__(self, db_path, station=None, batch_size=500, flush_interval=0.5, max_queue=100000):
+        self.db_path = db_path
+        self.station = station or socket.gethostname()
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._stop_event = threading.Event()
+        self._local = threading.local()
+
+        self.written = 0
+        self.dropped = 0
+
+        conn = self._connect()
+        conn.executescript(SCHEMA)
+        # 旧版本创建的数据库没有device_id列
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(scans)")}
+        if 'device_id' not in columns:
+            conn.execute("ALTER TABLE scans ADD COLUMN device_id TEXT")
+        conn.executescript(INDEXES)
+        conn.commit()
+
+        self._writer = threading.Thread(target=self._writer_loop, name='ScanHistoryWriter', daemon=True)
+        self._writer.start()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=10)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        return conn
+
+    def _reader(self):
+        """每个查询线程使用独立的只读连接（WAL下读写互不阻塞）"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._connect()
+            conn.execute("PRAGMA query_only=ON")
+            self._local.conn = conn
+        return conn
+
+    def record(self, barcode, client_info=None, status='success', message=None, ts=None):
+        """
+        记录一次扫码（非阻塞入队）
+
+        Args:
+            barcode: 条码
+            client_info: 客户端信息dict（sid/device_id/platform/ip）
+            status: 处理状态
+            message: 附加信息
+            ts: 时间戳（epoch秒），默认当前时间
+
+        Returns:
+            bool: 是否成功入队
+        """
+        client_info = client_info or {}
+        row = (
+            ts if ts is not None else time.time(),
+            barcode,
+            client_info.get('sid'),
+            client_info.get('device_id'),
+            client_info.get('platform'),
+            client_info.get('ip'),
+            self.station,
+            status,
+            message
+        )
+        try:
+            self._queue.put_nowait(row)
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    def _writer_loop(self):
+        conn = self._connect()
+        while not (self._stop_event.is_set() and self._queue.empty()):
+            try:
+                batch = [self._queue.get(timeout=self.flush_interval)]
+            except queue.Empty:
+                continue
+
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            try:
+                with conn:
+                    conn.executemany(INSERT_SQL, batch)
+                self.written += len(batch)
+            except sqlite3.Error as e:
+                logger.error(f"写入扫码历史失败({len(batch)}条): {e}")
+        conn.close()
+
+    def query(self, limit=100, cursor=None, barcode=None, client=None, station=None,
+              status=None, since=None, until=None, device_id=None):
+        """
+        分页查询扫码历史（按id倒序，keyset分页）
+
+        Args:
+            limit: 每页条数（最多1000）
+            cursor: 上一页返回的next_cursor
+            barcode/client/device_id/station/status: 精确匹配过滤（按手机查询用device_id，client只对应一次连接）
+            since/until: 时间范围（epoch秒）
+
+        Returns:
+            dict: {'items': [...], 'next_cursor': int或None}
+        """
+        limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+        clauses, params = build_filters(barcode, client, station, status, since, until, device_id)
+        if cursor is not None:
+            clauses.append("id < ?")
+            params.append(int(cursor))
+
+        sql = f"SELECT {', '.join(COLUMNS)} FROM scans"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += " ORDER BY id DESC LIMIT ?"
+        params.append(limit)
+
+        rows = self._reader().execute(sql, params).fetchall()
+        items = [dict(zip(COLUMNS, row)) for row in rows]
+        next_cursor = items[-1]['id'] if len(items) == limit else None
+        return {'items': items, 'next_cursor': next_cursor}
+
+    def iter_scans(self, chunk_size=5000, barcode=None, client=None, station=None,
+                   status=None, since=None, until=None, device_id=None):
+        """
+        按id正序逐块遍历扫码历史（生成器，内存占用与总行数无关）
+
+        每块使用独立的短查询，不会长时间占用读事务。
+
+        Yields:
+            tuple: 按COLUMNS顺序的一行数据
+        """
+        clauses, params = build_filters(barcode, client, station, status, since, until, device_id)
+        clauses.append("id > ?")
+        sql = (f"SELECT {', '.join(COLUMNS)} FROM scans WHERE {' AND '.join(clauses)} "
+               f"ORDER BY id LIMIT ?")
+        conn = self._reader()
+        last_id = 0
+        if since is not None:
+            # 记录按时间顺序写入，先用ts索引定位起始id，避免从头扫描
+            first_id = conn.execute("SELECT MIN(id) FROM scans WHERE ts >= ?", (since,)).fetchone()[0]
+            if first_id is None:
+                return
+            last_id = first_id - 1
+        while True:
+            rows = conn.execute(sql, params + [last_id, chunk_size]).fetchall()
+            if not rows:
+                return
+            yield from rows
+            if len(rows) < chunk_size:
+                return
+            last_id = rows[-1][0]
+
+    def get_stats(self):
+        """获取写入统计"""
+        return {
+            'db_path': os.path.abspath(self.db_path),
+            'written': self.written,
+            'pending': self._queue.qsize(),
+            'dropped': self.dropped
+        }
+
+    def close(self, timeout=5):
+        """停止后台写入线程并写完队列中的记录"""
+        self._stop_event.set()
+        self._writer.join(timeout)
@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+"""
+最近扫码列表存储（PC客户端扫码表格的数据源）
+按列存储：时间、延迟、状态、手机各占一个array（每行约17字节），条码和说明为一个字符串。
+启用磁盘暂存时，只有最近 memory_rows 行的字符串保存在内存中，更早的按段（segment_rows行一个文件）
+写入临时目录，显示时按偏移量读取；总行数超过 max_rows 时整段丢弃最早的记录。
+
+行用递增序号（seq）标识，丢弃最早的记录后序号不变，界面据此定位行。
+"""
+
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+from array import array
+
+logger = logging.getLogger(__name__)
+
+# 状态编码（array('B')），未知状态归为other
+STATUSES = ('success', 'counted', 'duplicate', 'throttled', 'rejected', 'input_failed', 'other')
+_STATUS_CODES = {status: code for code, status in enumerate(STATUSES)}
+
+# 列：时间、手机、条码、状态、延迟、说明
+COLUMNS = ('time', 'device', 'barcode', 'status', 'latency_ms', 'message')
+
+
+def _clean(text):
+    # 行以\t分隔条码和说明、以\n结尾
+    return str(text).replace('\t', ' ').replace('\n', ' ').replace('\r', ' ')
+
+
+class _Segment:
+    """磁盘上的一段记录：每行 "条码\\t说明\\n"，offsets为各行起始位置"""
+
+    def __init__(self, path, texts):
+        self.path = path
+        self.offsets = array('I')
+        with open(path, 'wb') as f:
+            position = 0
+            for text in texts:
+                line = (text + '\n').encode('utf-8')
+                self.offsets.append(position)
+                position += len(line)
+                f.write(line)
+        self._file = open(path, 'rb')
+        self._lock = threading.Lock()
+
+    def read(self, index):
+        with self._lock:
+            self._file.seek(self.offsets[index])
+            return self._file.readline().decode('utf-8').rstrip('\n')
+
+    def read_all(self):
+        with self._lock:
+            self._file.seek(0)
+            return [line.decode('utf-8').rstrip('\n') for line in self._file]
+
+    def remove(self):
+        self._file.close()
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+
+class RecentScanStore:
+    """
+    最近扫码存储
+
+    Args:
+        max_rows: 最多保留的行数，超过时丢弃最早的 segment_rows 行
+        memory_rows: 启用磁盘暂存时内存中保留字符串的行数
+        spill: 是否把较早记录的字符串写入临时目录
+        segment_rows: 每个磁盘段（及每次丢弃）的行数
+    """
+
+    def __init__(self, max_rows=1000000, memory_rows=100000, spill=False, segment_rows=10000):
+        self.max_rows = max_rows
+        self.memory_rows = memory_rows
+        self.segment_rows = segment_rows
+        self.spill_dir = tempfile.mkdtemp(prefix='h5-recent-scans-') if spill else None
+        self._spilling = bool(spill)
+
+        self.base = 0                 # 最早一行的序号
+        self._ts = array('d')         # epoch秒
+        self._latency = array('f')    # 毫秒，未知为-1
+        self._status = array('B')
+        self._device = array('I')
+        self._devices = []
+        self._device_codes = {}
+        self._segments = []           # 磁盘段，按时间顺序
+        self._hot = []                # 内存中的 "条码\t说明"，对应最新的若干行
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._ts)
+
+    @property
+    def next_seq(self):
+        return self.base + len(self._ts)
+
+    def _device_code(self, name):
+        code = self._device_codes.get(name)
+        if code is None:
+            code = self._device_codes[name] = len(self._devices)
+            self._devices.append(name)
+        return code
+
+    def extend(self, records):
+        """
+        追加记录（不丢弃旧记录，丢弃由调用方通过 excess()/trim() 控制，便于界面同步行变化）
+
+        Args:
+            records: 扫码记录dict列表（ts为epoch毫秒，device_id/barcode/status/latency_ms/message）
+        """
+        with self._lock:
+            for record in records:
+                ts = record.get('ts')
+                self._ts.append(ts / 1000 if ts else time.time())
+                latency = record.get('latency_ms')
+                self._latency.append(-1 if latency is None else latency)
+                self._status.append(_STATUS_CODES.get(record.get('status'), _STATUS_CODES['other']))
+                self._device.append(self._device_code(str(record.get('device_id') or record.get('ip') or '')))
+                text = _clean(record.get('barcode') or '')
+                if record.get('message'):
+                    text += '\t' + _clean(record['message'])
+                self._hot.append(text)
+            if self._spilling:
+                while self._spilling and len(self._hot) >= self.memory_rows + self.segment_rows:
+                    self._spill()
+
+    def _spill(self):
+        texts = self._hot[:self.segment_rows]
+        path = os.path.join(self.spill_dir, f"{self.next_seq - len(self._hot):012d}.txt")
+        try:
+            self._segments.append(_Segment(path, texts))
+        except OSError as e:
+            # 磁盘写入失败时停止暂存，之后全部保存在内存中
+            logger.error(f"最近扫码暂存到磁盘失败，之后的记录全部保存在内存中: {e}")
+            self._spilling = False
+            return
+        del self._hot[:self.segment_rows]
+
+    def excess(self):
+        """超过max_rows时需要丢弃的行数（整段），否则为0"""
+        return self.segment_rows if len(self._ts) > self.max_rows else 0
+
+    def trim(self):
+        """丢弃最早的 excess() 行"""
+        with self._lock:
+            count = self.excess()
+            if not count:
+                return 0
+            if self._segments:
+                self._segments.pop(0).remove()
+            else:
+                del self._hot[:count]
+            for column in (self._ts, self._latency, self._status, self._device):
+                del column[:count]
+            self.base += count
+            return count
+
+    def _text(self, position):
+        hot_start = len(self._ts) - len(self._hot)
+        if position >= hot_start:
+            return self._hot[position - hot_start]
+        segment, index = divmod(position, self.segment_rows)
+        return self._segments[segment].read(index)
+
+    def row(self, seq):
+        """
+        按序号取一行
+
+        Returns:
+            tuple: (时间epoch秒, 手机, 条码, 状态, 延迟ms或None, 说明)
+        """
+        with self._lock:
+            position = seq - self.base
+            barcode, _, message = self._text(position).partition('\t')
+            latency = self._latency[position]
+            return (self._ts[position], self._devices[self._device[position]], barcode,
+                    STATUSES[self._status[position]], None if latency < 0 else latency, message)
+
+    def texts(self):
+        """所有行的 "条码\\t说明"（按时间顺序），排序和过滤条码时使用"""
+        with self._lock:
+            texts = []
+            for segment in self._segments:
+                texts.extend(segment.read_all())
+            texts.extend(self._hot)
+            return texts
+
+    def sort_keys(self, column):
+        """
+        某列的排序键（按时间顺序，与行位置对应）
+
+        Args:
+            column: COLUMNS中的列名
+        """
+        with self._lock:
+            if column == 'time':
+                return self._ts
+            if column == 'latency_ms':
+                return self._latency
+            if column == 'status':
+                return [STATUSES[code] for code in self._status]
+            if column == 'device':
+                devices = self._devices
+                return [devices[code] for code in self._device]
+            index = 0 if column == 'barcode' else 1
+            return [(text.split('\t') + [''])[index] for text in self.texts()]
+
+    def filter(self, text=None, status=None):
+        """
+        符合条件的行的序号（按时间顺序）
+
+        Args:
+            text: 条码、说明或手机包含该文字（不区分大小写）
+            status: 状态名
+        """
+        with self._lock:
+            text = (text or '').lower()
+            code = _STATUS_CODES.get(status) if status else None
+            devices = [name.lower() for name in self._devices] if text else None
+            texts = self.texts() if text else None
+            result = array('Q')
+            for position in range(len(self._ts)):
+                if code is not None and self._status[position] != code:
+                    continue
+                if text and text not in texts[position].lower() \
+                        and text not in devices[self._device[position]]:
+                    continue
+                result.append(self.base + position)
+            return result
+
+    def matches(self, seq, text=None, status=None):
+        """单行是否符合过滤条件（新记录增量过滤时使用）"""
+        _, device, barcode, row_status, _, message = self.row(seq)
+        if status and row_status != status:
+            return False
+        text = (text or '').lower()
+        return not text or text in barcode.lower() or text in message.lower() or text in device.lower()
+
+    def close(self):
+        """删除磁盘暂存文件"""
+        with self._lock:
+            for segment in self._segments:
+                segment.remove()
+            self._segments = []
+            self._spilling = False
+            if self.spill_dir:
+                shutil.rmtree(self.spill_dir, ignore_errors=True)
+                self.spill_dir = None
@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+"""
+手机端会话登记
+每个连接（Socket.IO或原生WebSocket）一条紧凑记录，由后台线程定期清理：
+- 连接后 SESSION_REGISTER_TIMEOUT 秒内未发送client_info的连接被主动断开（扫描器、异常页面等）
+- 已注册的会话断开后保留 SESSION_RESUME_TTL 秒，手机重连时凭resume_token直接恢复
+  设备信息和协商好的编码，不需要重新协商
+- 旧连接还未被心跳判定断开时（如手机切换Wi-Fi），凭token重连会立即接管并关闭旧连接，
+  连接数不会重复计算
+
+失联检测由传输层心跳完成（Engine.IO ping/pong，原生WebSocket协议层ping），
+间隔和超时由 PING_INTERVAL / PING_TIMEOUT 配置。
+"""
+
+import logging
+import secrets
+import threading
+import time
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# 后台清理间隔（秒）
+REAP_INTERVAL = 1.0
+
+
+class Session:
+    """
+    一个连接的会话记录
+
+    支持 get(key, default)，可直接作为扫码处理流程中的client_info使用。
+    """
+
+    __slots__ = ('sid', 'type', 'platform', 'version', 'device_id', 'ip', 'encoding', 'transport',
+                 'connect_time', 'opened', 'last_seen', 'registered', 'resume_token', 'messages',
+                 'resumes', 'closer')
+
+    def __init__(self, sid, ip, transport, closer=None):
+        self.sid = sid
+        self.type = None
+        self.platform = 'unknown'
+        self.version = 'unknown'
+        self.device_id = ip
+        self.ip = ip
+        self.encoding = None
+        self.transport = transport
+        self.connect_time = datetime.now().isoformat()
+        self.opened = self.last_seen = time.monotonic()
+        self.registered = False
+        self.resume_token = None
+        self.messages = 0
+        self.resumes = 0
+        self.closer = closer
+
+    def get(self, key, default=None):
+        value = getattr(self, key, None) if key in self.__slots__ else None
+        return default if value is None else value
+
+    def to_dict(self, now=None):
+        now = now or time.monotonic()
+        return {
+            'sid': self.sid,
+            'device_id': self.device_id,
+            'platform': self.platform,
+            'ip': self.ip,
+            'transport': self.transport,
+            'encoding': self.encoding,
+            'connect_time': self.connect_time,
+            'idle_s': round(now - self.last_seen, 1),
+            'messages': self.messages,
+            'resumes': self.resumes
+        }
+
+
+class SessionRegistry:
+    """
+    会话登记表
+
+    Args:
+        register_timeout: 连接后必须在该时间内注册（秒），0表示不清理
+        resume_ttl: 断开后可凭token恢复的时间（秒），0表示不支持恢复
+    """
+
+    def __init__(self, register_timeout=10.0, resume_ttl=300.0):
+        self.register_timeout = register_timeout
+        self.resume_ttl = resume_ttl
+        # 已注册的会话 sid -> Session（即 server.mobile_clients）
+        self.clients = {}
+        self._pending = {}
+        self._parked = {}      # resume_token -> (断开时间, Session)
+        self._tokens = {}      # resume_token -> 在线的Session
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+
+        self.reaped = 0
+        self.resumed = 0
+        self.takeovers = 0
+        self.resume_failed = 0
+
+        self._reaper = threading.Thread(target=self._reap_loop, name='SessionReaper', daemon=True)
+        self._reaper.start()
+
+    def open(self, sid, ip, transport, closer=None):
+        """
+        新连接
+
+        Args:
+            closer: 主动断开该连接的函数，清理未注册连接和接管旧连接时调用
+        """
+        with self._lock:
+            self._pending[sid] = Session(sid, ip, transport, closer)
+
+    def register(self, sid, info, ip=None, transport=None, encoding=None):
+        """
+        注册（client_info）
+
+        Args:
+            info: 客户端信息，含 resume_token 时尝试恢复之前的会话
+            encoding: 本次协商的编码；恢复成功时沿用之前的编码
+
+        Returns:
+            tuple: (Session, 是否恢复了之前的会话)，token无效时Session为None
+        """
+        token = info.get('resume_token')
+        replaced = None
+        with self._lock:
+            session = self._pending.pop(sid, None) or self.clients.pop(sid, None)
+            if session is not None and session.registered and token and token not in self._tokens \
+                    and token not in self._parked:
+                # 已注册的连接发送了无效token：保持原注册
+                self.clients[sid] = session
+                self.resume_failed += 1
+                return None, False
+            if session is None:
+                # 未经过open的连接（如旧进程移交过来的连接）
+                session = Session(sid, ip, transport)
+            if token:
+                parked = self._parked.pop(token, None)
+                previous = parked[1] if parked else self._tokens.get(token)
+                if previous is None:
+                    self.resume_failed += 1
+                    self._pending[sid] = session
+                    return None, False
+                if previous.sid in self.clients:
+                    # 旧连接尚未被心跳判定断开：由新连接接管
+                    del self.clients[previous.sid]
+                    replaced = previous.closer
+                    self.takeovers += 1
+                self._tokens.pop(token, None)
+                previous.sid = session.sid
+                previous.ip = session.ip
+                previous.transport = session.transport
+                previous.closer = session.closer
+                previous.resumes += 1
+                session = previous
+                self.resumed += 1
+            else:
+                if self._tokens.get(session.resume_token) is session:
+                    del self._tokens[session.resume_token]
+                session.type = info.get('type')
+                session.platform = info.get('platform', 'unknown')
+                session.version = info.get('version', 'unknown')
+                session.device_id = str(info.get('device_id') or session.ip)[:64]
+                session.encoding = encoding
+            session.registered = True
+            session.last_seen = time.monotonic()
+            session.resume_token = secrets.token_urlsafe(16) if self.resume_ttl > 0 else None
+            if session.resume_token:
+                self._tokens[session.resume_token] = session
+            self.clients[sid] = session
+
+        if replaced:
+            logger.info(f"手机端重连，关闭旧连接: {session.device_id}")
+            self._close(replaced)
+        return session, bool(token)
+
+    def touch(self, sid):
+        """收到该连接的消息"""
+        session = self.clients.get(sid)
+        if session is not None:
+            session.last_seen = time.monotonic()
+            session.messages += 1
+
+    def remove(self, sid):
+        """
+        连接断开
+
+        Returns:
+            Session: 已注册的会话，未注册时返回None
+        """
+        with self._lock:
+            self._pending.pop(sid, None)
+            session = self.clients.pop(sid, None)
+            if session is None:
+                return None
+            session.closer = None
+            token = session.resume_token
+            if token and self._tokens.get(token) is session:
+                del self._tokens[token]
+                self._parked[token] = (time.monotonic(), session)
+        return session
+
+    def _close(self, closer):
+        try:
+            closer()
+        except Exception as e:
+            logger.debug(f"关闭连接失败: {e}")
+
+    def reap(self):
+        """断开超时未注册的连接，清除过期的可恢复会话"""
+        now = time.monotonic()
+        closers = []
+        with self._lock:
+            if self.register_timeout > 0:
+                for sid, session in list(self._pending.items()):
+                    if now - session.opened > self.register_timeout:
+                        del self._pending[sid]
+                        self.reaped += 1
+                        logger.info(f"连接 {sid} 在 {self.register_timeout:g}s 内未注册，已断开 (IP: {session.ip})")
+                        if session.closer:
+                            closers.append(session.closer)
+            for token, (closed, _) in list(self._parked.items()):
+                if now - closed > self.resume_ttl:
+                    del self._parked[token]
+        for closer in closers:
+            self._close(closer)
+
+    def _reap_loop(self):
+        while not self._stop_event.wait(REAP_INTERVAL):
+            try:
+                self.reap()
+            except Exception as e:
+                logger.error(f"清理会话失败: {e}")
+
+    def clear(self):
+        with self._lock:
+            self.clients.clear()
+            self._pending.clear()
+            self._parked.clear()
+            self._tokens.clear()
+
+    @property
+    def connection_count(self):
+        """当前连接数（含未注册的连接）"""
+        return len(self.clients) + len(self._pending)
+
+    def get_stats(self):
+        now = time.monotonic()
+        return {
+            'registered': len(self.clients),
+            'pending': len(self._pending),
+            'resumable': len(self._parked),
+            'reaped': self.reaped,
+            'resumed': self.resumed,
+            'takeovers': self.takeovers,
+            'resume_failed': self.resume_failed,
+            'clients': [session.to_dict(now) for session in list(self.clients.values())]
+        }
+
+    def close(self):
+        """停止后台清理线程"""
+        self._stop_event.set()
@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+"""
+扫码全链路追踪
+每次扫码携带trace_id，记录 解码 -> 发送 -> 服务器接收 -> 输入开始/结束 -> 确认 各时间点。
+手机与PC的时钟偏差通过ping交换估算（取最近样本中往返时间最短的一次），
+使手机到PC的延迟可以直接相减得到。
+"""
+
+import collections
+import logging
+import math
+import threading
+
+logger = logging.getLogger(__name__)
+
+# 每台设备保留的延迟样本数
+LATENCY_WINDOW = 1000
+
+# 用于估算时钟偏差的最近ping样本数
+CLOCK_SAMPLES = 16
+
+# 等待确认的追踪上限，以及未确认追踪的过期时间（毫秒）
+MAX_ACTIVE_TRACES = 10000
+TRACE_EXPIRE_MS = 60000
+
+# 保留时钟状态和延迟统计的设备数上限（HTTP提交的工位等也按设备计），超过时淘汰最久未使用的设备
+MAX_DEVICES = 256
+
+
+class ClockSync:
+    """
+    单个设备的时钟偏差估算
+
+    offset = 手机时钟 - PC时钟（毫秒）
+    """
+
+    __slots__ = ('samples', 'offset', 'rtt')
+
+    def __init__(self):
+        self.samples = collections.deque(maxlen=CLOCK_SAMPLES)
+        self.offset = None
+        self.rtt = None
+
+    def add_sample(self, t0, t1, t2, t3):
+        """
+        添加一次ping交换样本
+
+        Args:
+            t0: 手机发送ping时间（手机时钟）
+            t1: 服务器收到ping时间（PC时钟）
+            t2: 服务器发送pong时间（PC时钟）
+            t3: 手机收到pong时间（手机时钟）
+        """
+        # NaN一旦进入样本会一直是min()的结果，非有限值直接丢弃
+        if not all(math.isfinite(t) for t in (t0, t1, t2, t3)):
+            return
+        rtt = (t3 - t0) - (t2 - t1)
+        if rtt < 0:
+            return
+        offset = ((t0 - t1) + (t3 - t2)) / 2
+        self.samples.append((rtt, offset))
+        # 往返时间最短的样本受网络排队影响最小，偏差估算最准确
+        self.rtt, self.offset = min(self.samples)
+
+
+class ScanTrace:
+    """一次扫码的追踪记录（时间均为PC时钟的epoch毫秒）"""
+
+    __slots__ = ('trace_id', 'device', 'sid', 'barcode', 'clock_offset',
+                 'decode', 'emit', 'receive', 'inject_start', 'inject_end', 'ack')
+
+    def __init__(self, trace_id, device, sid, barcode, clock_offset):
+        self.trace_id = trace_id
+        self.device = device
+        self.sid = sid
+        self.barcode = barcode
+        self.clock_offset = clock_offset
+        self.decode = None
+        self.emit = None
+        self.receive = None
+        self.inject_start = None
+        self.inject_end = None
+        self.ack = None
+
+    def to_server_clock(self, phone_ms):
+        if phone_ms is None:
+            return None
+        return phone_ms - (self.clock_offset or 0)
+
+    def stages(self):
+        """各阶段耗时（毫秒）"""
+        def diff(a, b):
+            return round(b - a, 1) if a is not None and b is not None else None
+        return {
+            'decode_to_emit': diff(self.decode, self.emit),
+            'network_in': diff(self.emit, self.receive),
+            'queue_wait': diff(self.receive, self.inject_start),
+            'inject': diff(self.inject_start, self.inject_end),
+            'ack_return': diff(self.inject_end, self.ack),
+            'phone_to_pc': diff(self.decode, self.inject_end),
+            'total': diff(self.decode, self.ack)
+        }
+
+    def to_dict(self):
+        return {
+            'trace_id': self.trace_id,
+            'device': self.device,
+            'sid': self.sid,
+            'barcode': self.barcode,
+            'clock_offset_ms': round(self.clock_offset, 1) if self.clock_offset is not None else None,
+            'timestamps': {
+                'decode': self.decode,
+                'emit': self.emit,
+                'receive': self.receive,
+                'inject_start': self.inject_start,
+                'inject_end': self.inject_end,
+                'ack': self.ack
+            },
+            'stages': self.stages()
+        }
+
+
+class ScanTracer:
+    """
+    扫码追踪器
+
+    Args:
+        slow_threshold_ms: 总耗时超过该值的追踪记入慢追踪列表
+        max_slow: 慢追踪列表上限
+    """
+
+    def __init__(self, slow_threshold_ms=300, max_slow=200):
+        self.slow_threshold_ms = slow_threshold_ms
+        self._clocks = collections.OrderedDict()
+        self._active = collections.OrderedDict()
+        self._latency = collections.OrderedDict()
+        self._slow = collections.deque(maxlen=max_slow)
+        self._lock = threading.Lock()
+        self.completed = 0
+
+    def clock(self, device):
+        """获取设备的时钟同步状态"""
+        clock = self._clocks.get(device)
+        if clock is None:
+            clock = self._clocks[device] = ClockSync()
+            if len(self._clocks) > MAX_DEVICES:
+                self._clocks.popitem(last=False)
+        else:
+            self._clocks.move_to_end(device)
+        return clock
+
+    def add_clock_sample(self, device, t0, t1, t2, t3):
+        """记录一次ping交换"""
+        with self._lock:
+            self.clock(device).add_sample(t0, t1, t2, t3)
+
+    def begin(self, trace_id, device, sid, barcode, decode_ms, emit_ms, receive_ms):
+        """
+        开始追踪一次扫码
+
+        Args:
+            trace_id: 手机端生成的追踪ID
+            device: 设备标识
+            sid: 连接ID
+            barcode: 条码
+            decode_ms/emit_ms: 手机时钟的解码/发送时间
+            receive_ms: 服务器收到的时间
+
+        Returns:
+            ScanTrace
+        """
+        with self._lock:
+            offset = self.clock(device).offset
+            trace = ScanTrace(trace_id, device, sid, barcode, offset)
+            trace.decode = trace.to_server_clock(decode_ms)
+            trace.emit = trace.to_server_clock(emit_ms)
+            trace.receive = receive_ms
+
+            self._active[trace_id] = trace
+            # 清理过期或超量的未确认追踪
+            expire_before = receive_ms - TRACE_EXPIRE_MS
+            while self._active:
+                oldest = next(iter(self._active.values()))
+                if len(self._active) <= MAX_ACTIVE_TRACES and oldest.receive >= expire_before:
+                    break
+                self._active.popitem(last=False)
+        return trace
+
+    def discard(self, trace_id):
+        """扫码未进入输入队列时丢弃追踪"""
+        with self._lock:
+            self._active.pop(trace_id, None)
+
+    def complete(self, trace_id, ack_phone_ms):
+        """
+        手机端确认收到后结束追踪
+
+        Returns:
+            ScanTrace: 完成的追踪，未找到时返回None
+        """
+        with self._lock:
+            trace = self._active.pop(trace_id, None)
+            if trace is None:
+                return None
+            trace.ack = trace.to_server_clock(ack_phone_ms)
+            stages = trace.stages()
+
+            latency = self._latency.get(trace.device)
+            if latency is None:
+                latency = self._latency[trace.device] = {
+                    'total': collections.deque(maxlen=LATENCY_WINDOW),
+                    'phone_to_pc': collections.deque(maxlen=LATENCY_WINDOW)
+                }
+                if len(self._latency) > MAX_DEVICES:
+                    self._latency.popitem(last=False)
+            else:
+                self._latency.move_to_end(trace.device)
+            for name in ('total', 'phone_to_pc'):
+                if stages[name] is not None:
+                    latency[name].append(stages[name])
+
+            if stages['total'] is not None and stages['total'] >= self.slow_threshold_ms:
+                self._slow.append(trace)
+            self.completed += 1
+        return trace
+
+    def get_slow_traces(self, limit=50):
+        """最近的慢追踪（新的在前）"""
+        with self._lock:
+            traces = list(self._slow)[-limit:]
+        return [trace.to_dict() for trace in reversed(traces)]
+
+    def get_latency_stats(self):
+        """按设备汇总的延迟分布（毫秒）"""
+        def summarize(values):
+            ordered = sorted(values)
+            if not ordered:
+                return None
+            return {
+                'count': len(ordered),
+                'p50': ordered[len(ordered) // 2],
+                'p90': ordered[min(len(ordered) - 1, int(len(ordered) * 0.9))],
+                'p99': ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))],
+                'max': ordered[-1]
+            }
+
+        with self._lock:
+            snapshot = {device: {name: list(values) for name, values in latency.items()}
+                        for device, latency in self._latency.items()}
+            clocks = {device: (clock.offset, clock.rtt) for device, clock in self._clocks.items()}
+
+        result = {}
+        for device, latency in snapshot.items():
+            offset, rtt = clocks.get(device, (None, None))
+            result[device] = {
+                'clock_offset_ms': round(offset, 1) if offset is not None else None,
+                'clock_rtt_ms': round(rtt, 1) if rtt is not None else None,
+                'total': summarize(latency['total']),
+                'phone_to_pc': summarize(latency['phone_to_pc'])
+            }
+        return result
+
+    def get_stats(self):
+        return {
+            'active': len(self._active),
+            'completed': self.completed,
+            'slow': len(self._slow),
+            'slow_threshold_ms': self.slow_threshold_ms
+        }
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+扫码流量录制
+把服务器收到的事件流（连接、client_info、扫码、断开）以及发出的扫码确认按到达顺序写入NDJSON文件，
+供 utils.traffic_replay 按原始节奏重放，复现现场问题。
+
+每行一个事件:
+    {"t": 相对录制开始的毫秒, "ts": epoch毫秒, "event": "connect|client_info|scan|confirm|disconnect",
+     "sid": 连接ID, "seq": 扫码序号（scan/confirm）, "data": {...}}
+
+录制只入队，由后台线程批量写文件，不阻塞扫码处理；队列满时丢弃并计数。
+"""
+
+import json
+import logging
+import queue
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+CAPTURE_VERSION = 1
+
+
+def load_capture(path):
+    """
+    读取录制文件
+
+    Returns:
+        list: 事件dict列表（按录制顺序，不含文件头）
+    """
+    events = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            event = json.loads(line)
+            if event.get('event') == 'capture_start':
+                continue
+            events.append(event)
+    return events
+
+
+class TrafficRecorder:
+    """
+    流量录制器
+
+    Args:
+        path: 录制文件路径（追加写入）
+        flush_interval: 批量写入的最长等待时间（秒）
+        max_queue: 写入队列上限，超过时丢弃并计数
+    """
+
+    def __init__(self, path, flush_interval=0.2, max_queue=100000):
+        self.path = path
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._stop_event = threading.Event()
+        self._seq = 0
+        self._seq_lock = threading.Lock()
+        self._start = time.perf_counter()
+
+        self.recorded = 0
+        self.dropped = 0
+
+        self._file = open(path, 'a', encoding='utf-8')
+        self._file.write(json.dumps({
+            'event': 'capture_start',
+            'ts': int(time.time() * 1000),
+            'version': CAPTURE_VERSION
+        }) + '\n')
+        self._file.flush()
+
+        self._writer = threading.Thread(target=self._writer_loop, name='TrafficRecorder', daemon=True)
+        self._writer.start()
+        logger.info(f"流量录制已启用: {path}")
+
+    def next_seq(self):
+        """分配扫码序号，用于关联扫码和确认"""
+        with self._seq_lock:
+            self._seq += 1
+            return self._seq
+
+    def record(self, event, sid, data=None, seq=None):
+        """
+        记录一个事件（非阻塞入队）
+
+        Returns:
+            bool: 是否成功入队
+        """
+        item = {
+            't': round((time.perf_counter() - self._start) * 1000, 3),
+            'ts': int(time.time() * 1000),
+            'event': event,
+            'sid': sid
+        }
+        if seq is not None:
+            item['seq'] = seq
+        if data is not None:
+            item['data'] = data
+        try:
+            self._queue.put_nowait(item)
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    def _writer_loop(self):
+        while not (self._stop_event.is_set() and self._queue.empty()):
+            try:
+                batch = [self._queue.get(timeout=self.flush_interval)]
+            except queue.Empty:
+                continue
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._file.write(''.join(json.dumps(item, ensure_ascii=False, default=str) + '\n'
+                                         for item in batch))
+                self._file.flush()
+                self.recorded += len(batch)
+            except (OSError, TypeError, ValueError) as e:
+                logger.error(f"写入流量录制失败({len(batch)}条): {e}")
+        self._file.close()
+
+    def get_stats(self):
+        return {
+            'path': self.path,
+            'recorded': self.recorded,
+            'pending': self._queue.qsize(),
+            'dropped': self.dropped
+        }
+
+    def close(self, timeout=5):
+        """停止后台写入线程并写完队列中的事件"""
+        self._stop_event.set()
+        self._writer.join(timeout)
@@ -0,0 +1,383 @@
+#!/usr/bin/env python3
+"""
+扫码流量重放
+按录制文件（TRAFFIC_CAPTURE_FILE）中的时间间隔，把连接、client_info、扫码、断开事件重新发送到服务器，
+并与原始运行对比：
+    - 处理结果：同一扫码的确认状态是否一致（如原来成功、重放时被限流或判为重复）
+    - 延迟：扫码到确认的耗时是否明显偏离原始值
+    - 顺序：键盘输入的条码顺序是否与原始运行一致
+
+默认在本进程内启动一个本地服务器，键盘输入替换为recording后端（不产生真实按键），
+重放后直接读取实际输入顺序；也可用 --url 指向已运行的服务器（此时按成功确认的顺序比较）。
+
+用法:
+    python -m utils.traffic_replay capture.ndjson                # 原速
+    python -m utils.traffic_replay capture.ndjson --speed 10     # 10倍速
+    python -m utils.traffic_replay capture.ndjson --speed 0      # 最快速度
+"""
+
+import collections
+import json
+import logging
+import os
+import queue
+import socket
+import sys
+import threading
+import time
+
+from utils.traffic_capture import load_capture
+
+logger = logging.getLogger(__name__)
+
+# 重放时发送的入站事件
+INBOUND_EVENTS = ('connect', 'client_info', 'scan', 'disconnect')
+
+# 等待手机端注册响应的时间（秒）
+REGISTER_TIMEOUT = 2.0
+
+
+def _percentile(values, p):
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, int(len(ordered) * p))], 1) if ordered else None
+
+
+def original_run(events):
+    """
+    从录制事件中整理原始运行的每次扫码
+
+    Returns:
+        tuple: (按seq的扫码dict, 成功输入的条码顺序)
+    """
+    scans = collections.OrderedDict()
+    for event in events:
+        seq = event.get('seq')
+        if event['event'] == 'scan':
+            scans[seq] = {
+                'seq': seq,
+                'sid': event['sid'],
+                'barcode': (event.get('data') or {}).get('barcode'),
+                't': event['t'],
+                'status': None,
+                'confirm_barcode': None,
+                'latency_ms': None
+            }
+        elif event['event'] == 'confirm' and seq in scans:
+            scan = scans[seq]
+            confirm = event.get('data') or {}
+            scan['status'] = confirm.get('status')
+            scan['confirm_barcode'] = confirm.get('barcode')
+            scan['latency_ms'] = round(event['t'] - scan['t'], 3)
+            scan['confirm_t'] = event['t']
+
+    injected = sorted((scan for scan in scans.values() if scan['status'] == 'success'),
+                      key=lambda scan: scan['confirm_t'])
+    return scans, [scan['confirm_barcode'] for scan in injected]
+
+
+class _ReplayConnection:
+    """重放中的一个连接（对应录制中的一个sid）"""
+
+    def __init__(self, sid, url, confirms):
+        import socketio
+
+        self.sid = sid
+        self.url = url
+        self.registered = threading.Event()
+        self.pending = []     # 已发送、尚未收到确认的扫码seq
+        self.client = socketio.Client(ssl_verify=False, reconnection=False)
+
+        @self.client.on('server_response')
+        def on_response(data):
+            if isinstance(data, dict) and data.get('status') == 'registered':
+                self.registered.set()
+
+        @self.client.on('scan_confirm')
+        def on_confirm(data):
+            confirms.put((time.perf_counter(), self, data))
+
+    def connect(self):
+        if not self.client.connected:
+            self.client.connect(self.url, transports=['websocket'])
+
+    def disconnect(self):
+        if self.client.connected:
+            self.client.disconnect()
+
+
+class TrafficReplayer:
+    """
+    流量重放器
+
+    Args:
+        url: 服务器地址
+        speed: 重放速度倍数，0表示不等待、尽快发送
+        sink: 本地服务器的recording后端（用于读取实际输入顺序），远程服务器为None
+    """
+
+    def __init__(self, url, speed=1.0, sink=None):
+        self.url = url
+        self.speed = speed
+        self.sink = sink
+        self._confirms = queue.Queue()
+        self._connections = {}
+
+    def _connection(self, sid, register=True):
+        """获取连接；录制中缺少connect/client_info的连接（如HTTP提交）按需建立并注册"""
+        conn = self._connections.get(sid)
+        if conn is None:
+            conn = self._connections[sid] = _ReplayConnection(sid, self.url, self._confirms)
+        if not conn.client.connected:
+            conn.connect()
+        if register and not conn.registered.is_set():
+            self._register(conn, {'type': 'mobile_client', 'platform': 'replay', 'device_id': sid})
+        return conn
+
+    def _register(self, conn, client_info):
+        # 去掉录制中的encodings，按JSON协商：重放发送和接收的都是已解码的消息
+        client_info = {key: value for key, value in client_info.items() if key != 'encodings'}
+        conn.registered.clear()
+        conn.client.emit('client_info', client_info)
+        if client_info.get('type') == 'mobile_client':
+            # 服务器按事件并发处理，等待注册完成后再发送扫码，与手机页面行为一致
+            conn.registered.wait(REGISTER_TIMEOUT)
+
+    def replay(self, events):
+        """
+        重放事件并收集确认
+
+        Returns:
+            dict: seq -> {'status', 'barcode', 'latency_ms'}
+        """
+        inbound = [event for event in events if event['event'] in INBOUND_EVENTS]
+        if not inbound:
+            return {}
+        expected = {}
+        sent = {}
+        results = {}
+        origin = inbound[0]['t']
+        start = time.perf_counter()
+
+        for event in inbound:
+            if self.speed > 0:
+                delay = start + (event['t'] - origin) / 1000 / self.speed - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            self._collect(sent, expected, results)
+
+            sid, kind = event['sid'], event['event']
+            try:
+                if kind == 'connect':
+                    self._connection(sid, register=False)
+                elif kind == 'client_info':
+                    self._register(self._connection(sid, register=False), event.get('data') or {})
+                elif kind == 'scan':
+                    conn = self._connection(sid)
+                    seq = event['seq']
+                    data = dict(event.get('data') or {})
+                    # 原始的追踪ID和手机端时间戳不再发送；用重放追踪ID对应确认（服务器在每个确认中回传）
+                    data.pop('emit_ts', None)
+                    data['trace_id'] = f"replay-{seq}"
+                    conn.pending.append(seq)
+                    expected[seq] = (data.get('barcode'), event.get('confirm_barcode'))
+                    sent[seq] = time.perf_counter()
+                    conn.client.emit('scan_result', data)
+                elif kind == 'disconnect':
+                    conn = self._connections.get(sid)
+                    if conn is not None:
+                        # 加速重放时断开可能早于确认到达，先收完该连接的确认
+                        deadline = time.monotonic() + 5.0
+                        while conn.pending and time.monotonic() < deadline:
+                            self._collect(sent, expected, results, timeout=0.1)
+                        conn.disconnect()
+            except Exception as e:
+                logger.warning(f"重放事件失败 ({kind}, {sid}): {e}")
+
+        # 等待剩余确认（键盘输入队列可能仍在处理）
+        deadline = time.monotonic() + max(10.0, len(sent) * 0.05)
+        while len(results) < len(sent) and time.monotonic() < deadline:
+            self._collect(sent, expected, results, timeout=0.2)
+
+        for conn in self._connections.values():
+            conn.disconnect()
+        return results
+
+    def _collect(self, sent, expected, results, timeout=0):
+        while True:
+            try:
+                received, conn, confirm = self._confirms.get(timeout=timeout)
+            except queue.Empty:
+                return
+            timeout = 0
+            if not conn.pending:
+                continue
+            # 同一连接的确认可能乱序（重复/限流立即回复，成功在输入完成后回复），按回传的追踪ID对应；
+            # 服务器未回传时按条码匹配最早的待确认扫码
+            barcode = confirm.get('barcode')
+            trace_id = str(confirm.get('trace_id') or '')
+            seq = int(trace_id[7:]) if trace_id.startswith('replay-') and trace_id[7:].isdigit() else None
+            if seq not in conn.pending:
+                seq = next((s for s in conn.pending if barcode in expected[s]), conn.pending[0])
+            conn.pending.remove(seq)
+            results[seq] = {
+                'status': confirm.get('status'),
+                'barcode': barcode,
+                'latency_ms': round((received - sent[seq]) * 1000, 3),
+                'received': received
+            }
+
+
+def compare_runs(original, replayed, original_order, replay_order, latency_tolerance_ms=50.0,
+                 latency_ratio=2.0, limit=50):
+    """
+    对比原始运行和重放结果
+
+    Args:
+        latency_tolerance_ms / latency_ratio: 重放延迟超过 max(原始*比例, 原始+容差) 或明显更快时视为偏离
+
+    Returns:
+        dict: 报告
+    """
+    status_diffs = []
+    latency_diffs = []
+    for seq, scan in original.items():
+        result = replayed.get(seq)
+        replay_status = result['status'] if result else 'missing'
+        if replay_status != scan['status']:
+            status_diffs.append({'seq': seq, 'sid': scan['sid'], 'barcode': scan['barcode'],
+                                 'original': scan['status'], 'replay': replay_status})
+        if result and scan['latency_ms'] is not None:
+            before, after = scan['latency_ms'], result['latency_ms']
+            upper = max(before * latency_ratio, before + latency_tolerance_ms)
+            lower = min(before / latency_ratio, before - latency_tolerance_ms)
+            if after > upper or after < lower:
+                latency_diffs.append({'seq': seq, 'barcode': scan['barcode'],
+                                      'original_ms': before, 'replay_ms': after})
+
+    first_divergence = None
+    for index in range(max(len(original_order), len(replay_order))):
+        expected = original_order[index] if index < len(original_order) else None
+        actual = replay_order[index] if index < len(replay_order) else None
+        if expected != actual:
+            first_divergence = {'index': index, 'original': expected, 'replay': actual}
+            break
+    missing = collections.Counter(original_order) - collections.Counter(replay_order)
+    extra = collections.Counter(replay_order) - collections.Counter(original_order)
+
+    def summary(latencies, statuses):
+        return {
+            'latency_p50_ms': _percentile(latencies, 0.5),
+            'latency_p95_ms': _percentile(latencies, 0.95),
+            'latency_max_ms': _percentile(latencies, 1.0),
+            'statuses': dict(collections.Counter(statuses))
+        }
+
+    return {
+        'scans': len(original),
+        'original': summary([s['latency_ms'] for s in original.values() if s['latency_ms'] is not None],
+                            [s['status'] or 'missing' for s in original.values()]),
+        'replay': summary([r['latency_ms'] for r in replayed.values()],
+                          [replayed[seq]['status'] if seq in replayed else 'missing' for seq in original]),
+        'status_diffs': len(status_diffs),
+        'status_diff_samples': status_diffs[:limit],
+        'latency_diffs': len(latency_diffs),
+        'latency_diff_samples': latency_diffs[:limit],
+        'ordering': {
+            'original_count': len(original_order),
+            'replay_count': len(replay_order),
+            'identical': first_divergence is None,
+            'first_divergence': first_divergence,
+            'missing': sum(missing.values()),
+            'extra': sum(extra.values())
+        }
+    }
+
+
+def start_local_server():
+    """
+    在本进程内启动本地服务器，键盘输入使用recording后端
+
+    Returns:
+        tuple: (服务器, 地址, recording后端)
+    """
+    # 本地服务器不写扫码历史、不再录制
+    os.environ['SCAN_HISTORY_DB'] = ''
+    os.environ['TRAFFIC_CAPTURE_FILE'] = ''
+
+    from utils import keyboard_simulator
+    from utils.dual_server import BarcodeGunServer
+
+    sink = keyboard_simulator.set_backend('recording')
+    keyboard_simulator.set_profiles(None)
+
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        port = probe.getsockname()[1]
+
+    server = BarcodeGunServer(host='127.0.0.1', port=port)
+    ready = threading.Event()
+    server.on_ready = lambda _: ready.set()
+    threading.Thread(target=server.start, name='ReplayServer', daemon=True).start()
+    if not ready.wait(30):
+        raise RuntimeError('本地服务器启动失败')
+    return server, f"https://127.0.0.1:{port}", sink
+
+
+if __name__ == '__main__':
+    import argparse
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        stream=sys.stderr
+    )
+
+    parser = argparse.ArgumentParser(description='按录制的节奏重放扫码流量并与原始运行对比')
+    parser.add_argument('capture', help='录制文件（TRAFFIC_CAPTURE_FILE）')
+    parser.add_argument('--speed', type=float, default=1.0, help='重放速度倍数，0为最快')
+    parser.add_argument('--url', help='重放到已运行的服务器（默认在本进程内启动本地服务器）')
+    parser.add_argument('--latency-tolerance', type=float, default=50.0, help='延迟偏离容差（毫秒）')
+    parser.add_argument('-o', '--output', help='报告JSON文件（默认输出到标准输出）')
+    args = parser.parse_args()
+
+    events = load_capture(args.capture)
+    original, original_order = original_run(events)
+    for event in events:
+        if event['event'] == 'scan' and event.get('seq') in original:
+            event['confirm_barcode'] = original[event['seq']]['confirm_barcode']
+    logger.info(f"已读取 {len(events)} 个事件, {len(original)} 次扫码")
+
+    if args.url:
+        url, sink = args.url, None
+    else:
+        # 本地服务器的日志只保留警告，避免淹没重放进度
+        logging.getLogger('utils').setLevel(logging.WARNING)
+        logging.getLogger('werkzeug').setLevel(logging.WARNING)
+        _, url, sink = start_local_server()
+
+    start = time.perf_counter()
+    replayed = TrafficReplayer(url, args.speed, sink).replay(events)
+    elapsed = time.perf_counter() - start
+
+    if sink is not None:
+        replay_order = sink.typed_lines()
+    else:
+        replay_order = [r['barcode'] for r in sorted(replayed.values(), key=lambda r: r['received'])
+                        if r['status'] == 'success']
+
+    report = compare_runs(original, replayed, original_order, replay_order, args.latency_tolerance)
+    report['speed'] = args.speed
+    report['elapsed_s'] = round(elapsed, 2)
+    report['target'] = args.url or 'local'
+
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text)
+    else:
+        print(text)
+    logger.info(f"重放完成: {len(replayed)}/{len(original)} 次扫码有确认, 状态不一致 {report['status_diffs']}, "
+                f"延迟偏离 {report['latency_diffs']}, 输入顺序{'一致' if report['ordering']['identical'] else '不一致'}")
+    # 本地服务器线程不会自行退出
+    sys.stdout.flush()
+    os._exit(0)